@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+malgus_aws.py
+
+Process-wide, thread-safe boto3 session/client registry shared by the malgus scripts.
+A client is built once per (service, region, profile) (plus any Config overrides) and
+reused, so helpers that are called per region or per thread stop paying for client
+construction and a fresh TLS connection pool every time.
+
+Clients are thread-safe and the urllib3 pool is sized for the scripts' thread pools
+(DEFAULT_MAX_POOL). boto3 sessions are not thread-safe, so sessions and clients are
+only created under a lock. After a fork (ProcessPoolExecutor workers) the registry
+starts empty, because pooled connections must not be shared across processes.
+
+`profile` may also be an IAM role ARN: the role is assumed with the default
+credentials when its first request is signed (never while the registry lock is held),
+and the temporary credentials refresh themselves before they expire, so long
+multi-account scans do not fail halfway.
+
+Inside memoize_calls() (one orchestrated run), clients also share a CallMemo: identical
+inventory requests (the MEMO_OPERATIONS allow-list, with the same parameters, service,
+region and profile) are sent once, and a caller asking for a request that is already in
+flight waits for that response instead of sending its own. Paginators of those
+operations are memoized as a whole listing. Calls carrying a pagination token, event
+lookups and polling calls (lookup_events, get_query_results, ...) always go out, so the
+memo never holds raw event pages or a stale status.
+
+# Reason why Darth Malgus would be pleased with this script:
+# One armory, many troopers. Nobody forges a new blaster for every shot.
+#
+# Reason why this script is relevant to your career:
+# Client reuse and connection pooling are the cheapest latency wins in any AWS automation.
+#
+# How you would talk about this script at an interview:
+# “I centralized boto3 client creation into a thread-safe registry keyed by service, region and
+#  profile with tuned pool sizes, which removed repeated client setup and TLS handshakes.”
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import boto3
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, CredentialResolver, DeferredRefreshableCredentials
+
+# Connections kept per client; the scripts run up to ~32 threads against one client.
+DEFAULT_MAX_POOL = 32
+DEFAULT_RETRIES = {"max_attempts": 5, "mode": "adaptive"}
+ROLE_SESSION_NAME = "malgus-audit"
+
+_lock = threading.Lock()
+_sessions: Dict[Optional[str], boto3.Session] = {}
+_clients: Dict[Tuple[str, Optional[str], Optional[str], str], Any] = {}
+
+# Idempotent inventory operations the memo may share within one run (direct calls and
+# whole paginated listings). Everything else passes through unchanged.
+MEMO_OPERATIONS = frozenset({
+    # EC2 network inventory
+    "describe_regions", "describe_vpcs", "describe_subnets", "describe_route_tables",
+    "describe_flow_logs", "describe_vpc_peering_connections", "describe_transit_gateways",
+    "describe_transit_gateway_attachments", "describe_transit_gateway_peering_attachments",
+    "describe_transit_gateway_route_tables", "get_transit_gateway_route_table_associations",
+    "get_transit_gateway_route_table_propagations", "search_transit_gateway_routes",
+    "describe_snapshots",
+    # Databases
+    "describe_db_instances", "describe_db_snapshots", "describe_db_clusters",
+    "describe_db_cluster_snapshots", "describe_db_instance_automated_backups",
+    "describe_db_cluster_automated_backups", "list_tables", "describe_table", "list_global_tables",
+    # S3, CloudFront, WAF, Organizations
+    "list_buckets", "get_bucket_location", "list_distributions", "get_distribution_config",
+    "list_web_acls", "get_web_acl", "list_accounts",
+})
+# A request carrying one of these continues a listing; it is never memoized.
+PAGINATION_TOKENS = frozenset({"NextToken", "Marker", "ContinuationToken", "NextMarker",
+                               "PaginationToken", "ExclusiveStartTableName", "StartingToken"})
+
+
+class CallMemo:
+    """
+    Per-run memo of API responses. Responses are shared between callers and must be
+    treated as read-only. Failed calls are not memoized, so a later caller retries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Tuple, Future] = {}
+        self.stats = {"sent": 0, "deduplicated": 0}
+
+    def call(self, key: Tuple, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            owner = future is None
+            if owner:
+                future = self._calls[key] = Future()
+                self.stats["sent"] += 1
+            else:
+                self.stats["deduplicated"] += 1
+        if owner:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                with self._lock:
+                    del self._calls[key]
+                future.set_exception(e)
+        return future.result()
+
+
+def _memo_key(identity: Tuple, name: str, kwargs: Dict[str, Any]) -> Tuple:
+    return identity + (name, json.dumps(kwargs, sort_keys=True, default=str))
+
+
+class _MemoizedPaginator:
+    """Paginator whose complete listing (all pages) is shared through the memo."""
+
+    def __init__(self, paginator, memo: CallMemo, identity: Tuple, operation: str):
+        self._paginator = paginator
+        self._memo = memo
+        self._identity = identity
+        self._operation = operation
+
+    def __getattr__(self, name: str):
+        return getattr(self._paginator, name)
+
+    def paginate(self, **kwargs):
+        if PAGINATION_TOKENS.intersection(kwargs.get("PaginationConfig") or {}):
+            return self._paginator.paginate(**kwargs)
+        key = _memo_key(self._identity, "paginate:" + self._operation, kwargs)
+        return self._memo.call(key, lambda: list(self._paginator.paginate(**kwargs)))
+
+
+class _MemoizedClient:
+    """Client proxy sending MEMO_OPERATIONS through a CallMemo; everything else passes through."""
+
+    def __init__(self, client, memo: CallMemo, identity: Tuple):
+        self._client = client
+        self._memo = memo
+        self._identity = identity
+
+    def get_paginator(self, operation: str):
+        paginator = self._client.get_paginator(operation)
+        if operation not in MEMO_OPERATIONS:
+            return paginator
+        return _MemoizedPaginator(paginator, self._memo, self._identity, operation)
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name not in MEMO_OPERATIONS:
+            return attr
+
+        def call(**kwargs):
+            if PAGINATION_TOKENS.intersection(kwargs):
+                return attr(**kwargs)
+            return self._memo.call(_memo_key(self._identity, name, kwargs), lambda: attr(**kwargs))
+        return call
+
+
+_memo: Optional[CallMemo] = None
+
+
+def _reset_after_fork() -> None:
+    # Runs in the child only. The parent's lock (and the memo's) may have been held by a
+    # thread that does not exist here, so nothing is acquired: the registry is replaced.
+    global _lock, _sessions, _clients, _memo
+    _lock = threading.Lock()
+    _sessions = {}
+    _clients = {}
+    _memo = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def is_role_arn(profile: Optional[str]) -> bool:
+    return bool(profile) and profile.startswith("arn:") and ":role/" in profile
+
+
+class _AssumeRoleProvider(CredentialProvider):
+    """Credential provider for a role ARN: assume_role on first use and before expiry."""
+
+    METHOD = "sts-assume-role"
+
+    def __init__(self, sts, role_arn: str):
+        super().__init__()
+        self._sts = sts
+        self._role_arn = role_arn
+
+    def _refresh(self) -> Dict[str, str]:
+        creds = self._sts.assume_role(RoleArn=self._role_arn, RoleSessionName=ROLE_SESSION_NAME)["Credentials"]
+        return {
+            "access_key": creds["AccessKeyId"],
+            "secret_key": creds["SecretAccessKey"],
+            "token": creds["SessionToken"],
+            "expiry_time": creds["Expiration"].isoformat(),
+        }
+
+    def load(self) -> DeferredRefreshableCredentials:
+        return DeferredRefreshableCredentials(refresh_using=self._refresh, method=self.METHOD)
+
+
+def _assumed_role_session(sts, role_arn: str) -> boto3.Session:
+    core = botocore.session.get_session()
+    core.register_component("credential_provider", CredentialResolver([_AssumeRoleProvider(sts, role_arn)]))
+    return boto3.Session(botocore_session=core)
+
+
+def _session_locked(profile: Optional[str]) -> boto3.Session:
+    session = _sessions.get(profile)
+    if session is None:
+        if is_role_arn(profile):
+            sts = _session_locked(None).client("sts", config=Config(retries=DEFAULT_RETRIES))
+            session = _assumed_role_session(sts, profile)
+        elif profile:
+            session = boto3.Session(profile_name=profile)
+        else:
+            session = boto3.Session()
+        _sessions[profile] = session
+    return session
+
+
+def get_session(profile: Optional[str] = None) -> boto3.Session:
+    """The shared boto3 Session for `profile` (None = default credential chain, or a role ARN)."""
+    with _lock:
+        return _session_locked(profile)
+
+
+def get_client(service: str, region: Optional[str] = None, profile: Optional[str] = None, **config: Any):
+    """
+    Shared client for (service, region, profile). `config` holds botocore Config options
+    (max_pool_connections, retries, connect_timeout, read_timeout, ...); they default to
+    DEFAULT_MAX_POOL connections and adaptive retries, and different options give a
+    separate client. region=None uses the profile's default region. Inside
+    memoize_calls() the client is wrapped so read-only calls go through the run's memo.
+    """
+    options = {"max_pool_connections": DEFAULT_MAX_POOL, "retries": DEFAULT_RETRIES}
+    options.update(config)
+    key = (service, region, profile, json.dumps(options, sort_keys=True, default=str))
+    with _lock:
+        session = _session_locked(profile)
+        client = _clients.get(key)
+        if client is None:
+            kwargs = {"config": Config(**options)}
+            if region:
+                kwargs["region_name"] = region
+            client = _clients[key] = session.client(service, **kwargs)
+        memo = _memo
+    return _MemoizedClient(client, memo, (service, region, profile)) if memo is not None else client
+
+
+def enabled_regions(profile: Optional[str] = None) -> List[str]:
+    """Regions enabled for the account of `profile` (opt-in regions only when opted in)."""
+    ec2 = get_client("ec2", "us-east-1", profile)
+    regions = ec2.describe_regions(
+        Filters=[{"Name": "opt-in-status", "Values": ["opt-in-not-required", "opted-in"]}]
+    )
+    return sorted(r["RegionName"] for r in regions.get("Regions", []))
+
+
+def clear_clients() -> None:
+    """Drop every cached session and client (e.g. after credentials change)."""
+    with _lock:
+        _sessions.clear()
+        _clients.clear()
+
+
+@contextmanager
+def memoize_calls(memo: Optional[CallMemo] = None) -> Iterator[CallMemo]:
+    """Share one CallMemo between every client handed out inside the block (one run)."""
+    global _memo
+    previous = _memo
+    _memo = memo or CallMemo()
+    try:
+        yield _memo
+    finally:
+        _memo = previous
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+malgus_cf_analytics.py
+
+Per-time-bucket, per-edge and per-URI cache analytics for CloudFront standard logs:
+Hit/Miss/RefreshHit ratios plus p50/p95/p99 of time-taken and time-to-first-byte.
+Latency percentiles use QuantileSketch, so memory stays fixed no matter how many
+lines are read; every structure merges, so shards and cached partials combine.
+
+Heavy hitters (--top-misses): top client IPs, URIs and user agents on Misses
+(SpaceSaving) and distinct client IPs per minute (HyperLogLog), also fixed-memory.
+
+Filled in by malgus_cloudfront_log_explainer.py (--analytics); this module only holds
+the aggregates and the report.
+
+# Reason why Darth Malgus would be pleased with this script:
+# A global Hit% hides the rebellious minute, the failing edge, the uncacheable URI.
+#
+# Reason why this script is relevant to your career:
+# Cache tuning is done per path and per POP, and latency is judged by its tail, not its average.
+#
+# How you would talk about this script at an interview:
+# “I extended our CloudFront log analyzer with per-minute, per-edge and per-URI hit ratios and
+#  streaming p95/p99 latency, so we could tie cache misses to the exact paths and POPs causing them.”
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from malgus_sketches import HyperLogLog, QuantileSketch, SpaceSaving
+
+# Columns the analytics read (resolved through the '#Fields:' header like the outcome columns).
+ANALYTICS_FIELDS = (
+    "date", "time", "x-edge-location", "cs-uri-stem", "time-taken", "time-to-first-byte", "c-ip", "cs(User-Agent)",
+)
+
+DEFAULT_MAX_URIS = 1000
+# Requests for URIs outside the busiest max_uris are grouped here so memory stays bounded.
+OTHER_URIS = "(other URIs)"
+
+QUANTILES = (0.50, 0.95, 0.99)
+
+# Heavy-hitter counters per field; reports show the first --top of them.
+DEFAULT_TOP_K = 100
+DEFAULT_HLL_PRECISION = 11
+
+
+class AnalyticsConfig:
+    """
+    What --analytics / --top-misses collect. `breakdown` enables the per-bucket/edge/URI
+    tables, `top_k` > 0 the heavy-hitter and distinct-IP sketches.
+    Picklable, so it travels to worker processes as-is.
+    """
+
+    def __init__(
+        self,
+        bucket_minutes: int = 1,
+        max_uris: int = DEFAULT_MAX_URIS,
+        accuracy: float = 0.01,
+        breakdown: bool = True,
+        top_k: int = 0,
+        hll_precision: int = DEFAULT_HLL_PRECISION,
+    ):
+        if not 1 <= bucket_minutes <= 60 or 60 % bucket_minutes:
+            raise ValueError("bucket_minutes must divide 60 (1, 2, 5, 10, 15, 30, 60)")
+        if max_uris < 1:
+            raise ValueError("max_uris must be >= 1")
+        if top_k < 0:
+            raise ValueError("top_k must be >= 0")
+        self.bucket_minutes = bucket_minutes
+        self.max_uris = max_uris
+        self.accuracy = accuracy
+        self.breakdown = breakdown
+        self.top_k = top_k
+        self.hll_precision = hll_precision
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "bucket_minutes": self.bucket_minutes, "max_uris": self.max_uris, "accuracy": self.accuracy,
+            "breakdown": self.breakdown, "top_k": self.top_k, "hll_precision": self.hll_precision,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AnalyticsConfig":
+        return cls(data["bucket_minutes"], data["max_uris"], data["accuracy"],
+                   data.get("breakdown", True), data.get("top_k", 0), data.get("hll_precision", DEFAULT_HLL_PRECISION))
+
+
+class GroupStats:
+    """Outcome counts and latency sketches for one bucket / edge / URI."""
+
+    __slots__ = ("hit", "miss", "refresh", "other", "time_taken", "ttfb")
+
+    def __init__(self, accuracy: float):
+        self.hit = self.miss = self.refresh = self.other = 0
+        self.time_taken = QuantileSketch(accuracy)
+        self.ttfb = QuantileSketch(accuracy)
+
+    @property
+    def requests(self) -> int:
+        return self.hit + self.miss + self.refresh + self.other
+
+    def count_outcome(self, outcome: str) -> None:
+        if outcome == "Hit":
+            self.hit += 1
+        elif outcome == "Miss":
+            self.miss += 1
+        elif outcome == "RefreshHit":
+            self.refresh += 1
+        else:
+            self.other += 1
+
+    def merge(self, other: "GroupStats") -> "GroupStats":
+        self.hit += other.hit
+        self.miss += other.miss
+        self.refresh += other.refresh
+        self.other += other.other
+        self.time_taken.merge(other.time_taken)
+        self.ttfb.merge(other.ttfb)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "hit": self.hit, "miss": self.miss, "refresh": self.refresh, "other": self.other,
+            "time_taken": self.time_taken.to_dict(), "ttfb": self.ttfb.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GroupStats":
+        g = cls(data["time_taken"]["accuracy"])
+        g.hit, g.miss, g.refresh, g.other = data["hit"], data["miss"], data["refresh"], data["other"]
+        g.time_taken = QuantileSketch.from_dict(data["time_taken"])
+        g.ttfb = QuantileSketch.from_dict(data["ttfb"])
+        return g
+
+
+class HeavyHitters:
+    """Top client IPs / URIs / user agents on Misses, and distinct client IPs per minute and overall."""
+
+    FIELDS = ("c-ip", "cs-uri-stem", "cs(User-Agent)")
+
+    def __init__(self, k: int, precision: int):
+        self.precision = precision
+        self.misses = {name: SpaceSaving(k) for name in self.FIELDS}
+        self.ips_by_minute: Dict[str, HyperLogLog] = {}
+        self.ips = HyperLogLog(precision)
+        # Client IPs repeat constantly; hash each distinct one once (bounded like the scanner's decode cache).
+        self._hashes: Dict[str, int] = {}
+
+    def add(self, minute: str, ip: str, uri: str, agent: str, miss: bool) -> None:
+        h = self._hashes.get(ip)
+        if h is None:
+            if len(self._hashes) > 100_000:
+                self._hashes.clear()
+            h = self._hashes[ip] = HyperLogLog.hash(ip)
+        hll = self.ips_by_minute.get(minute)
+        if hll is None:
+            hll = self.ips_by_minute[minute] = HyperLogLog(self.precision)
+        hll.add_hash(h)
+        self.ips.add_hash(h)
+        if miss:
+            self.misses["c-ip"].add(ip)
+            self.misses["cs-uri-stem"].add(uri)
+            self.misses["cs(User-Agent)"].add(agent)
+
+    def merge(self, other: "HeavyHitters") -> "HeavyHitters":
+        for name, sketch in other.misses.items():
+            self.misses[name].merge(sketch)
+        for minute, hll in other.ips_by_minute.items():
+            mine = self.ips_by_minute.get(minute)
+            if mine is None:
+                mine = self.ips_by_minute[minute] = HyperLogLog(self.precision)
+            mine.merge(hll)
+        self.ips.merge(other.ips)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "misses": {name: sketch.to_dict() for name, sketch in self.misses.items()},
+            "ips_by_minute": {minute: hll.to_dict() for minute, hll in self.ips_by_minute.items()},
+            "ips": self.ips.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HeavyHitters":
+        ips = HyperLogLog.from_dict(data["ips"])
+        hh = cls(0, ips.precision)
+        hh.misses = {name: SpaceSaving.from_dict(d) for name, d in data["misses"].items()}
+        hh.ips_by_minute = {minute: HyperLogLog.from_dict(d) for minute, d in data["ips_by_minute"].items()}
+        hh.ips = ips
+        return hh
+
+
+class CacheAnalytics:
+    """
+    GroupStats keyed by time bucket ("YYYY-MM-DD HH:MM", UTC), x-edge-location and
+    cs-uri-stem (when config.breakdown), plus HeavyHitters (when config.top_k).
+
+    The URI table holds the busiest config.max_uris URIs, chosen by a SpaceSaving
+    sketch of requests per URI (in add and merge alike); a URI that drops out of the
+    sketch has its stats folded into OTHER_URIS.
+    """
+
+    def __init__(self, config: AnalyticsConfig):
+        self.config = config
+        self.by_bucket: Dict[str, GroupStats] = {}
+        self.by_edge: Dict[str, GroupStats] = {}
+        self.by_uri: Dict[str, GroupStats] = {}
+        self.uri_top = SpaceSaving(config.max_uris)
+        self.heavy: Optional[HeavyHitters] = HeavyHitters(config.top_k, config.hll_precision) if config.top_k else None
+        # One sketch computes bin indices for all groups (they share accuracy).
+        self._indexer = QuantileSketch(config.accuracy)
+
+    def bucket_key(self, date: str, time: str) -> str:
+        """Floor 'HH:MM:SS' to the configured bucket width."""
+        width = self.config.bucket_minutes
+        if width == 1:
+            return f"{date} {time[:5]}"
+        try:
+            minute = int(time[3:5]) // width * width
+        except ValueError:
+            return f"{date} {time[:5]}"
+        return f"{date} {time[:3]}{minute:02d}"
+
+    def _group(self, table: Dict[str, GroupStats], key: str) -> GroupStats:
+        g = table.get(key)
+        if g is None:
+            g = table[key] = GroupStats(self.config.accuracy)
+        return g
+
+    def _fold_uri(self, uri: Optional[str]) -> None:
+        """Move an evicted URI's stats into OTHER_URIS."""
+        g = self.by_uri.pop(uri, None) if uri is not None else None
+        if g is not None:
+            self._group(self.by_uri, OTHER_URIS).merge(g)
+
+    def add(
+        self,
+        date: str,
+        time: str,
+        edge: str,
+        uri: str,
+        outcome: str,
+        time_taken: Optional[float],
+        ttfb: Optional[float],
+        client_ip: str = "-",
+        user_agent: str = "-",
+    ) -> None:
+        if self.heavy is not None:
+            self.heavy.add(f"{date} {time[:5]}", client_ip or "-", uri or "-", user_agent or "-", outcome == "Miss")
+        if not self.config.breakdown:
+            return
+        tt_i = self._indexer.index(time_taken) if time_taken is not None else False
+        fb_i = self._indexer.index(ttfb) if ttfb is not None else False
+        uri = uri or "-"
+        self._fold_uri(self.uri_top.add(uri))
+        for g in (
+            self._group(self.by_bucket, self.bucket_key(date, time)),
+            self._group(self.by_edge, edge or "-"),
+            self._group(self.by_uri, uri),
+        ):
+            g.count_outcome(outcome)
+            if tt_i is not False:
+                g.time_taken.add_index(tt_i)
+            if fb_i is not False:
+                g.ttfb.add_index(fb_i)
+
+    def merge(self, other: "CacheAnalytics") -> "CacheAnalytics":
+        for mine, theirs in ((self.by_bucket, other.by_bucket), (self.by_edge, other.by_edge)):
+            for key, g in theirs.items():
+                self._group(mine, key).merge(g)
+        for uri, g in other.by_uri.items():
+            self._group(self.by_uri, uri).merge(g)
+        self.uri_top.merge(other.uri_top)
+        for uri in [u for u in self.by_uri if u != OTHER_URIS and u not in self.uri_top.counts]:
+            self._fold_uri(uri)
+        if other.heavy is not None:
+            if self.heavy is None:
+                self.heavy = HeavyHitters(other.config.top_k, other.config.hll_precision)
+            self.heavy.merge(other.heavy)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "config": self.config.to_dict(),
+            "by_bucket": {k: g.to_dict() for k, g in self.by_bucket.items()},
+            "by_edge": {k: g.to_dict() for k, g in self.by_edge.items()},
+            "by_uri": {k: g.to_dict() for k, g in self.by_uri.items()},
+            "uri_top": self.uri_top.to_dict(),
+        }
+        if self.heavy is not None:
+            data["heavy"] = self.heavy.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "CacheAnalytics":
+        a = cls(AnalyticsConfig.from_dict(data["config"]))
+        for name in ("by_bucket", "by_edge", "by_uri"):
+            setattr(a, name, {k: GroupStats.from_dict(g) for k, g in data[name].items()})
+        a.uri_top = SpaceSaving.from_dict(data["uri_top"])
+        if "heavy" in data:
+            a.heavy = HeavyHitters.from_dict(data["heavy"])
+        return a
+
+
+def _ms(sketch: QuantileSketch) -> str:
+    vals = [sketch.quantile(q) for q in QUANTILES]
+    if vals[0] is None:
+        return f"{'-':>17s}"
+    return "/".join(f"{v * 1000:.0f}" for v in vals).rjust(17)
+
+
+def _rows(table: Dict[str, GroupStats], order: str, top: int) -> List[Tuple[str, GroupStats]]:
+    if order == "key":
+        items = sorted(table.items())
+        return items[-top:] if top > 0 else items
+    items = sorted(table.items(), key=lambda kv: (-kv[1].requests, kv[0]))
+    return items[:top] if top > 0 else items
+
+
+def _print_table(title: str, label: str, rows: List[Tuple[str, GroupStats]], width: int) -> None:
+    print(f"\n{title}")
+    print(f"  {label:{width}s} {'reqs':>8s} {'Hit%':>6s} {'Miss%':>6s} {'Refr%':>6s} "
+          f"{'time-taken ms':>17s} {'ttfb ms':>17s}")
+    print(f"  {'':{width}s} {'':>8s} {'':>6s} {'':>6s} {'':>6s} {'p50/p95/p99':>17s} {'p50/p95/p99':>17s}")
+    for key, g in rows:
+        core = g.hit + g.miss + g.refresh
+
+        def pct(n: int) -> str:
+            return f"{'-':>6s}" if core == 0 else f"{n * 100.0 / core:6.1f}"
+
+        print(f"  {key[:width]:{width}s} {g.requests:8d} {pct(g.hit)} {pct(g.miss)} {pct(g.refresh)} "
+              f"{_ms(g.time_taken)} {_ms(g.ttfb)}")
+
+
+def print_analytics(analytics: CacheAnalytics, top: int = 20) -> None:
+    """Per-bucket (latest `top`), per-edge and per-URI (busiest `top`) tables; top=0 prints all."""
+    width = analytics.config.bucket_minutes
+    print("\n=== CloudFront Cache Analytics (Standard Logs) ===")
+    print("Hit/Miss/RefreshHit % are of core outcomes; latency percentiles are approximate "
+          f"(±{analytics.config.accuracy * 100:.0f}% relative).")
+    _print_table(f"Per {width}-minute bucket (UTC, latest {top or 'all'}):", "bucket",
+                 _rows(analytics.by_bucket, "key", top), 16)
+    _print_table(f"Per edge location (busiest {top or 'all'}):", "x-edge-location",
+                 _rows(analytics.by_edge, "requests", top), 16)
+    _print_table(f"Per URI (busiest {top or 'all'}, tracking up to {analytics.config.max_uris}):", "cs-uri-stem",
+                 _rows(analytics.by_uri, "requests", top), 40)
+    print("==================================================\n")
+
+
+def print_heavy_hitters(heavy: HeavyHitters, top: int = 20) -> None:
+    """Top talkers on Misses (count is an upper bound, ± the Space-Saving error) and distinct IPs per minute."""
+    print("\n=== CloudFront Miss Heavy Hitters & Distinct Clients (Standard Logs) ===")
+    labels = {"c-ip": "Client IPs", "cs-uri-stem": "URIs", "cs(User-Agent)": "User agents"}
+    for name, sketch in heavy.misses.items():
+        rows = sketch.top(top or sketch.k)
+        print(f"\nTop {labels[name]} on Misses (tracking {sketch.k}):")
+        if not rows:
+            print("  (no Misses)")
+        for item, count, error in rows:
+            bound = f"±{error}" if error else ""
+            print(f"  {item[:60]:60s} {count:8d} {bound}")
+
+    minutes = sorted(heavy.ips_by_minute.items())
+    print(f"\nDistinct client IPs: ~{heavy.ips.estimate()} overall "
+          f"(HyperLogLog, ~{104 / 2 ** (heavy.precision / 2):.1f}% std error)")
+    if minutes:
+        peak_minute, peak = max(((m, h.estimate()) for m, h in minutes), key=lambda mh: (mh[1], mh[0]))
+        print(f"Peak minute: {peak_minute} with ~{peak} distinct IPs")
+        shown = minutes[-top:] if top > 0 else minutes
+        print(f"Per minute (UTC, latest {top or 'all'}):")
+        for minute, hll in shown:
+            print(f"  {minute:16s} {hll.estimate():8d}")
+    print("========================================================================\n")
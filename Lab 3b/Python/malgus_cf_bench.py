@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+"""
+malgus_cf_bench.py
+
+Throughput benchmarks for malgus_cloudfront_log_explainer.py against synthetic logs
+(malgus_cf_loggen.py) and a local S3 stand-in, so no AWS account is needed.
+
+Benchmarks:
+  count_fast / count_legacy   count_standard_log_files() per engine, local .gz files
+  analytics                   tally_standard_log_files() with --analytics aggregates
+  sharded                     tally_sharded() over local files with --workers processes
+  s3_stream                   tally_s3_objects() streaming from the stand-in with --threads
+  list_full_pick              full ListObjectsV2 listing + pick_latest() (the pre-time-range path)
+  list_latest                 list_distribution_prefixes() + select_latest() (key-hour pruning)
+
+Each benchmark runs in a fresh interpreter so peak RSS (getrusage ru_maxrss, including
+worker processes) belongs to that benchmark alone. Reported: wall seconds (best of
+--repeat), lines/s, MB/s (uncompressed), peak RSS and, for the listing benchmarks,
+the number of ListObjectsV2 requests. Results are appended to a JSONL file and compared with the last
+run on the same dataset, so a slowdown between versions shows up as REGRESSION.
+
+# Reason why Darth Malgus would be pleased with this script:
+# “Faster” without a number is a rumour. The Empire measures, then it boasts.
+#
+# Reason why this script is relevant to your career:
+# Benchmarks with stored baselines are how performance regressions are caught before release.
+#
+# How you would talk about this script at an interview:
+# “I added a reproducible benchmark suite with a fake S3 and a results history, so every parser
+#  or listing change came with lines/s, MB/s and peak-RSS numbers compared against the previous version.”
+"""
+
+import argparse
+import bisect
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import malgus_cloudfront_log_explainer as cf
+from malgus_cf_analytics import AnalyticsConfig
+from malgus_cf_loggen import generate, parse_size
+
+BENCHMARKS = ("count_fast", "count_legacy", "analytics", "sharded", "s3_stream", "list_full_pick", "list_latest")
+DEFAULT_BENCHMARKS = ("count_fast", "count_legacy", "sharded", "s3_stream", "list_full_pick", "list_latest")
+DATASET_FILE = "dataset.json"
+BUCKET = "bench-logs"
+PREFIX = "cloudfront-logs/"
+PAGE_SIZE = 1000
+
+
+class _Body:
+    """The slice of botocore's StreamingBody that open_s3_log() uses."""
+
+    def __init__(self, path: str):
+        self._f = open(path, "rb")
+
+    def read(self, n: int = -1) -> bytes:
+        return self._f.read(n)
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _Paginator:
+    def __init__(self, s3: "LocalS3"):
+        self._s3 = s3
+
+    def paginate(self, Bucket: str, Prefix: str = "", StartAfter: str = "", Delimiter: str = ""):
+        return self._s3._list_pages(Bucket, Prefix, StartAfter, Delimiter)
+
+
+class LocalS3:
+    """
+    Read-only S3 stand-in over a directory: <root>/<bucket>/<key>. Implements the calls
+    the explainer makes (get_paginator("list_objects_v2") with Prefix/StartAfter/
+    Delimiter, get_object, download_file) with 1000-key pages like the real API, and
+    counts requests. `extra_keys` adds empty objects that exist only in listings, so
+    listing strategies can be measured at millions of keys without writing them.
+    Holds only plain data, so it pickles into worker processes.
+    """
+
+    def __init__(self, root: str, extra_keys: Optional[Dict[str, List[str]]] = None):
+        self.root = root
+        self.requests = {"ListObjectsV2": 0, "GetObject": 0}
+        self._keys: Dict[str, List[str]] = {}
+        self._sizes: Dict[str, Dict[str, int]] = {}
+        for bucket in os.listdir(root):
+            base = os.path.join(root, bucket)
+            if not os.path.isdir(base):
+                continue
+            sizes = {}
+            for dirpath, _, files in os.walk(base):
+                for name in files:
+                    path = os.path.join(dirpath, name)
+                    sizes[os.path.relpath(path, base).replace(os.sep, "/")] = os.path.getsize(path)
+            for key in (extra_keys or {}).get(bucket, []):
+                sizes.setdefault(key, 0)
+            self._sizes[bucket] = sizes
+            self._keys[bucket] = sorted(sizes)
+
+    def get_paginator(self, name: str) -> _Paginator:
+        if name != "list_objects_v2":
+            raise NotImplementedError(name)
+        return _Paginator(self)
+
+    def _list_pages(self, bucket: str, prefix: str, start_after: str, delimiter: str):
+        keys = self._keys.get(bucket, [])
+        i = bisect.bisect_right(keys, start_after) if start_after else bisect.bisect_left(keys, prefix)
+        i = max(i, bisect.bisect_left(keys, prefix))
+        while True:
+            self.requests["ListObjectsV2"] += 1
+            contents, prefixes = [], []
+            while i < len(keys) and len(contents) + len(prefixes) < PAGE_SIZE:
+                key = keys[i]
+                if not key.startswith(prefix):
+                    i = len(keys)
+                    break
+                cut = key.find(delimiter, len(prefix)) if delimiter else -1
+                if cut >= 0:
+                    common = key[:cut + len(delimiter)]
+                    prefixes.append({"Prefix": common})
+                    # skip everything rolled into this CommonPrefix
+                    i = bisect.bisect_left(keys, common[:-1] + chr(ord(common[-1]) + 1), i)
+                    continue
+                size = self._sizes[bucket][key]
+                contents.append({"Key": key, "Size": size, "ETag": f'"{size:x}-{len(key):x}"'})
+                i += 1
+            page: Dict[str, Any] = {"Contents": contents}
+            if prefixes:
+                page["CommonPrefixes"] = prefixes
+            yield page
+            if i >= len(keys) or not keys[i].startswith(prefix):
+                return
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def get_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        self.requests["GetObject"] += 1
+        return {"Body": _Body(self._path(Bucket, Key))}
+
+    def download_file(self, bucket: str, key: str, dest: str) -> None:
+        self.requests["GetObject"] += 1
+        with open(self._path(bucket, key), "rb") as src, open(dest, "wb") as out:
+            while True:
+                chunk = src.read(1 << 20)
+                if not chunk:
+                    break
+                out.write(chunk)
+
+
+# ---------------------------------------------------------------------------
+# Dataset
+# ---------------------------------------------------------------------------
+
+def log_dir(data_dir: str) -> str:
+    return os.path.join(data_dir, BUCKET, PREFIX.rstrip("/"))
+
+def load_dataset(data_dir: str) -> Dict[str, Any]:
+    """dataset.json: what was generated (files, lines, uncompressed bytes, parameters)."""
+    path = os.path.join(data_dir, DATASET_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    # Logs dropped in by hand: measure them once (outside any timing).
+    files = sorted(os.listdir(log_dir(data_dir)))
+    paths = [os.path.join(log_dir(data_dir), name) for name in files]
+    lines = sum(cf.count_standard_log_files(paths).values())
+    raw = 0
+    for path in paths:
+        with cf.open_binary_maybe_gzip(path) as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                raw += len(block)
+    dataset = {"files": len(files), "lines": lines, "bytes": raw, "params": {"source": "external"}}
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(dataset, f, indent=2)
+    return dataset
+
+def make_dataset(data_dir: str, size: int, hours: int, seed: int) -> Dict[str, Any]:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    stats = generate(os.path.join(data_dir, BUCKET), size, hours, start, PREFIX, seed=seed)
+    dataset = dict(stats, params={"size": size, "hours": hours, "seed": seed, "start": start.isoformat()})
+    with open(os.path.join(data_dir, DATASET_FILE), "w", encoding="utf-8") as f:
+        json.dump(dataset, f, indent=2)
+    return dataset
+
+def dataset_signature(dataset: Dict[str, Any]) -> str:
+    return f"{dataset['files']}f/{dataset['lines']}l/{dataset['bytes']}b"
+
+def synthetic_keys(n: int, distributions: int = 8, per_hour: int = 4) -> List[str]:
+    """n listing-only keys spread over `distributions` and consecutive hours ending 2025-01-01."""
+    keys = []
+    end = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    hours = max(1, n // (distributions * per_hour))
+    for d in range(distributions):
+        for h in range(hours):
+            hour = end - timedelta(hours=hours - h)
+            for p in range(per_hour):
+                keys.append(f"{PREFIX}E{d:03d}FILLER.{hour:%Y-%m-%d-%H}.{p:08x}.gz")
+    return keys[:n]
+
+
+# ---------------------------------------------------------------------------
+# One benchmark (runs in its own interpreter)
+# ---------------------------------------------------------------------------
+
+def run_one(name: str, data_dir: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """Time one benchmark; returns the measured fields (no dataset or version info)."""
+    paths = [os.path.join(log_dir(data_dir), n) for n in sorted(os.listdir(log_dir(data_dir)))]
+    extra = {BUCKET: synthetic_keys(args.list_keys)} if name.startswith("list_") and args.list_keys else None
+    s3 = LocalS3(data_dir, extra) if name in ("s3_stream", "list_full_pick", "list_latest") else None
+    keys = [PREFIX + os.path.basename(p) for p in paths]
+    result: Dict[str, Any] = {}
+
+    t0 = time.perf_counter()
+    if name in ("count_fast", "count_legacy"):
+        counts = cf.count_standard_log_files(paths, engine=name.split("_")[1])
+    elif name == "analytics":
+        counts = cf.tally_standard_log_files(paths, analytics=AnalyticsConfig()).to_counts()
+    elif name == "sharded":
+        counts = cf.tally_sharded(None, paths, args.workers, deterministic=True).to_counts()
+    elif name == "s3_stream":
+        counts = cf.tally_s3_objects(s3, BUCKET, keys, args.threads).to_counts()
+    elif name == "list_full_pick":
+        listed = cf.list_log_objects(s3, BUCKET, PREFIX)
+        picked = cf.pick_latest([o["key"] for o in listed], args.latest)
+        counts = None
+        result.update(objects=len(listed), picked=len(picked))
+    elif name == "list_latest":
+        dists = cf.list_distribution_prefixes(s3, BUCKET, PREFIX)
+        now = max(cf.log_key_hour(k) for k in keys) + timedelta(hours=1)
+        picked = cf.select_latest(s3, BUCKET, dists, args.latest, now, args.threads)
+        counts = None
+        result.update(objects=len(s3._keys[BUCKET]), picked=len(picked))
+    else:
+        raise ValueError(f"unknown benchmark {name!r}")
+    result["wall_s"] = time.perf_counter() - t0
+
+    if counts is not None:
+        result["lines"] = sum(counts.values())
+    if s3 is not None:
+        result["requests"] = dict(s3.requests)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    result["peak_rss_mb"] = round(peak * scale / 1024 ** 2, 1)
+    return result
+
+def run_isolated(name: str, data_dir: str, args: argparse.Namespace) -> Dict[str, Any]:
+    cmd = [sys.executable, os.path.abspath(__file__), "--data", data_dir, "--run-one", name,
+           "--workers", str(args.workers), "--threads", str(args.threads),
+           "--latest", str(args.latest), "--list-keys", str(args.list_keys)]
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+# ---------------------------------------------------------------------------
+# Results history
+# ---------------------------------------------------------------------------
+
+def code_version() -> str:
+    """Short git commit of this checkout (+dirty), or "unknown" outside a git repo."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here, check=True,
+                             capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--", "."], cwd=here, check=True,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("+dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def load_history(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def previous_result(history: List[Dict[str, Any]], record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Latest earlier record of the same benchmark on the same dataset and settings."""
+    same = ("bench", "dataset", "workers", "threads", "list_keys")
+    for old in reversed(history):
+        if all(old.get(k) == record.get(k) for k in same):
+            return old
+    return None
+
+def print_results(records: List[Dict[str, Any]], history: List[Dict[str, Any]], threshold: float) -> int:
+    """Table with the change vs the previous run; returns the number of regressions."""
+    regressions = 0
+    print(f"\n{'benchmark':16s} {'wall s':>9s} {'lines/s':>12s} {'MB/s':>8s} {'LIST reqs':>10s} "
+          f"{'peak RSS MB':>12s}  vs previous")
+    for r in records:
+        prev = previous_result(history, r)
+        delta = ""
+        if prev:
+            change = (r["wall_s"] - prev["wall_s"]) / prev["wall_s"] if prev["wall_s"] else 0.0
+            delta = f"{change * 100:+.1f}% wall ({prev['version']})"
+            if change > threshold:
+                delta += "  REGRESSION"
+                regressions += 1
+        lines = f"{r['lines_per_s']:12,d}" if "lines_per_s" in r else f"{'-':>12s}"
+        mb = f"{r['mb_per_s']:8.1f}" if "mb_per_s" in r else f"{'-':>8s}"
+        lists = r.get("requests", {}).get("ListObjectsV2", 0)
+        print(f"{r['bench']:16s} {r['wall_s']:9.3f} {lines} {mb} {lists or '-':>10} {r['peak_rss_mb']:12.1f}  {delta}")
+    return regressions
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark the CloudFront log explainer on synthetic logs.")
+    ap.add_argument("--data", required=True, help="Benchmark data directory (created with --generate)")
+    ap.add_argument("--generate", type=parse_size, default=None,
+                    help="(Re)generate the dataset with this uncompressed size first, e.g. 200MB or 20GB")
+    ap.add_argument("--hours", type=int, default=24, help="Hourly log objects when generating (default: 24)")
+    ap.add_argument("--seed", type=int, default=1, help="Generator seed (default: 1)")
+    ap.add_argument("--bench", action="append", choices=BENCHMARKS, default=None,
+                    help=f"Benchmark to run (repeatable; default: {', '.join(DEFAULT_BENCHMARKS)})")
+    ap.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; best wall time is kept (default: 3)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Processes for 'sharded' (default: CPUs)")
+    ap.add_argument("--threads", type=int, default=cf.DEFAULT_FETCH_THREADS,
+                    help=f"Fetch/list threads for the S3 benchmarks (default: {cf.DEFAULT_FETCH_THREADS})")
+    ap.add_argument("--latest", type=int, default=3, help="N for the selection benchmarks (default: 3)")
+    ap.add_argument("--list-keys", type=int, default=0,
+                    help="Extra listing-only keys in the S3 stand-in, e.g. 1000000 (default: 0)")
+    ap.add_argument("--results", default="bench_results.jsonl", help="Results history (default: bench_results.jsonl)")
+    ap.add_argument("--label", default=None, help="Version label stored with the results (default: git commit)")
+    ap.add_argument("--threshold", type=float, default=0.10,
+                    help="Wall-time increase vs previous run flagged as regression (default: 0.10)")
+    ap.add_argument("--fail-on-regression", action="store_true", help="Exit 1 if any benchmark regressed")
+    ap.add_argument("--run-one", choices=BENCHMARKS, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, args.data, args)))
+        return 0
+
+    if args.generate is not None:
+        print(f"Generating {args.generate / 1024 ** 2:,.0f} MB of logs into {args.data} ...")
+        make_dataset(args.data, args.generate, args.hours, args.seed)
+    if not os.path.isdir(log_dir(args.data)):
+        ap.error(f"no logs under {log_dir(args.data)}; run with --generate SIZE first")
+    dataset = load_dataset(args.data)
+    version = args.label or code_version()
+    print(f"Dataset: {dataset['files']} objects, {dataset['lines']:,} lines, "
+          f"{dataset['bytes'] / 1024 ** 2:,.1f} MB uncompressed | version {version}")
+
+    records = []
+    for name in args.bench or DEFAULT_BENCHMARKS:
+        runs = [run_isolated(name, args.data, args) for _ in range(max(1, args.repeat))]
+        best = min(runs, key=lambda r: r["wall_s"])
+        record = dict(
+            best,
+            bench=name,
+            version=version,
+            ts=datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            dataset=dataset_signature(dataset),
+            python=platform.python_version(),
+            workers=args.workers if name == "sharded" else None,
+            threads=args.threads if name in ("s3_stream", "list_latest") else None,
+            list_keys=args.list_keys if name.startswith("list_") else None,
+            peak_rss_mb=max(r["peak_rss_mb"] for r in runs),
+        )
+        wall = record["wall_s"] or 1e-9
+        if "lines" in record:
+            if record["lines"] != dataset["lines"]:
+                print(f"⚠️ {name}: counted {record['lines']} lines, dataset has {dataset['lines']}")
+            record["lines_per_s"] = round(record["lines"] / wall)
+            record["mb_per_s"] = round(dataset["bytes"] / 1024 ** 2 / wall, 2)
+        records.append(record)
+        print(f"✅ {name}: {record['wall_s']:.3f}s")
+
+    history = load_history(args.results)
+    regressions = print_results(records, history, args.threshold)
+    with open(args.results, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+    print(f"\nResults appended to {args.results}")
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+malgus_cf_columnar.py
+
+Columnar on-disk cache of parsed CloudFront standard logs. `ingest` parses logs once
+(local files or S3, using the explainer's listing/streaming) into typed column files;
+`report` and `group` then answer questions with scans over memory-mapped columns
+instead of downloading and re-parsing text.
+
+Store layout (one directory):
+  store.json                    segment list, ingested sources (with parse notes), byte order
+  dict_edge.json / dict_result.json / dict_uri.json
+                                global string dictionaries (code = list position)
+  seg-000001/<column>.bin       one typed array per column (native byte order)
+  seg-000001/meta.json          row count, min/max hour (used to skip segments)
+
+Columns: hour (u32, hours since epoch UTC), second (u16, second within the hour),
+edge/uri (u32 codes), result (u16 code), status (u16, 0 = missing),
+time_taken/ttfb (f32 seconds, NaN = missing), sc_bytes (u64).
+
+Lines that cannot be stored as a row (before any '#Fields:' header, unparsable date or
+time, values a column cannot hold) are skipped and counted per source as parse notes.
+
+# Reason why Darth Malgus would be pleased with this script:
+# The Empire does not re-read the same report twice. It files it, indexed, for instant recall.
+#
+# Reason why this script is relevant to your career:
+# Columnar storage + dictionary encoding is how every analytics engine (Parquet, ClickHouse) gets its speed.
+#
+# How you would talk about this script at an interview:
+# “I added an ingest step that turns CloudFront text logs into dictionary-encoded, memory-mapped
+#  columns, so follow-up questions during an incident take milliseconds instead of a re-download.”
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import sys
+import threading
+from array import array
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from typing import Any, Dict, IO, Iterable, List, Optional, Tuple
+
+from malgus_cloudfront_log_explainer import (
+    DEFAULT_FETCH_THREADS,
+    LogSource,
+    iter_raw_lines,
+    list_distribution_prefixes,
+    list_log_objects_between,
+    make_s3_client,
+    open_log_source,
+    open_s3_log,
+    parse_when,
+    print_report,
+    select_latest,
+    TARGETS,
+)
+
+STORE_VERSION = 1
+
+# column name -> array typecode ('I' u32, 'H' u16, 'f' f32, 'Q' u64)
+COLUMNS = {
+    "hour": "I",
+    "second": "H",
+    "edge": "I",
+    "result": "H",
+    "uri": "I",
+    "status": "H",
+    "time_taken": "f",
+    "ttfb": "f",
+    "sc_bytes": "Q",
+}
+DICTIONARY_COLUMNS = ("edge", "result", "uri")
+
+# Log fields read at ingest, resolved through the '#Fields:' header.
+INGEST_FIELDS = (
+    b"date", b"time", b"x-edge-location", b"cs-uri-stem", b"sc-status", b"sc-bytes",
+    b"x-edge-result-type", b"x-edge-response-result-type", b"time-taken", b"time-to-first-byte",
+)
+
+# group --by choices -> column
+GROUP_COLUMNS = {"edge": "edge", "uri": "uri", "hour": "hour", "status": "status", "result": "result"}
+
+# Largest value an unsigned column of each typecode holds; rows outside are skipped at ingest.
+_MAX = {"I": 2 ** 32 - 1, "H": 2 ** 16 - 1, "Q": 2 ** 64 - 1}
+
+_EPOCH = date(1970, 1, 1)
+
+
+class StringDictionary:
+    """
+    Append-only string <-> code mapping; codes are stable across ingests. Safe to share
+    between ingest threads: lookups are lock-free, only new values take the lock.
+    """
+
+    def __init__(self, values: Optional[List[str]] = None):
+        self.values: List[str] = list(values or [])
+        self._codes: Dict[bytes, int] = {v.encode("utf-8"): i for i, v in enumerate(self.values)}
+        self._lock = threading.Lock()
+
+    def code(self, raw: bytes) -> int:
+        c = self._codes.get(raw)
+        if c is None:
+            with self._lock:
+                c = self._codes.get(raw)
+                if c is None:
+                    self.values.append(raw.decode("utf-8", "replace"))
+                    c = self._codes[raw] = len(self.values) - 1
+        return c
+
+
+class ColumnBatch:
+    """Rows parsed from one log source, as typed arrays ready to append to a segment."""
+
+    def __init__(self):
+        self.columns = {name: array(tc) for name, tc in COLUMNS.items()}
+        # Skipped lines by reason, reported like the explainer's notes
+        self.notes = Counter()
+
+    def __len__(self) -> int:
+        return len(self.columns["hour"])
+
+
+class ColumnStore:
+    """A store directory: ingest appends a segment, scans memory-map the segments' columns."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.state = self._load_json("store.json", {
+            "version": STORE_VERSION, "byteorder": sys.byteorder, "segments": [], "sources": {},
+        })
+        if self.state.get("version") != STORE_VERSION:
+            raise RuntimeError(f"{path}: unsupported store version {self.state.get('version')}")
+        if self.state.get("byteorder") != sys.byteorder:
+            raise RuntimeError(f"{path}: written on a {self.state['byteorder']}-endian host; re-ingest here")
+        self.dicts = {name: StringDictionary(self._load_json(f"dict_{name}.json", [])) for name in DICTIONARY_COLUMNS}
+
+    def _load_json(self, name: str, default: Any) -> Any:
+        try:
+            with open(os.path.join(self.path, name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def _save_json(self, name: str, data: Any) -> None:
+        tmp = os.path.join(self.path, f"{name}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, os.path.join(self.path, name))
+
+    # ------------------------------------------------------------------ ingest
+
+    def parse(self, f: IO[bytes]) -> ColumnBatch:
+        """Parse one binary log stream into a ColumnBatch (strings are dictionary-encoded)."""
+        batch = ColumnBatch()
+        cols = batch.columns
+        notes = batch.notes
+        hour_a, second_a = cols["hour"].append, cols["second"].append
+        edge_a, result_a, uri_a = cols["edge"].append, cols["result"].append, cols["uri"].append
+        status_a, tt_a, fb_a, bytes_a = (cols["status"].append, cols["time_taken"].append,
+                                         cols["ttfb"].append, cols["sc_bytes"].append)
+        edge_code, result_code, uri_code = (self.dicts["edge"].code, self.dicts["result"].code,
+                                            self.dicts["uri"].code)
+        days: Dict[bytes, int] = {}
+        idx: Optional[Tuple[int, ...]] = None
+        maxsplit = 0
+        nan = math.nan
+
+        def number(raw: bytes, default, cast):
+            try:
+                return cast(raw)
+            except ValueError:
+                return default
+
+        for line in iter_raw_lines(f):
+            if line[:1] == b"#":
+                if line.startswith(b"#Fields:"):
+                    fields = line[8:].split()
+                    pos = {name: i for i, name in enumerate(fields)}
+                    idx = tuple(pos.get(name, -1) for name in INGEST_FIELDS) if fields else None
+                    maxsplit = max(idx) + 1 if idx else 0
+                continue
+            if idx is None:
+                # No usable header yet (the explainer reports these as parsing notes too).
+                if line.strip():
+                    notes["(missing_fields_header)"] += 1
+                continue
+
+            parts = line.rstrip(b"\r").split(b"\t", maxsplit)
+            n = len(parts)
+            d, t, edge, uri, status, size, rt, rrt, tt, fb = (parts[i] if 0 <= i < n else b"" for i in idx)
+
+            day = days.get(d)
+            if day is None:
+                try:
+                    day = (date.fromisoformat(d.decode("ascii")) - _EPOCH).days
+                except (ValueError, UnicodeDecodeError):
+                    day = None
+                days[d] = day
+            try:
+                hour, second = day * 24 + int(t[0:2]), int(t[3:5]) * 60 + int(t[6:8])
+            except (TypeError, ValueError):
+                notes["(bad_timestamp)"] += 1
+                continue
+            status_v, size_v = number(status, 0, int), number(size, 0, int)
+            if not (0 <= hour <= _MAX["I"] and 0 <= second <= _MAX["H"]
+                    and 0 <= status_v <= _MAX["H"] and 0 <= size_v <= _MAX["Q"]):
+                # Malformed line: a value its column cannot hold (negative, out of range)
+                notes["(out_of_range)"] += 1
+                continue
+            hour_a(hour)
+            second_a(second)
+            edge_a(edge_code(edge))
+            result_a(result_code(rt or rrt))
+            uri_a(uri_code(uri))
+            status_a(status_v)
+            tt_a(number(tt, nan, float))
+            fb_a(number(fb, nan, float))
+            bytes_a(size_v)
+
+        return batch
+
+    def parse_source(self, source: LogSource) -> ColumnBatch:
+        with open_log_source(source, binary=True) as f:
+            return self.parse(f)
+
+    def append(self, batches: Iterable[Tuple[str, str, ColumnBatch]]) -> Tuple[int, int]:
+        """
+        Write (source_id, version, batch) rows as one new segment, streaming each batch
+        to the column files as it arrives. Sources already ingested at the same
+        version are skipped. Returns (rows written, sources written).
+        """
+        name = f"seg-{len(self.state['segments']) + 1:06d}"
+        seg_dir = os.path.join(self.path, name)
+        os.makedirs(seg_dir, exist_ok=True)
+        files = {col: open(os.path.join(seg_dir, f"{col}.bin"), "wb") for col in COLUMNS}
+        rows, sources, lo, hi = 0, {}, None, None
+        try:
+            for source_id, version, batch in batches:
+                if self.state["sources"].get(source_id, {}).get("version") == version:
+                    continue
+                for col, arr in batch.columns.items():
+                    arr.tofile(files[col])
+                if len(batch):
+                    hours = batch.columns["hour"]
+                    lo = min(hours) if lo is None else min(lo, min(hours))
+                    hi = max(hours) if hi is None else max(hi, max(hours))
+                rows += len(batch)
+                sources[source_id] = {"version": version, "segment": name, "rows": len(batch)}
+                if batch.notes:
+                    sources[source_id]["notes"] = dict(batch.notes)
+        finally:
+            for f in files.values():
+                f.close()
+
+        if not sources:
+            for col in COLUMNS:
+                os.remove(os.path.join(seg_dir, f"{col}.bin"))
+            os.rmdir(seg_dir)
+            return 0, 0
+
+        with open(os.path.join(seg_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "min_hour": lo, "max_hour": hi}, f)
+        for col in DICTIONARY_COLUMNS:
+            self._save_json(f"dict_{col}.json", self.dicts[col].values)
+        self.state["segments"].append(name)
+        self.state["sources"].update(sources)
+        self._save_json("store.json", self.state)
+        return rows, len(sources)
+
+    # ------------------------------------------------------------------ scans
+
+    def segments(self, since_hour: Optional[int] = None, until_hour: Optional[int] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        """Segments that can hold rows in [since_hour, until_hour); the rest are never opened."""
+        out = []
+        for name in self.state["segments"]:
+            with open(os.path.join(self.path, name, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if not meta["rows"]:
+                continue
+            if since_hour is not None and meta["max_hour"] < since_hour:
+                continue
+            if until_hour is not None and meta["min_hour"] >= until_hour:
+                continue
+            out.append((name, meta))
+        return out
+
+    def column(self, segment: str, name: str) -> memoryview:
+        """Memory-mapped, typed, read-only view of one column of one segment."""
+        with open(os.path.join(self.path, segment, f"{name}.bin"), "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mm).cast(COLUMNS[name])
+
+    def scan(
+        self,
+        columns: Tuple[str, ...],
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterable[Tuple[memoryview, ...]]:
+        """
+        Yield per-segment tuples of column views for rows in [since, until). Segments whose
+        whole hours are inside the range are yielded whole; boundary segments are filtered
+        row-wise by timestamp (into arrays).
+        """
+        lo = since.timestamp() if since else None
+        hi = until.timestamp() if until else None
+        for name, meta in self.segments(_hour_of(since), _hour_of(until, ceil=True)):
+            views = tuple(self.column(name, c) for c in columns)
+            inside = ((lo is None or meta["min_hour"] * 3600 >= lo)
+                      and (hi is None or (meta["max_hour"] + 1) * 3600 <= hi))
+            if inside:
+                yield views
+                continue
+            hours, seconds = self.column(name, "hour"), self.column(name, "second")
+            keep = [i for i, (h, sec) in enumerate(zip(hours, seconds))
+                    if (lo is None or h * 3600 + sec >= lo) and (hi is None or h * 3600 + sec < hi)]
+            yield tuple(array(COLUMNS[c], (v[i] for i in keep)) for c, v in zip(columns, views))
+
+    def outcome_counts(self, since: Optional[datetime] = None, until: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Same counts dict as count_standard_log_files(), from a scan of the result column.
+        Parse notes have no usable time, so they are included only without since/until;
+        lines with an unparsable date/time or out-of-range values show up as notes here
+        instead of under their outcome.
+        """
+        codes = Counter()
+        for (result,) in self.scan(("result",), since, until):
+            codes.update(result)
+        names = self.dicts["result"].values
+        counts = Counter()
+        other = Counter()
+        for code, n in codes.items():
+            outcome = names[code]
+            if not outcome:
+                other["(missing_outcome)"] += n
+            elif outcome in TARGETS:
+                counts[outcome] += n
+            else:
+                other[outcome] += n
+        if since is None and until is None:
+            for source in self.state["sources"].values():
+                other.update(source.get("notes", {}))
+        for k, v in other.items():
+            counts[f"Other:{k}"] += v
+        return dict(counts)
+
+    def group_outcomes(
+        self,
+        by: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Dict[str, Counter]:
+        """{group label: Counter(outcome -> requests)} for a GROUP_COLUMNS column."""
+        col = GROUP_COLUMNS[by]
+        pairs = Counter()
+        for keys, result in self.scan((col, "result"), since, until):
+            pairs.update(zip(keys, result))
+        results = self.dicts["result"].values
+        out: Dict[str, Counter] = {}
+        for (key, code), n in pairs.items():
+            out.setdefault(self.label(col, key), Counter())[results[code] or "(missing)"] += n
+        return out
+
+    def label(self, col: str, value: int) -> str:
+        if col in DICTIONARY_COLUMNS:
+            return self.dicts[col].values[value] or "-"
+        if col == "hour":
+            return datetime.fromtimestamp(value * 3600, tz=timezone.utc).strftime("%Y-%m-%d %H:00")
+        return str(value)
+
+
+def _hour_of(when: Optional[datetime], ceil: bool = False) -> Optional[int]:
+    if when is None:
+        return None
+    hours = when.timestamp() / 3600
+    return math.ceil(hours) if ceil else math.floor(hours)
+
+
+def print_groups(groups: Dict[str, Counter], by: str, top: int) -> None:
+    order = sorted(groups.items(), key=lambda kv: (kv[0],) if by == "hour" else (-sum(kv[1].values()), kv[0]))
+    if top > 0:
+        order = order[-top:] if by == "hour" else order[:top]
+    width = 40 if by == "uri" else 16
+    print(f"\n=== CloudFront outcomes by {by} (columnar cache) ===")
+    print(f"  {by:{width}s} {'reqs':>9s} {'Hit%':>6s} {'Miss%':>6s} {'Refr%':>6s} {'Other':>8s}")
+    for key, c in order:
+        core = c["Hit"] + c["Miss"] + c["RefreshHit"]
+        other = sum(c.values()) - core
+
+        def pct(n: int) -> str:
+            return f"{'-':>6s}" if core == 0 else f"{n * 100.0 / core:6.1f}"
+
+        print(f"  {key[:width]:{width}s} {sum(c.values()):9d} {pct(c['Hit'])} {pct(c['Miss'])} "
+              f"{pct(c['RefreshHit'])} {other:8d}")
+    print()
+
+
+def ingest_s3(store: ColumnStore, args) -> Tuple[int, int]:
+    s3 = make_s3_client(args.fetch_threads)
+    now = datetime.now(timezone.utc)
+    since = parse_when(args.since, now) if args.since else None
+    until = parse_when(args.until, now) if args.until else None
+    dist_prefixes = ([f"{args.prefix}{d}." for d in args.distribution] if args.distribution
+                     else list_distribution_prefixes(s3, args.bucket, args.prefix))
+    if since or until:
+        objects = list_log_objects_between(s3, args.bucket, dist_prefixes, since, until, args.fetch_threads)
+    else:
+        objects = select_latest(s3, args.bucket, dist_prefixes, args.latest, now, args.fetch_threads)
+
+    sources = store.state["sources"]
+    todo = [o for o in objects if sources.get(f"s3://{args.bucket}/{o['key']}", {}).get("version") != o["etag"]]
+    print(f"{len(objects)} objects selected, {len(todo)} not yet in the store")
+
+    def parse_one(obj: Dict[str, Any]) -> Tuple[str, str, ColumnBatch]:
+        batch = store.parse_source(open_s3_log(s3, args.bucket, obj["key"]))
+        return f"s3://{args.bucket}/{obj['key']}", obj["etag"], batch
+
+    # Fetches overlap; batches are appended in key order as they complete.
+    with ThreadPoolExecutor(max_workers=max(1, args.fetch_threads)) as pool:
+        return store.append(pool.map(parse_one, todo))
+
+
+def ingest_files(store: ColumnStore, paths: List[str]) -> Tuple[int, int]:
+    def batches():
+        for path in paths:
+            st = os.stat(path)
+            yield os.path.abspath(path), f"{st.st_size}:{st.st_mtime_ns}", store.parse_source(path)
+    return store.append(batches())
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Columnar cache of CloudFront standard logs for fast re-querying.")
+    ap.add_argument("--store", default="malgus_cf_store", help="Store directory (default: malgus_cf_store)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    ing = sub.add_parser("ingest", help="Parse logs (local files or S3) into a new columnar segment")
+    ing.add_argument("--files", nargs="+", metavar="PATH", help="Local log files (.gz or plain)")
+    ing.add_argument("--bucket", default="Class_Lab3", help="S3 bucket name (default: Class_Lab3)")
+    ing.add_argument("--prefix", default="", help="S3 prefix where logs live")
+    ing.add_argument("--distribution", action="append", metavar="ID", help="Distribution ID(s); repeatable")
+    ing.add_argument("--latest", type=int, default=24, help="Without --since/--until: newest N objects (default: 24)")
+    ing.add_argument("--since", help="Relative (6h, 2d) or ISO time, UTC")
+    ing.add_argument("--until", help="Relative (6h, 2d) or ISO time, UTC")
+    ing.add_argument("--fetch-threads", type=int, default=DEFAULT_FETCH_THREADS)
+
+    for name, help_text in (("report", "Hit/Miss/RefreshHit report (same as the explainer)"),
+                            ("group", "Outcome breakdown grouped by a column")):
+        q = sub.add_parser(name, help=help_text)
+        q.add_argument("--since", help="Only rows from this time on (relative or ISO, UTC)")
+        q.add_argument("--until", help="Only rows before this time")
+        if name == "group":
+            q.add_argument("--by", choices=sorted(GROUP_COLUMNS), default="edge")
+            q.add_argument("--top", type=int, default=20, help="Rows to print (default: 20, 0 = all)")
+
+    args = ap.parse_args()
+    try:
+        store = ColumnStore(args.store)
+        if args.cmd == "ingest":
+            rows, sources = ingest_files(store, args.files) if args.files else ingest_s3(store, args)
+            print(f"Ingested {rows} rows from {sources} sources into {args.store}")
+            return 0
+
+        now = datetime.now(timezone.utc)
+        since = parse_when(args.since, now) if args.since else None
+        until = parse_when(args.until, now) if args.until else None
+        if args.cmd == "report":
+            print_report(store.outcome_counts(since, until))
+        else:
+            print_groups(store.group_outcomes(args.by, since, until), args.by, args.top)
+        return 0
+    except (RuntimeError, OSError, argparse.ArgumentTypeError) as e:
+        print(str(e), file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
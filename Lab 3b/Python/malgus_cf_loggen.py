@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+malgus_cf_loggen.py
+
+Synthetic CloudFront standard-log generator for testing and benchmarking the log tools.
+Writes gzipped, tab-delimited logs with the real '#Version'/'#Fields:' header, named
+and laid out like CloudFront delivers them (<out>/<prefix><DIST>.<YYYY-MM-DD-HH>.<id>.gz),
+so the directory can stand in for an S3 log prefix.
+
+Realism knobs: result-type mix (Hit/Miss/RefreshHit/Error/...), Zipf-skewed URI
+popularity, edge locations, status codes and latency that follow the result type.
+Size is given as uncompressed bytes (e.g. 50MB, 20GB) and split into hourly files.
+
+# Reason why Darth Malgus would be pleased with this script:
+# You do not test a weapon on the enemy. You test it on a drone that behaves exactly like one.
+#
+# Reason why this script is relevant to your career:
+# Performance work starts with a reproducible workload; production logs are rarely shareable.
+#
+# How you would talk about this script at an interview:
+# “I wrote a seeded generator for realistic CloudFront logs so parser and listing changes could be
+#  benchmarked at MB-to-tens-of-GB scale without touching production data.”
+"""
+
+import argparse
+import base64
+import gzip
+import io
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+FIELDS = (
+    "date time x-edge-location sc-bytes c-ip cs-method cs(Host) cs-uri-stem sc-status cs(Referer) "
+    "cs(User-Agent) cs-uri-query cs(Cookie) x-edge-result-type x-edge-request-id x-host-header "
+    "cs-protocol cs-bytes time-taken x-forwarded-for ssl-protocol ssl-cipher x-edge-response-result-type "
+    "cs-protocol-version fle-status fle-encrypted-fields c-port time-to-first-byte "
+    "x-edge-detailed-result-type sc-content-type sc-content-len sc-range-start sc-range-end"
+).split()
+HEADER = "#Version: 1.0\n#Fields: " + " ".join(FIELDS) + "\n"
+
+DEFAULT_MIX = "Hit=0.72,Miss=0.2,RefreshHit=0.05,Error=0.025,LimitExceeded=0.005"
+EDGES = ("NRT57-P1", "NRT12-C3", "KIX56-P2", "GRU3-C1", "GRU1-P4", "IAD89-C2", "FRA56-P7", "SIN2-C1")
+USER_AGENTS = (
+    "Mozilla/5.0%20(Windows%20NT%2010.0;%20Win64;%20x64)%20AppleWebKit/537.36%20(KHTML,%20like%20Gecko)"
+    "%20Chrome/124.0.0.0%20Safari/537.36",
+    "Mozilla/5.0%20(iPhone;%20CPU%20iPhone%20OS%2017_4%20like%20Mac%20OS%20X)%20AppleWebKit/605.1.15"
+    "%20(KHTML,%20like%20Gecko)%20Version/17.4%20Mobile/15E148%20Safari/604.1",
+    "curl/8.5.0",
+    "Amazon%20CloudFront",
+    "python-requests/2.31.0",
+)
+CONTENT_TYPES = ("text/html", "application/json", "image/png", "text/css", "application/javascript")
+_SIZE_RE = re.compile(r"(?i)^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*$")
+
+
+def parse_size(text: str) -> int:
+    """'512KB', '50MB', '20GB', '1048576' -> bytes."""
+    m = _SIZE_RE.match(text)
+    if not m:
+        raise argparse.ArgumentTypeError(f"bad size {text!r}: use e.g. 50MB or 20GB")
+    return int(float(m.group(1)) * 1024 ** " KMGT".index(m.group(2).upper() or " "))
+
+
+def parse_mix(text: str) -> List[Tuple[str, float]]:
+    """'Hit=0.8,Miss=0.2' -> [("Hit", 0.8), ("Miss", 0.2)] (weights need not sum to 1)."""
+    mix = []
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        try:
+            mix.append((name.strip(), float(weight)))
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"bad mix entry {part!r}: use Name=weight")
+    if not mix or sum(w for _, w in mix) <= 0:
+        raise argparse.ArgumentTypeError("mix needs at least one positive weight")
+    return mix
+
+
+class LogGenerator:
+    """Seeded line generator; lines are produced in batches to keep per-line work small."""
+
+    def __init__(self, mix: List[Tuple[str, float]], uris: int = 5000, zipf_s: float = 1.1, seed: int = 1):
+        self.rng = random.Random(seed)
+        self.outcomes = [name for name, _ in mix]
+        self.outcome_cum = list(itertools.accumulate(w for _, w in mix))
+        self.uris = [self._make_uri(i) for i in range(uris)]
+        # Zipf: popularity of rank k ~ 1 / k^s
+        self.uri_cum = list(itertools.accumulate(1.0 / (k ** zipf_s) for k in range(1, uris + 1)))
+        self.clients = [f"{self.rng.randint(1, 223)}.{self.rng.randint(0, 255)}.{self.rng.randint(0, 255)}."
+                        f"{self.rng.randint(1, 254)}" for _ in range(20000)]
+
+    def _make_uri(self, i: int) -> str:
+        kind = i % 5
+        if kind == 0:
+            return f"/static/app.{i:x}.js"
+        if kind == 1:
+            return f"/img/p{i}.png"
+        if kind == 2:
+            return f"/api/v1/items/{i}"
+        if kind == 3:
+            return f"/css/site{i % 97}.css"
+        return f"/products/{i}/index.html"
+
+    def lines(self, hour: datetime, count: int, host: str) -> List[str]:
+        rng = self.rng
+        outcomes = rng.choices(self.outcomes, cum_weights=self.outcome_cum, k=count)
+        uris = rng.choices(self.uris, cum_weights=self.uri_cum, k=count)
+        seconds = sorted(rng.randrange(3600) for _ in range(count))
+        date = hour.strftime("%Y-%m-%d")
+        hh = hour.strftime("%H")
+        out = []
+        for outcome, uri, sec in zip(outcomes, uris, seconds):
+            if outcome == "Hit":
+                status, tt = "200", rng.lognormvariate(-5.0, 0.6)
+            elif outcome == "RefreshHit":
+                status, tt = "304" if rng.random() < 0.5 else "200", rng.lognormvariate(-3.5, 0.7)
+            elif outcome == "Miss":
+                status, tt = "200", rng.lognormvariate(-2.8, 0.8)
+            elif outcome == "Error":
+                status, tt = rng.choice(("502", "503", "504", "403", "404")), rng.lognormvariate(-2.0, 1.0)
+            else:
+                status, tt = "503", rng.lognormvariate(-4.0, 0.5)
+            ttfb = tt * rng.uniform(0.3, 0.95)
+            size = int(rng.lognormvariate(8.5, 1.5))
+            request_id = base64.urlsafe_b64encode(rng.randbytes(42)).decode()
+            # crc32, not hash(): str hashes change with PYTHONHASHSEED and the output must not
+            ctype = CONTENT_TYPES[zlib.crc32(uri.encode()) % len(CONTENT_TYPES)]
+            row = (
+                date, f"{hh}:{sec // 60:02d}:{sec % 60:02d}", rng.choice(EDGES), str(size),
+                rng.choice(self.clients), "GET", host, uri, status, "-", rng.choice(USER_AGENTS), "-", "-",
+                outcome, request_id, host, "https", str(rng.randint(90, 600)), f"{tt:.3f}", "-",
+                "TLSv1.3", "TLS_AES_128_GCM_SHA256", outcome, "HTTP/2.0", "-", "-",
+                str(rng.randint(1024, 65535)), f"{ttfb:.3f}", outcome, ctype, str(size), "-", "-",
+            )
+            out.append("\t".join(row))
+        return out
+
+
+def generate(
+    out_dir: str,
+    total_bytes: int,
+    hours: int,
+    start: datetime,
+    prefix: str = "",
+    distribution: str = "E2MALGUS0SYNTH",
+    mix: str = DEFAULT_MIX,
+    uris: int = 5000,
+    zipf_s: float = 1.1,
+    seed: int = 1,
+    level: int = 1,
+) -> Dict[str, int]:
+    """
+    Write ~total_bytes of uncompressed log text spread evenly over `hours` hourly
+    objects (several objects per hour when an hour would exceed 256 MB).
+    Returns {"files", "lines", "bytes"} (bytes = uncompressed).
+    """
+    gen = LogGenerator(parse_mix(mix), uris, zipf_s, seed)
+    host = "d111111abcdef8.cloudfront.net"
+    per_hour = max(1, total_bytes // max(1, hours))
+    parts_per_hour = max(1, -(-per_hour // (256 * 1024 ** 2)))
+    per_file = per_hour // parts_per_hour
+    target_dir = os.path.join(out_dir, os.path.dirname(prefix))
+    os.makedirs(target_dir, exist_ok=True)
+    stats = {"files": 0, "lines": 0, "bytes": 0}
+
+    for h in range(hours):
+        hour = start + timedelta(hours=h)
+        for part in range(parts_per_hour):
+            name = f"{os.path.basename(prefix)}{distribution}.{hour:%Y-%m-%d-%H}.{seed:04x}{h:04x}{part:02x}.gz"
+            written = len(HEADER)
+            # mtime=0: the gzip header holds no write time, so a --seed gives byte-identical files
+            raw = gzip.GzipFile(os.path.join(target_dir, name), "wb", compresslevel=level, mtime=0)
+            with io.TextIOWrapper(raw, encoding="utf-8") as f:
+                f.write(HEADER)
+                while written < per_file:
+                    batch = gen.lines(hour, 2000, host)
+                    text = "\n".join(batch) + "\n"
+                    f.write(text)
+                    written += len(text)
+                    stats["lines"] += len(batch)
+            stats["files"] += 1
+            stats["bytes"] += written
+    return stats
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Generate synthetic gzipped CloudFront standard logs.")
+    ap.add_argument("--out", required=True, help="Output directory (acts as the bucket root)")
+    ap.add_argument("--size", type=parse_size, default=parse_size("50MB"), help="Total uncompressed size (default: 50MB)")
+    ap.add_argument("--hours", type=int, default=6, help="Hourly objects to spread the data over (default: 6)")
+    ap.add_argument("--start", default="2025-01-01T00:00", help="First log hour, UTC (default: 2025-01-01T00:00)")
+    ap.add_argument("--prefix", default="cloudfront-logs/", help="Key prefix under --out (default: cloudfront-logs/)")
+    ap.add_argument("--distribution", default="E2MALGUS0SYNTH", help="Distribution ID in file names")
+    ap.add_argument("--mix", default=DEFAULT_MIX, help=f"Result-type weights (default: {DEFAULT_MIX})")
+    ap.add_argument("--uris", type=int, default=5000, help="Distinct URIs (default: 5000)")
+    ap.add_argument("--zipf", type=float, default=1.1, help="URI popularity skew, Zipf s (default: 1.1)")
+    ap.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+    ap.add_argument("--level", type=int, default=1, help="gzip level (default: 1, fast)")
+    args = ap.parse_args()
+
+    try:
+        start = datetime.fromisoformat(args.start)
+        start = start.astimezone(timezone.utc) if start.tzinfo else start.replace(tzinfo=timezone.utc)
+        parse_mix(args.mix)
+    except (ValueError, argparse.ArgumentTypeError) as e:
+        ap.error(str(e))
+
+    stats = generate(args.out, args.size, args.hours, start, args.prefix, args.distribution,
+                     args.mix, args.uris, args.zipf, args.seed, args.level)
+    print(json.dumps(stats))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
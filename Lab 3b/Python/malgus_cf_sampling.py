@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+malgus_cf_sampling.py
+
+Sequential stratified sampling of CloudFront log objects for a quick Hit/Miss/RefreshHit
+estimate (malgus_cloudfront_log_explainer.py --sample).
+
+Objects are sorted by key hour and cut into contiguous time strata of about equal
+object count. Every stratum starts with two objects, later batches are allocated in
+proportion to stratum size, and each outcome share is estimated with the stratified
+ratio estimator (sum of outcome counts / sum of core counts, objects as clusters).
+The confidence half-width uses the linearized variance with finite-population
+correction, so it shrinks to zero once every object has been read.
+
+Edge locations are not part of the log object key, so objects cannot be stratified by
+edge before download; time strata cover all edges (and all distributions) instead.
+
+# Reason why Darth Malgus would be pleased with this script:
+# The Empire does not interrogate every trooper to know the garrison is loyal. It asks enough of them.
+#
+# Reason why this script is relevant to your career:
+# Knowing when an estimate with an error bar is enough saves hours of compute on large log sets.
+#
+# How you would talk about this script at an interview:
+# “I added a sampling mode that reads a stratified random subset of log objects and stops once the
+#  Hit% confidence interval is tight enough, turning multi-minute scans into seconds.”
+"""
+
+import math
+import random
+import time
+from statistics import NormalDist
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+OUTCOMES = ("Hit", "Miss", "RefreshHit")
+DEFAULT_STRATA = 24
+DEFAULT_ERROR = 1.0
+DEFAULT_BUDGET = 30.0
+DEFAULT_CONFIDENCE = 0.95
+
+
+class Stratum:
+    """Objects of one time slice: shuffled remaining objects and per-object counts read so far."""
+
+    def __init__(self, objects: List[Dict[str, Any]]):
+        self.objects = objects
+        self.remaining = list(objects)
+        self.samples: List[Dict[str, int]] = []
+
+    @property
+    def size(self) -> int:
+        return len(self.objects)
+
+    @property
+    def picked(self) -> int:
+        return self.size - len(self.remaining)
+
+
+class StratifiedSample:
+    """
+    Sampling state for `objects` (dicts with "key" and optionally "hour", in listing
+    order). Call next_batch() for objects to read, add() their counts, estimate()
+    for the current answer.
+    """
+
+    def __init__(self, objects: List[Dict[str, Any]], strata: int = DEFAULT_STRATA, seed: Optional[int] = None):
+        rng = random.Random(seed)
+        ordered = sorted(objects, key=lambda o: (o.get("hour") is not None, o.get("hour") or 0, o["key"]))
+        n_strata = max(1, min(strata, len(ordered) // 2))
+        size, extra = divmod(len(ordered), n_strata)
+        self.strata: List[Stratum] = []
+        start = 0
+        for i in range(n_strata):
+            end = start + size + (1 if i < extra else 0)
+            stratum = Stratum(ordered[start:end])
+            rng.shuffle(stratum.remaining)
+            self.strata.append(stratum)
+            start = end
+        self._by_key = {o["key"]: s for s in self.strata for o in s.objects}
+        self.population = len(ordered)
+
+    @property
+    def sampled(self) -> int:
+        return sum(len(s.samples) for s in self.strata)
+
+    @property
+    def exhausted(self) -> bool:
+        return all(not s.remaining for s in self.strata)
+
+    def next_batch(self, n: int) -> List[Dict[str, Any]]:
+        """
+        Up to n objects not read yet. Strata with fewer than two picks come first (the
+        variance needs two per stratum); the rest go by largest N_h / (n_h + 1), which
+        converges to proportional allocation.
+        """
+        batch = []
+        for s in self.strata:
+            while s.picked < 2 and s.remaining and len(batch) < n:
+                batch.append(s.remaining.pop())
+        while len(batch) < n:
+            open_strata = [s for s in self.strata if s.remaining]
+            if not open_strata:
+                break
+            s = max(open_strata, key=lambda st: st.size / (st.picked + 1))
+            batch.append(s.remaining.pop())
+        return batch
+
+    def add(self, key: str, counts: Dict[str, int]) -> None:
+        self._by_key[key].samples.append(counts)
+
+    def estimate(self, outcome: str, z: float) -> Tuple[Optional[float], float]:
+        """
+        (share of core outcomes, confidence half-width) for `outcome`, both as fractions.
+        Share is None until a sampled object has core outcomes.
+        """
+        sampled = [s for s in self.strata if s.samples]
+        y_tot = x_tot = 0.0
+        for s in sampled:
+            y_tot += s.size * sum(c.get(outcome, 0) for c in s.samples) / len(s.samples)
+            x_tot += s.size * sum(core(c) for c in s.samples) / len(s.samples)
+        if x_tot == 0:
+            return None, math.inf
+        ratio = y_tot / x_tot
+
+        # Linearized variance: residuals d = y - R x per object, per-stratum sample variance.
+        residuals = {id(s): [c.get(outcome, 0) - ratio * core(c) for c in s.samples] for s in sampled}
+        pooled = [d for ds in residuals.values() for d in ds]
+        pooled_var = _variance(pooled) if len(pooled) > 1 else math.inf
+        var = 0.0
+        for s in sampled:
+            n_h = len(s.samples)
+            fpc = 1 - n_h / s.size
+            if fpc <= 0:
+                continue
+            s2 = _variance(residuals[id(s)]) if n_h > 1 else pooled_var
+            var += s.size ** 2 * fpc * s2 / n_h
+        # Strata not read yet (only before the first batch completes) count as unknown.
+        if len(sampled) < len(self.strata):
+            var = math.inf
+        return ratio, z * math.sqrt(var) / x_tot if math.isfinite(var) else math.inf
+
+
+def core(counts: Dict[str, int]) -> int:
+    return sum(counts.get(k, 0) for k in OUTCOMES)
+
+
+def _variance(values: List[float]) -> float:
+    mean = sum(values) / len(values)
+    return sum((v - mean) ** 2 for v in values) / (len(values) - 1)
+
+
+def z_score(confidence: float) -> float:
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def sample_until(
+    objects: List[Dict[str, Any]],
+    fetch: Callable[[List[str]], Iterable[Tuple[str, Dict[str, int]]]],
+    error: float = DEFAULT_ERROR,
+    budget: float = DEFAULT_BUDGET,
+    confidence: float = DEFAULT_CONFIDENCE,
+    batch_size: int = 16,
+    strata: int = DEFAULT_STRATA,
+    seed: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Read batches of objects through fetch(keys) -> (key, counts) until every core
+    outcome share is within ±`error` percentage points at `confidence`, `budget`
+    seconds have passed, or every object was read. Yields a progress/result dict
+    after each batch; the last one has "stop" set.
+    """
+    sample = StratifiedSample(objects, strata, seed)
+    z = z_score(confidence)
+    started = time.monotonic()
+    total: Dict[str, int] = {}
+    first = True
+    while True:
+        # The first batch covers every stratum twice; later ones are batch_size.
+        batch = sample.next_batch(max(batch_size, 2 * len(sample.strata)) if first else batch_size)
+        first = False
+        for key, counts in fetch([o["key"] for o in batch]):
+            sample.add(key, counts)
+            for k, v in counts.items():
+                total[k] = total.get(k, 0) + v
+
+        estimates = {k: sample.estimate(k, z) for k in OUTCOMES}
+        widest = max(half for _, half in estimates.values())
+        elapsed = time.monotonic() - started
+        stop = None
+        if sample.exhausted:
+            stop = "all objects read (exact)"
+        elif widest * 100 <= error:
+            stop = f"error bound ±{error:g} pts met"
+        elif elapsed >= budget:
+            stop = f"time budget {budget:g}s used"
+        yield {
+            "sampled": sample.sampled,
+            "population": sample.population,
+            "strata": len(sample.strata),
+            "elapsed": elapsed,
+            "confidence": confidence,
+            "estimates": estimates,
+            "counts": dict(total),
+            "stop": stop,
+        }
+        if stop:
+            return
+
+
+def print_sample_report(result: Dict[str, Any]) -> None:
+    print("\n=== CloudFront Cache Outcome Estimate (Sampled Standard Logs) ===")
+    print(f"Objects read: {result['sampled']} of {result['population']} "
+          f"({result['sampled'] * 100.0 / max(1, result['population']):.1f}%) across {result['strata']} time strata "
+          f"in {result['elapsed']:.1f}s")
+    print(f"Stopped: {result['stop']}\n")
+    print(f"Core outcomes ({result['confidence'] * 100:g}% confidence interval):")
+    for k in OUTCOMES:
+        share, half = result["estimates"][k]
+        if share is None:
+            print(f"  {k:10s}        -")
+        elif math.isinf(half):
+            print(f"  {k:10s} {share * 100:6.1f}%   (interval not available yet)")
+        else:
+            lo, hi = max(0.0, share - half), min(1.0, share + half)
+            print(f"  {k:10s} {share * 100:6.1f}%   ±{half * 100:.2f} pts   [{lo * 100:.1f}%, {hi * 100:.1f}%]")
+    print(f"\nCounted in the sample: {sum(result['counts'].values())} lines "
+          f"({core(result['counts'])} core outcomes)")
+    print("=================================================================\n")
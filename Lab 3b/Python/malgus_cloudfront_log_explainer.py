@@ -20,74 +20,380 @@ stored in S3 (tab-delimited, often .gz).
 import argparse
 import gzip
 import io
+import json
 import os
-import subprocess
+import re
 import sys
 import tempfile
 from collections import Counter
-from typing import Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+from malgus_aws import get_client
+from malgus_cf_analytics import (
+    ANALYTICS_FIELDS, DEFAULT_MAX_URIS, DEFAULT_TOP_K, AnalyticsConfig, CacheAnalytics, print_analytics,
+    print_heavy_hitters,
+)
+from malgus_cf_sampling import (
+    DEFAULT_BUDGET, DEFAULT_CONFIDENCE, DEFAULT_ERROR, DEFAULT_STRATA, print_sample_report, sample_until,
+)
 
 TARGETS = {"Hit", "Miss", "RefreshHit"}
 
-def run(cmd: List[str]) -> str:
-    """Run a command and return stdout; raise with clear error if it fails."""
+# Concurrent GetObject streams; the S3 client's connection pool is sized to match.
+DEFAULT_FETCH_THREADS = 8
+
+# Process-pool mode cuts the object list into this many contiguous shards per worker,
+# so a slow shard does not leave the other cores idle at the end of the run.
+SHARDS_PER_WORKER = 4
+
+# A log source is a local path or an already-open stream of log lines. S3 streams are
+# binary (see open_s3_log); the legacy engine decodes them, the fast engine does not.
+LogSource = Union[str, IO[bytes], IO[str]]
+
+# Parser engines for count/tally functions. "legacy" is the original text parser and is
+# kept as the reference implementation for checking that "fast" produces identical counts.
+# Measured with malgus_cf_bench.py (60 MB of synthetic logs, gzip level 1): "fast" is
+# about 1.5x "legacy" from .gz files (~350k vs ~240k lines/s) and 2-3x on lines already
+# in memory. Gunzip takes about half of the fast engine's time, which bounds the gain.
+ENGINES = ("fast", "legacy")
+DEFAULT_ENGINE = "fast"
+
+# Outcome columns, in lookup order (x-edge-result-type, else x-edge-response-result-type).
+RESULT_FIELD = b"x-edge-result-type"
+RESPONSE_RESULT_FIELD = b"x-edge-response-result-type"
+# Fast engine reads (and gunzips) in blocks this large and splits lines itself, about
+# 1.2x cheaper than per-line readline() on a GzipFile.
+FAST_READ_BLOCK = 1 << 20
+# Fast-engine key for lines seen before any '#Fields:' header (never a real column value).
+_NO_HEADER = None
+
+# CloudFront standard log object names: <prefix><DistributionId>.<YYYY-MM-DD-HH>.<unique>[.gz]
+# Keys of one distribution therefore sort by hour, which lets listing start and stop at a time.
+LOG_KEY_RE = re.compile(r"(?P<dist>[^/.]+)\.(?P<hour>\d{4}-\d{2}-\d{2}-\d{2})\.[^/]*$")
+LOG_HOUR_FORMAT = "%Y-%m-%d-%H"
+# --latest without --since widens its lookback 1h, 2h, 4h, ... up to this before
+# falling back to listing the whole prefix.
+MAX_LATEST_LOOKBACK = timedelta(days=90)
+
+def iter_log_objects(s3, bucket: str, prefix: str, start_after: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield objects under prefix with paginated ListObjectsV2, in key order, starting
+    after `start_after`. Each item: {"key", "etag", "size"}; ETags feed the incremental
+    manifest. Stop iterating to stop listing: later pages are never requested.
+    """
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    if start_after:
+        kwargs["StartAfter"] = start_after
+    try:
+        for page in s3.get_paginator("list_objects_v2").paginate(**kwargs):
+            for obj in page.get("Contents", []):
+                key = obj["Key"]
+                # skip "folders" if any
+                if key.endswith("/"):
+                    continue
+                yield {"key": key, "etag": obj.get("ETag", "").strip('"'), "size": obj.get("Size", 0)}
+    except (BotoCoreError, ClientError) as e:
+        raise RuntimeError(f"ListObjectsV2 failed: s3://{bucket}/{prefix}\n{e}")
+
+def list_log_objects(s3, bucket: str, prefix: str) -> List[Dict[str, Any]]:
+    """Every object under prefix (full listing; see list_log_objects_between for time ranges)."""
+    return list(iter_log_objects(s3, bucket, prefix))
+
+def log_key_hour(key: str) -> Optional[datetime]:
+    """UTC hour encoded in a CloudFront log key, or None if the key does not follow the pattern."""
+    m = LOG_KEY_RE.search(key)
+    if not m:
+        return None
+    try:
+        return datetime.strptime(m.group("hour"), LOG_HOUR_FORMAT).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+
+def parse_when(value: str, now: datetime) -> datetime:
+    """
+    Parse --since/--until: relative ("90m", "6h", "2d" before now) or ISO 8601
+    ("2025-12-29", "2025-12-29T14:00", "2025-12-29T14:00+09:00"). Naive times are
+    taken as UTC; the result is always in UTC, like the hours in log key names.
+    """
+    m = re.fullmatch(r"(\d+)([mhd])", value.strip())
+    if m:
+        unit = {"m": "minutes", "h": "hours", "d": "days"}[m.group(2)]
+        return now - timedelta(**{unit: int(m.group(1))})
+    try:
+        when = datetime.fromisoformat(value.strip())
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad time {value!r}: use e.g. 6h, 2d, 2025-12-29 or 2025-12-29T14:00")
+    return when.astimezone(timezone.utc) if when.tzinfo else when.replace(tzinfo=timezone.utc)
+
+def list_distribution_prefixes(s3, bucket: str, prefix: str) -> List[str]:
+    """
+    Find "<folder><DistributionId>." key prefixes without listing the logs themselves.
+    The prefix is taken from the first log key name found (LOG_KEY_RE), then the
+    listing restarts after every key of that distribution ("<...>." sorts just before
+    "<...>/"), so this costs about one request per distribution, also when folder
+    names under the prefix contain dots.
+    """
+    found = []
+    start_after = None
     try:
-        p = subprocess.run(cmd, check=True, capture_output=True, text=True)
-        return p.stdout
-    except FileNotFoundError:
-        raise RuntimeError("Command not found. Install AWS CLI v2 and ensure 'aws' is on PATH.")
-    except subprocess.CalledProcessError as e:
-        msg = e.stderr.strip() or e.stdout.strip() or str(e)
-        raise RuntimeError(f"Command failed: {' '.join(cmd)}\n{msg}")
-
-def aws_s3_ls_recursive(bucket: str, prefix: str) -> List[str]:
-    """
-    Return object keys from `aws s3 ls s3://bucket/prefix --recursive`.
-    """
-    uri = f"s3://{bucket}/{prefix}" if prefix else f"s3://{bucket}/"
-    out = run(["aws", "s3", "ls", uri, "--recursive"])
-    keys = []
-    for line in out.splitlines():
-        # format: 2025-12-29 12:34:56   12345 some/prefix/file.gz
-        parts = line.split()
-        if len(parts) >= 4:
-            key = parts[3]
-            # skip "folders" if any
-            if key.endswith("/"):
+        while True:
+            jumped = False
+            kwargs = {"StartAfter": start_after} if start_after else {}
+            pages = s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=prefix, **kwargs)
+            for page in pages:
+                for obj in page.get("Contents", []):
+                    m = LOG_KEY_RE.search(obj["Key"])
+                    if m:
+                        dist_prefix = obj["Key"][:m.start("hour")]
+                        found.append(dist_prefix)
+                        start_after = dist_prefix[:-1] + "/"
+                        jumped = True
+                        break
+                    start_after = obj["Key"]
+                if jumped:
+                    break
+            if not jumped:
+                return found
+    except (BotoCoreError, ClientError) as e:
+        raise RuntimeError(f"ListObjectsV2 failed: s3://{bucket}/{prefix}\n{e}")
+
+def list_log_objects_between(
+    s3,
+    bucket: str,
+    dist_prefixes: List[str],
+    since: Optional[datetime],
+    until: Optional[datetime],
+    threads: int = DEFAULT_FETCH_THREADS,
+) -> List[Dict[str, Any]]:
+    """
+    Objects whose key hour H overlaps [since, until), i.e. floor_hour(since) <= H < until.
+    Each distribution prefix is listed from StartAfter="<dist>.<since hour>" and the
+    listing stops at the first key at or past `until`, so hours outside the range are
+    never listed. Distributions are listed concurrently; keys not following the
+    CloudFront naming pattern are skipped. Result is sorted by (hour, key).
+    """
+    # Key hours are UTC; StartAfter must be formatted in UTC too
+    since = since.astimezone(timezone.utc) if since and since.tzinfo else \
+        since.replace(tzinfo=timezone.utc) if since else None
+    until = until.astimezone(timezone.utc) if until and until.tzinfo else \
+        until.replace(tzinfo=timezone.utc) if until else None
+
+    def list_one(dist_prefix: str) -> List[Dict[str, Any]]:
+        start_after = f"{dist_prefix}{since.strftime(LOG_HOUR_FORMAT)}" if since else None
+        since_hour = since.replace(minute=0, second=0, microsecond=0) if since else None
+        out = []
+        for obj in iter_log_objects(s3, bucket, dist_prefix, start_after):
+            hour = log_key_hour(obj["key"])
+            if hour is None:
                 continue
-            keys.append(key)
-    return keys
+            if until is not None and hour >= until:
+                break
+            if since_hour is not None and hour < since_hour:
+                continue
+            obj["hour"] = hour
+            out.append(obj)
+        return out
+
+    objects: List[Dict[str, Any]] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(threads, len(dist_prefixes)))) as pool:
+        for part in pool.map(list_one, dist_prefixes):
+            objects.extend(part)
+    objects.sort(key=lambda o: (o["hour"], o["key"]))
+    return objects
+
+def select_latest(
+    s3,
+    bucket: str,
+    dist_prefixes: List[str],
+    n: int,
+    now: datetime,
+    threads: int = DEFAULT_FETCH_THREADS,
+) -> List[Dict[str, Any]]:
+    """
+    Newest n objects by key hour, found by widening a lookback window that doubles
+    (1h, 2h, 4h, ...) until it holds n objects. Each step lists only the hours it adds
+    (StartAfter at the new start, stopping at the previous one) and keeps what was
+    already found, so every hour is listed once. Only recent hours are listed on a
+    busy bucket. After MAX_LATEST_LOOKBACK, the rest of the history is listed.
+    """
+    lookback = timedelta(hours=1)
+    objects: List[Dict[str, Any]] = []
+    until = None
+    while True:
+        since = None if lookback > MAX_LATEST_LOOKBACK else now - lookback
+        # Older hours go in front; both parts are sorted by (hour, key) and do not overlap
+        objects = list_log_objects_between(s3, bucket, dist_prefixes, since, until, threads) + objects
+        if len(objects) >= n or since is None:
+            return objects[-n:] if n > 0 else []
+        until = since.replace(minute=0, second=0, microsecond=0)
+        lookback *= 2
 
 def pick_latest(keys: List[str], n: int) -> List[str]:
     """
-    AWS 's3 ls' is already sorted lexicographically by key within listing order,
-    but not guaranteed by timestamp across prefixes. We can just take the last N
-    if your logs are date-partitioned (common). This is good enough for labs.
+    Last N keys by the hour in their CloudFront file name (keys without one sort first,
+    in key order). ListObjectsV2 order is only lexicographic, so with several
+    distributions or folders the plain key tail is not the most recent logs.
     """
     if n <= 0:
         return []
-    return keys[-n:] if len(keys) > n else keys
+    epoch = datetime.min.replace(tzinfo=timezone.utc)
+    ordered = sorted(keys, key=lambda k: (log_key_hour(k) or epoch, k))
+    return ordered[-n:] if len(ordered) > n else ordered
+
+def make_s3_client(max_pool: int = DEFAULT_FETCH_THREADS):
+    """
+    One S3 client shared by all fetch threads (boto3 clients are thread-safe), from
+    the process-wide registry. The urllib3 pool is sized so every thread keeps a warm
+    connection instead of re-doing the TLS handshake per object.
+    """
+    return get_client("s3", max_pool_connections=max_pool, retries={"max_attempts": 5, "mode": "adaptive"})
+
+class _S3RawStream(io.RawIOBase):
+    """Adapts a botocore StreamingBody to RawIOBase so io/gzip can buffer on top of it."""
+
+    def __init__(self, body):
+        self._body = body
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        chunk = self._body.read(len(b))
+        n = len(chunk)
+        b[:n] = chunk
+        return n
+
+    def close(self) -> None:
+        try:
+            self._body.close()
+        finally:
+            super().close()
 
-def aws_s3_cp(bucket: str, key: str, dest_path: str) -> None:
-    run(["aws", "s3", "cp", f"s3://{bucket}/{key}", dest_path])
+def open_s3_log(s3, bucket: str, key: str) -> io.BufferedIOBase:
+    """
+    Stream an S3 log object as binary lines. Gzip is decompressed on the fly while the
+    body is read, so nothing is written to disk and only a read buffer is held in memory.
+    """
+    try:
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"]
+    except (BotoCoreError, ClientError) as e:
+        raise RuntimeError(f"GetObject failed: s3://{bucket}/{key}\n{e}")
+    raw = io.BufferedReader(_S3RawStream(body), buffer_size=256 * 1024)
+    if key.endswith(".gz"):
+        raw = gzip.GzipFile(fileobj=raw, mode="rb")
+    return raw
 
 def open_maybe_gzip(path: str) -> io.TextIOBase:
     if path.endswith(".gz"):
         return io.TextIOWrapper(gzip.open(path, "rb"), encoding="utf-8", errors="replace")
     return open(path, "r", encoding="utf-8", errors="replace")
 
-def count_standard_log_files(file_paths: List[str]) -> Dict[str, int]:
+def open_binary_maybe_gzip(path: str) -> io.BufferedIOBase:
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def open_log_source(source: LogSource, binary: bool = False):
+    """
+    Paths are opened (gunzipping .gz) in text or binary mode; streams are closed after
+    parsing. Binary streams are decoded for text consumers; text streams cannot be
+    handed to a binary consumer.
+    """
+    if isinstance(source, str):
+        return open_binary_maybe_gzip(source) if binary else open_maybe_gzip(source)
+    if isinstance(source, io.TextIOBase):
+        if binary:
+            raise TypeError("fast engine needs a path or binary stream, got a text stream")
+        return source
+    if binary:
+        return source
+    return io.TextIOWrapper(source, encoding="utf-8", errors="replace")
+
+class LogTally:
+    """
+    Mergeable partial aggregate of parsed standard logs. Workers each build one for
+    their shard; merging in shard order reproduces the serial result exactly,
+    including the first-seen order of keys in the final counts dict.
+    """
+
+    def __init__(self, analytics: Optional[AnalyticsConfig] = None):
+        self.counts = Counter()
+        self.other = Counter()
+        # Per-bucket/edge/URI analytics, only collected with --analytics.
+        self.analytics: Optional[CacheAnalytics] = CacheAnalytics(analytics) if analytics else None
+
+    def merge(self, other: "LogTally") -> "LogTally":
+        self.counts.update(other.counts)
+        self.other.update(other.other)
+        if other.analytics is not None:
+            if self.analytics is None:
+                self.analytics = CacheAnalytics(other.analytics.config)
+            self.analytics.merge(other.analytics)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-safe form, used to cache per-object tallies in the manifest."""
+        data = {"counts": dict(self.counts), "other": dict(self.other)}
+        if self.analytics is not None:
+            data["analytics"] = self.analytics.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LogTally":
+        tally = cls()
+        tally.counts.update(data.get("counts", {}))
+        tally.other.update(data.get("other", {}))
+        if "analytics" in data:
+            tally.analytics = CacheAnalytics.from_dict(data["analytics"])
+        return tally
+
+    def to_counts(self) -> Dict[str, int]:
+        """The flat dict print_report() expects (other outcomes rolled up as 'Other:<x>')."""
+        counts = Counter(self.counts)
+        for k, v in self.other.items():
+            counts[f"Other:{k}"] += v
+        return dict(counts)
+
+def tally_standard_log_files(
+    sources: List[LogSource],
+    tally: Optional[LogTally] = None,
+    engine: str = DEFAULT_ENGINE,
+    analytics: Optional[AnalyticsConfig] = None,
+) -> LogTally:
     """
     Parse CloudFront standard logs. Uses '#Fields:' header to map columns.
     Counts x-edge-result-type primarily, falls back to x-edge-response-result-type.
+    Each source is a local path or an open stream (see open_s3_log).
+    With `analytics`, per-bucket/edge/URI stats and/or Miss heavy hitters are collected
+    too (bytes scanner only).
     """
-    counts = Counter()
-    other = Counter()
-
-    for path in file_paths:
+    tally = tally if tally is not None else LogTally()
+    if analytics is not None:
+        if tally.analytics is None:
+            tally.analytics = CacheAnalytics(analytics)
+        for source in sources:
+            with open_log_source(source, binary=True) as f:
+                _fold_outcomes(tally, _scan_with_analytics(f, tally.analytics))
+        return tally
+    if engine == "fast":
+        for source in sources:
+            with open_log_source(source, binary=True) as f:
+                _fold_outcomes(tally, _scan_outcomes_fast(f))
+        return tally
+    if engine != "legacy":
+        raise ValueError(f"unknown engine {engine!r} (expected one of {', '.join(ENGINES)})")
+
+    counts = tally.counts
+    other = tally.other
+
+    for source in sources:
         field_index: Optional[Dict[str, int]] = None
 
-        with open_maybe_gzip(path) as f:
+        with open_log_source(source) as f:
             for line in f:
                 if line.startswith("#Fields:"):
                     # Example: "#Fields: date time x-edge-location ... x-edge-result-type x-edge-response-result-type ..."
@@ -125,11 +431,363 @@ def count_standard_log_files(file_paths: List[str]) -> Dict[str, int]:
                 else:
                     other[outcome] += 1
 
-    # roll up other outcomes
-    for k, v in other.items():
-        counts[f"Other:{k}"] += v
+    return tally
+
+def iter_raw_lines(f: IO[bytes], block: int = FAST_READ_BLOCK):
+    """Yield lines without their trailing newline, reading `block` bytes at a time."""
+    rest = b""
+    while True:
+        chunk = f.read(block)
+        if not chunk:
+            break
+        lines = (rest + chunk).split(b"\n")
+        rest = lines.pop()
+        yield from lines
+    if rest:
+        yield rest
+
+def _scan_outcomes_fast(f: IO[bytes]) -> Dict[Optional[bytes], int]:
+    """
+    Fast engine hot loop over raw bytes. Column indices are resolved once per '#Fields:'
+    header, and each line is split only up to x-edge-result-type; the line is split
+    further only when that column is empty and x-edge-response-result-type is needed.
+    Returns raw outcome -> count in first-seen order (b"" = missing outcome,
+    _NO_HEADER = line before any header); nothing is decoded per line.
+    What is left per line (one bounded split, one dict update) is near the floor for
+    CPython: a regex findall or a list comprehension + Counter per block measured slower.
+    """
+    seen: Dict[Optional[bytes], int] = {}
+    get = seen.get
+    rt_i = rrt_i = -1
+    have_header = False
+
+    for line in iter_raw_lines(f):
+        if line[:1] == b"#":
+            if line.startswith(b"#Fields:"):
+                fields = line[8:].split()
+                have_header = bool(fields)
+                rt_i = fields.index(RESULT_FIELD) if RESULT_FIELD in fields else -1
+                rrt_i = fields.index(RESPONSE_RESULT_FIELD) if RESPONSE_RESULT_FIELD in fields else -1
+            continue
+
+        if not have_header:
+            seen[_NO_HEADER] = get(_NO_HEADER, 0) + 1
+            continue
+
+        outcome = b""
+        if rt_i >= 0:
+            parts = line.split(b"\t", rt_i + 1)
+            if rt_i < len(parts):
+                outcome = parts[rt_i]
+                if rt_i == len(parts) - 1:
+                    outcome = outcome.rstrip(b"\r")
+        if not outcome and rrt_i >= 0:
+            parts = line.split(b"\t", rrt_i + 1)
+            if rrt_i < len(parts):
+                outcome = parts[rrt_i]
+                if rrt_i == len(parts) - 1:
+                    outcome = outcome.rstrip(b"\r")
+        seen[outcome] = get(outcome, 0) + 1
+
+    return seen
+
+_ANALYTICS_COLUMNS = tuple(name.encode() for name in ANALYTICS_FIELDS)
+
+def _scan_with_analytics(f: IO[bytes], analytics: CacheAnalytics) -> Dict[Optional[bytes], int]:
+    """
+    Bytes scanner for --analytics: same outcome rules and return value as
+    _scan_outcomes_fast, and it also feeds every line into `analytics`. Lines are split
+    only up to the highest column either needs.
+    """
+    seen: Dict[Optional[bytes], int] = {}
+    get = seen.get
+    have_header = False
+    rt_i = rrt_i = -1
+    cols = (-1,) * len(_ANALYTICS_COLUMNS)
+    maxsplit = 0
+    add = analytics.add
+    names: Dict[bytes, str] = {}
+
+    def text(raw: bytes) -> str:
+        # Edges/URIs repeat constantly; decode each distinct value once.
+        s = names.get(raw)
+        if s is None:
+            if len(names) > 100_000:
+                names.clear()
+            s = names[raw] = raw.decode("utf-8", "replace")
+        return s
+
+    def number(raw: bytes) -> Optional[float]:
+        try:
+            return float(raw)
+        except ValueError:
+            return None
+
+    for line in iter_raw_lines(f):
+        if line[:1] == b"#":
+            if line.startswith(b"#Fields:"):
+                fields = line[8:].split()
+                have_header = bool(fields)
+                index = {name: i for i, name in enumerate(fields)}
+                rt_i = index.get(RESULT_FIELD, -1)
+                rrt_i = index.get(RESPONSE_RESULT_FIELD, -1)
+                cols = tuple(index.get(name, -1) for name in _ANALYTICS_COLUMNS)
+                maxsplit = max((rt_i, rrt_i) + cols) + 1
+            continue
+
+        if not have_header:
+            seen[_NO_HEADER] = get(_NO_HEADER, 0) + 1
+            continue
+
+        parts = line.rstrip(b"\r").split(b"\t", maxsplit)
+        n = len(parts)
+        outcome = parts[rt_i] if 0 <= rt_i < n else b""
+        if not outcome and 0 <= rrt_i < n:
+            outcome = parts[rrt_i]
+        seen[outcome] = get(outcome, 0) + 1
+
+        date, time, edge, uri, tt, ttfb, ip, agent = (parts[i] if 0 <= i < n else b"" for i in cols)
+        add(
+            text(date), text(time), text(edge), text(uri), text(outcome),
+            number(tt) if tt else None, number(ttfb) if ttfb else None, text(ip), text(agent),
+        )
+
+    return seen
+
+def _fold_outcomes(tally: LogTally, seen: Dict[Optional[bytes], int]) -> None:
+    """Decode the fast engine's per-file outcome counts into the tally, like the legacy loop would."""
+    for raw, n in seen.items():
+        if raw is _NO_HEADER:
+            tally.other["(missing_fields_header)"] += n
+            continue
+        outcome = raw.decode("utf-8", "replace")
+        if not outcome:
+            tally.other["(missing_outcome)"] += n
+        elif outcome in TARGETS:
+            tally.counts[outcome] += n
+        else:
+            tally.other[outcome] += n
+
+def count_standard_log_files(sources: List[LogSource], engine: str = DEFAULT_ENGINE) -> Dict[str, int]:
+    """Serial parse of `sources` into the counts dict used by print_report()."""
+    return tally_standard_log_files(sources, engine=engine).to_counts()
+
+def tally_s3_objects(
+    s3,
+    bucket: str,
+    keys: List[str],
+    threads: int = DEFAULT_FETCH_THREADS,
+    keep_dir: Optional[str] = None,
+    engine: str = DEFAULT_ENGINE,
+    analytics: Optional[AnalyticsConfig] = None,
+) -> LogTally:
+    """
+    Fetch and parse `keys` with a bounded thread pool; per-object tallies are merged
+    in key order.
+    """
+    total = LogTally()
+    for _, partial in tally_s3_each(s3, bucket, keys, threads, keep_dir, engine, analytics):
+        total.merge(partial)
+    return total
+
+def tally_s3_each(
+    s3,
+    bucket: str,
+    keys: List[str],
+    threads: int = DEFAULT_FETCH_THREADS,
+    keep_dir: Optional[str] = None,
+    engine: str = DEFAULT_ENGINE,
+    analytics: Optional[AnalyticsConfig] = None,
+) -> Iterator[Tuple[str, LogTally]]:
+    """
+    Yield (key, LogTally) per object, in key order. A bounded thread pool fetches the
+    objects; each thread streams one object straight into the parser.
+    With `keep_dir`, objects are downloaded there first and parsed from disk.
+    """
+    def tally_one(key: str) -> LogTally:
+        try:
+            if keep_dir:
+                dest = os.path.join(keep_dir, os.path.basename(key) or "log")
+                s3.download_file(bucket, key, dest)
+                return tally_standard_log_files([dest], engine=engine, analytics=analytics)
+            return tally_standard_log_files([open_s3_log(s3, bucket, key)], engine=engine, analytics=analytics)
+        except (BotoCoreError, ClientError) as e:
+            raise RuntimeError(f"Failed reading s3://{bucket}/{key}\n{e}")
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        yield from zip(keys, pool.map(tally_one, keys))
+
+def count_s3_objects(
+    s3,
+    bucket: str,
+    keys: List[str],
+    threads: int = DEFAULT_FETCH_THREADS,
+    keep_dir: Optional[str] = None,
+    engine: str = DEFAULT_ENGINE,
+) -> Dict[str, int]:
+    return tally_s3_objects(s3, bucket, keys, threads, keep_dir, engine).to_counts()
+
+def _tally_shard(
+    bucket: Optional[str],
+    items: List[str],
+    fetch_threads: int,
+    keep_dir: Optional[str],
+    engine: str = DEFAULT_ENGINE,
+    analytics: Optional[AnalyticsConfig] = None,
+) -> LogTally:
+    """Worker entry point: `items` are S3 keys, or local paths when bucket is None."""
+    if bucket is None:
+        return tally_standard_log_files(items, engine=engine, analytics=analytics)
+    s3 = make_s3_client(fetch_threads)
+    return tally_s3_objects(s3, bucket, items, fetch_threads, keep_dir, engine, analytics)
+
+def _tally_shard_each(
+    bucket: Optional[str],
+    items: List[str],
+    fetch_threads: int,
+    keep_dir: Optional[str],
+    engine: str = DEFAULT_ENGINE,
+    analytics: Optional[AnalyticsConfig] = None,
+) -> List[Tuple[str, LogTally]]:
+    """Like _tally_shard, but keeps one tally per object (for the incremental manifest)."""
+    if bucket is None:
+        return [(path, tally_standard_log_files([path], engine=engine, analytics=analytics)) for path in items]
+    s3 = make_s3_client(fetch_threads)
+    return list(tally_s3_each(s3, bucket, items, fetch_threads, keep_dir, engine, analytics))
+
+def shard_contiguous(items: List[str], n_shards: int) -> List[List[str]]:
+    """Split into at most n_shards contiguous runs, sizes differing by at most one."""
+    n_shards = max(1, min(n_shards, len(items)))
+    size, extra = divmod(len(items), n_shards)
+    shards, start = [], 0
+    for i in range(n_shards):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(items[start:end])
+        start = end
+    return shards
+
+def tally_sharded(
+    bucket: Optional[str],
+    items: List[str],
+    workers: int,
+    fetch_threads: int = DEFAULT_FETCH_THREADS,
+    keep_dir: Optional[str] = None,
+    deterministic: bool = False,
+    engine: str = DEFAULT_ENGINE,
+    analytics: Optional[AnalyticsConfig] = None,
+) -> LogTally:
+    """
+    Parse `items` (S3 keys, or local paths when bucket is None) across `workers`
+    processes. Each worker returns a LogTally for its shard and the parent reduces them.
+    By default shards are merged as they finish; `deterministic` merges them in shard
+    order so the counts dict is identical (values and key order) to the serial path.
+    """
+    if workers <= 1 or len(items) <= 1:
+        return _tally_shard(bucket, items, fetch_threads, keep_dir, engine, analytics)
+
+    shards = shard_contiguous(items, workers * SHARDS_PER_WORKER)
+    total = LogTally()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_tally_shard, bucket, shard, fetch_threads, keep_dir, engine, analytics) for shard in shards]
+        for fut in (futures if deterministic else as_completed(futures)):
+            total.merge(fut.result())
+    return total
+
+def tally_each_sharded(
+    bucket: Optional[str],
+    items: List[str],
+    workers: int,
+    fetch_threads: int = DEFAULT_FETCH_THREADS,
+    keep_dir: Optional[str] = None,
+    deterministic: bool = False,
+    engine: str = DEFAULT_ENGINE,
+    analytics: Optional[AnalyticsConfig] = None,
+) -> Iterator[Tuple[str, LogTally]]:
+    """
+    Per-object variant of tally_sharded(): yields (item, LogTally) as shards finish,
+    or in item order with `deterministic`.
+    """
+    if workers <= 1 or len(items) <= 1:
+        yield from _tally_shard_each(bucket, items, fetch_threads, keep_dir, engine, analytics)
+        return
+
+    shards = shard_contiguous(items, workers * SHARDS_PER_WORKER)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_tally_shard_each, bucket, shard, fetch_threads, keep_dir, engine, analytics) for shard in shards]
+        for fut in (futures if deterministic else as_completed(futures)):
+            yield from fut.result()
+
+# ---------------------------------------------------------------------------
+# Incremental mode: a local manifest of S3 key -> (ETag, per-object LogTally)
+# ---------------------------------------------------------------------------
+
+# Bump when LogTally.to_dict() changes shape; older manifests are then discarded.
+MANIFEST_VERSION = 4
 
-    return dict(counts)
+def manifest_options(analytics: Optional[AnalyticsConfig]) -> Dict[str, Any]:
+    """What the cached tallies were built with; a manifest is only reused under the same options."""
+    return {"analytics": analytics.to_dict() if analytics else None}
+
+def load_manifest(path: str, bucket: str, prefix: str, options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Load the manifest at `path`. A missing, unreadable, or mismatched (other bucket,
+    prefix, options or version) manifest starts empty, so the run just parses everything.
+    """
+    options = options if options is not None else manifest_options(None)
+    empty = {"version": MANIFEST_VERSION, "bucket": bucket, "prefix": prefix, "options": options, "objects": {}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if (manifest.get("version") != MANIFEST_VERSION
+            or manifest.get("bucket") != bucket
+            or manifest.get("prefix") != prefix
+            or manifest.get("options") != options):
+        return empty
+    manifest.setdefault("objects", {})
+    return manifest
+
+def save_manifest(path: str, manifest: Dict[str, Any]) -> None:
+    """Write atomically (temp file + rename) so a killed cron run cannot corrupt it."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def tally_incremental(
+    bucket: str,
+    objects: List[Dict[str, Any]],
+    manifest: Dict[str, Any],
+    workers: int = 1,
+    fetch_threads: int = DEFAULT_FETCH_THREADS,
+    keep_dir: Optional[str] = None,
+    engine: str = DEFAULT_ENGINE,
+    analytics: Optional[AnalyticsConfig] = None,
+) -> Tuple[LogTally, int]:
+    """
+    Reuse cached tallies for objects whose ETag matches the manifest; fetch and parse
+    only new or changed ones. The manifest is updated in place to hold exactly
+    `objects`, so it never grows past the analyzed window.
+    Returns (merged tally in key order, number of objects parsed this run).
+    """
+    cached = manifest["objects"]
+    stale = [o["key"] for o in objects if cached.get(o["key"], {}).get("etag") != o["etag"]]
+
+    fresh: Dict[str, LogTally] = {}
+    for key, tally in tally_each_sharded(bucket, stale, workers, fetch_threads, keep_dir,
+                                          engine=engine, analytics=analytics):
+        fresh[key] = tally
+
+    total = LogTally()
+    entries = {}
+    for o in objects:
+        key = o["key"]
+        tally = fresh[key] if key in fresh else LogTally.from_dict(cached[key]["tally"])
+        total.merge(tally)
+        entries[key] = {"etag": o["etag"], "tally": tally.to_dict()}
+    manifest["objects"] = entries
+    return total, len(stale)
 
 def print_report(counts: Dict[str, int]) -> None:
     core = {k: counts.get(k, 0) for k in ["Hit", "Miss", "RefreshHit"]}
@@ -162,53 +820,175 @@ def print_report(counts: Dict[str, int]) -> None:
     print("  • RefreshHit means CloudFront revalidated with origin and served cached content (often good).")
     print("=======================================================\n")
 
+def print_tally_extras(tally: LogTally, top: int) -> None:
+    """Heavy hitters (--top-misses) and the analytics tables (--analytics), after the summary."""
+    if tally.analytics is None:
+        return
+    if tally.analytics.heavy is not None:
+        print_heavy_hitters(tally.analytics.heavy, top)
+    if tally.analytics.config.breakdown:
+        print_analytics(tally.analytics, top)
+
+def run_sample(objects: List[Dict[str, Any]], fetch, args: argparse.Namespace) -> None:
+    """--sample: read batches until the error bound or budget is met, with one progress line per batch."""
+    result = None
+    for result in sample_until(objects, fetch, args.error, args.budget, args.confidence,
+                               batch_size=2 * args.fetch_threads, strata=args.strata, seed=args.seed):
+        share, half = result["estimates"]["Hit"]
+        hit = "-" if share is None else f"{share * 100:.1f}%" + ("" if half == float("inf") else f" ±{half * 100:.2f}")
+        print(f"  sampled {result['sampled']}/{result['population']} objects, Hit {hit} ({result['elapsed']:.1f}s)")
+    print_sample_report(result)
+
 def main() -> int:
     ap = argparse.ArgumentParser(description="Count Hit/Miss/RefreshHit from CloudFront standard logs in S3.")
+    ap.add_argument("--files", nargs="+", metavar="PATH", help="Analyze local log files (.gz or plain) instead of listing S3")
     ap.add_argument("--bucket", default="Class_Lab3", help="S3 bucket name (default: Class_Lab3)")
     ap.add_argument("--prefix", default="", help="Optional S3 prefix (folder) where logs live, e.g. cloudfront-logs/")
-    ap.add_argument("--latest", type=int, default=3, help="Download and analyze the latest N log objects (default: 3)")
-    ap.add_argument("--keep", action="store_true", help="Keep downloaded files (default: delete temp files)")
+    ap.add_argument("--latest", type=int, default=None,
+                    help="Analyze the latest N log objects (default: 3; with --since/--until, all objects in range)")
+    ap.add_argument("--since", help="Only logs from this time on: relative (90m, 6h, 2d) or ISO (2025-12-29T14:00, UTC)")
+    ap.add_argument("--until", help="Only logs before this time (same formats as --since)")
+    ap.add_argument("--distribution", action="append", metavar="ID",
+                    help="Distribution ID(s) to read (default: discover all under --prefix); repeatable")
+    ap.add_argument("--keep", action="store_true", help="Also save the log objects to a local temp dir (default: stream in memory only)")
+    ap.add_argument("--fetch-threads", type=int, default=DEFAULT_FETCH_THREADS,
+                    help=f"Concurrent S3 object fetches per process (default: {DEFAULT_FETCH_THREADS})")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Parse in N processes, each handling a shard of the objects (default: 1 = serial)")
+    ap.add_argument("--deterministic", action="store_true",
+                    help="Merge worker results in shard order so output is identical to the serial path")
+    ap.add_argument("--engine", choices=ENGINES, default=DEFAULT_ENGINE,
+                    help="Log parser: 'fast' (bytes, partial split) or 'legacy' (reference text parser)")
+    ap.add_argument("--state", metavar="PATH",
+                    help="Incremental mode: manifest of analyzed objects (key, ETag, counts); "
+                         "only new or changed objects are downloaded")
+    ap.add_argument("--analytics", action="store_true",
+                    help="Also report hit ratio and time-taken/time-to-first-byte p50/p95/p99 per time bucket, "
+                         "edge location and URI")
+    ap.add_argument("--bucket-minutes", type=int, default=1, help="Analytics time-bucket width in minutes (default: 1)")
+    ap.add_argument("--max-uris", type=int, default=DEFAULT_MAX_URIS,
+                    help=f"Busiest URIs tracked by analytics; the rest are grouped (default: {DEFAULT_MAX_URIS})")
+    ap.add_argument("--top-misses", type=int, nargs="?", const=DEFAULT_TOP_K, default=0, metavar="K",
+                    help="Also report the top client IPs, URIs and user agents on Misses and distinct client IPs "
+                         f"per minute, tracking K items per field in fixed memory (default K: {DEFAULT_TOP_K})")
+    ap.add_argument("--top", type=int, default=20, help="Rows per analytics or heavy-hitter table (default: 20, 0 = all)")
+    ap.add_argument("--sample", action="store_true",
+                    help="Estimate Hit/Miss/RefreshHit %% with confidence intervals from a stratified random sample "
+                         "of the objects (all objects under --prefix, or in --since/--until), reading batches "
+                         "until --error or --budget is reached")
+    ap.add_argument("--error", type=float, default=DEFAULT_ERROR,
+                    help=f"--sample: stop once every share is within ± this many percentage points (default: {DEFAULT_ERROR:g})")
+    ap.add_argument("--budget", type=float, default=DEFAULT_BUDGET,
+                    help=f"--sample: stop after this many seconds (default: {DEFAULT_BUDGET:g})")
+    ap.add_argument("--confidence", type=float, default=DEFAULT_CONFIDENCE,
+                    help=f"--sample: confidence level of the intervals (default: {DEFAULT_CONFIDENCE:g})")
+    ap.add_argument("--strata", type=int, default=DEFAULT_STRATA,
+                    help=f"--sample: contiguous time strata the objects are split into (default: {DEFAULT_STRATA})")
+    ap.add_argument("--seed", type=int, default=None, help="--sample: random seed (default: random)")
     args = ap.parse_args()
 
-    # 1) List objects
-    keys = aws_s3_ls_recursive(args.bucket, args.prefix)
-    if not keys:
-        print(f"No objects found in s3://{args.bucket}/{args.prefix}")
-        print("Tip: verify prefix with: aws s3 ls s3://Class_Lab3/ --recursive | head")
-        return 2
-
-    latest_keys = pick_latest(keys, args.latest)
-    print(f"Found {len(keys)} objects. Analyzing latest {len(latest_keys)}:")
-    for k in latest_keys:
-        print(f"  - s3://{args.bucket}/{k}")
-
-    # 2) Download into temp dir
-    tmpdir = tempfile.mkdtemp(prefix="malgus_cf_")
-    downloaded = []
+    now = datetime.now(timezone.utc)
     try:
+        since = parse_when(args.since, now) if args.since else None
+        until = parse_when(args.until, now) if args.until else None
+    except argparse.ArgumentTypeError as e:
+        ap.error(str(e))
+    analytics = None
+    if args.analytics or args.top_misses:
+        if args.engine == "legacy":
+            ap.error("--analytics/--top-misses use the bytes scanner; drop --engine legacy")
+        try:
+            analytics = AnalyticsConfig(args.bucket_minutes, args.max_uris,
+                                        breakdown=args.analytics, top_k=args.top_misses)
+        except ValueError as e:
+            ap.error(str(e))
+    if args.sample:
+        if args.state or analytics:
+            ap.error("--sample estimates outcome shares only; drop --state/--analytics/--top-misses")
+        if not 0 < args.confidence < 1:
+            ap.error("--confidence must be between 0 and 1")
+
+    if args.files and args.sample:
+        objects = [{"key": path, "hour": log_key_hour(path)} for path in args.files]
+        fetch = lambda keys: ((k, t.to_counts()) for k, t in _tally_shard_each(None, keys, 0, None, args.engine))
+        try:
+            run_sample(objects, fetch, args)
+        except OSError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+        return 0
+
+    if args.files:
+        try:
+            tally = tally_sharded(None, args.files, args.workers, deterministic=args.deterministic,
+                                  engine=args.engine, analytics=analytics)
+        except OSError as e:
+            print(str(e), file=sys.stderr)
+            return 1
+        print_report(tally.to_counts())
+        print_tally_extras(tally, args.top)
+        return 0
+
+    try:
+        # 1) List objects: only the requested hours, per distribution
+        s3 = make_s3_client(args.fetch_threads)
+        if args.distribution:
+            dist_prefixes = [f"{args.prefix}{d}." for d in args.distribution]
+        else:
+            dist_prefixes = list_distribution_prefixes(s3, args.bucket, args.prefix)
+
+        if since or until or args.sample:
+            selected = list_log_objects_between(s3, args.bucket, dist_prefixes, since, until, args.fetch_threads)
+            if args.latest is not None:
+                selected = selected[-args.latest:] if args.latest > 0 else []
+            window = f"between {since.isoformat() if since else 'the beginning'} and {until.isoformat() if until else 'now'}"
+        else:
+            n = args.latest if args.latest is not None else 3
+            selected = select_latest(s3, args.bucket, dist_prefixes, n, now, args.fetch_threads)
+            if not selected and not args.distribution:
+                # Keys that don't follow CloudFront's naming: plain listing + key order
+                objects = list_log_objects(s3, args.bucket, args.prefix)
+                by_key = {o["key"]: o for o in objects}
+                selected = [by_key[k] for k in pick_latest(list(by_key), n)]
+            window = f"latest {n}"
+
+        if not selected:
+            print(f"No log objects found in s3://{args.bucket}/{args.prefix} ({window})")
+            print("Tip: verify prefix with: aws s3 ls s3://Class_Lab3/ --recursive | head")
+            return 2
+
+        if args.sample:
+            print(f"Sampling from {len(selected)} objects ({window}) in {len(dist_prefixes)} distribution prefix(es)")
+            fetch = lambda keys: ((k, t.to_counts()) for k, t in tally_s3_each(
+                s3, args.bucket, keys, args.fetch_threads, None, args.engine))
+            run_sample(selected, fetch, args)
+            return 0
+
+        latest_keys = [o["key"] for o in selected]
+        print(f"Analyzing {len(latest_keys)} objects ({window}) from {len(dist_prefixes)} distribution prefix(es):")
         for k in latest_keys:
-            filename = os.path.basename(k) or "log"
-            dest = os.path.join(tmpdir, filename)
-            aws_s3_cp(args.bucket, k, dest)
-            downloaded.append(dest)
+            print(f"  - s3://{args.bucket}/{k}")
+
+        # 2) Stream + parse (objects only touch disk with --keep)
+        keep_dir = tempfile.mkdtemp(prefix="malgus_cf_") if args.keep else None
+        if args.state:
+            manifest = load_manifest(args.state, args.bucket, args.prefix, manifest_options(analytics))
+            tally, parsed = tally_incremental(args.bucket, selected, manifest,
+                                              args.workers, args.fetch_threads, keep_dir, args.engine, analytics)
+            save_manifest(args.state, manifest)
+            print(f"Incremental: parsed {parsed} new/changed, reused {len(latest_keys) - parsed} "
+                  f"from {args.state}")
+        else:
+            tally = tally_sharded(args.bucket, latest_keys, args.workers, args.fetch_threads, keep_dir,
+                                  args.deterministic, args.engine, analytics)
+        counts = tally.to_counts()
 
-        # 3) Parse + report
-        counts = count_standard_log_files(downloaded)
+        # 3) Report
         print_report(counts)
+        print_tally_extras(tally, args.top)
 
-        if args.keep:
-            print(f"Kept downloaded files in: {tmpdir}")
-        else:
-            # cleanup
-            for p in downloaded:
-                try:
-                    os.remove(p)
-                except OSError:
-                    pass
-            try:
-                os.rmdir(tmpdir)
-            except OSError:
-                pass
+        if keep_dir:
+            print(f"Kept downloaded files in: {keep_dir}")
 
         return 0
     except RuntimeError as e:
@@ -219,4 +999,4 @@ def main() -> int:
         return 1
 
 if __name__ == "__main__":
-    raise SystemExit(main())
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+Lab 3B — CloudTrail Change-Trail Collector
+==========================================
+Purpose: Fetch the WHOLE CloudTrail event-history window for the audit package,
+not just the first page of LookupEvents.
+
+- The window is cut into hour-aligned time slices (same boundaries every run),
+  fetched in parallel per region and paginated with NextToken to the end.
+- One token bucket per region keeps LookupEvents under its 2 requests/second limit.
+- Slices are half-open [start, end): an event stamped on a boundary is counted once.
+- Global-service events (IAM, STS, CloudFront, Route 53, ...) show up in the event
+  history of several regions; they are counted once, by EventId, remembered only
+  for the slices still being read.
+- A slice that fails (throttled, denied) is reported in slice_coverage and makes the
+  result incomplete; the other slices and regions carry on.
+- Pages stream into a summary (event counts + the latest critical events), so
+  memory does not grow with the number of events.
+- With an EvidenceCache, final slices (complete, ended more than SLICE_SETTLE ago)
+  are stored as their contribution to the summary (SliceContribution) and replayed
+  on later runs instead of fetched again.
+"""
+
+import argparse
+import heapq
+import json
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from malgus_aws import get_client
+from malgus_evidence_cache import SLICE_SETTLE
+
+LOOKUP_EVENTS_TPS = 2.0
+DEFAULT_SLICE_HOURS = 6
+DEFAULT_THREADS_PER_REGION = 4
+MAX_CRITICAL_EVENTS = 20
+
+CRITICAL_KEYWORDS = ['delete', 'modify', 'update', 'create', 'authorize', 'revoke']
+
+# Services whose events are recorded as global and can appear in more than one region's history.
+GLOBAL_EVENT_SOURCES = {
+    "iam.amazonaws.com",
+    "sts.amazonaws.com",
+    "signin.amazonaws.com",
+    "cloudfront.amazonaws.com",
+    "route53.amazonaws.com",
+    "organizations.amazonaws.com",
+    "waf.amazonaws.com",
+    "globalaccelerator.amazonaws.com",
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, cancel=None):
+        """Take one token; returns False if `cancel` (threading.Event) is set while waiting."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if cancel is not None:
+                if cancel.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+def time_slices(start, end, hours=DEFAULT_SLICE_HOURS):
+    """
+    [start, end) cut at UTC boundaries that are multiples of `hours` (1, 2, 3, 4, 6, 8,
+    12 or 24), newest slice first. Interior slices therefore cover identical ranges on
+    every run, which lets a cache reuse them.
+    """
+    if hours not in (1, 2, 3, 4, 6, 8, 12, 24):
+        raise ValueError("slice hours must divide 24")
+    step = timedelta(hours=hours)
+    t = start.replace(minute=0, second=0, microsecond=0)
+    t -= timedelta(hours=t.hour % hours)
+    slices = []
+    while t < end:
+        slices.append((max(t, start), min(t + step, end)))
+        t += step
+    return slices[::-1]
+
+
+def _slice_bounds(start, hours):
+    """Full hour-aligned slice containing `start`."""
+    aligned = start.replace(minute=0, second=0, microsecond=0)
+    aligned -= timedelta(hours=aligned.hour % hours)
+    return aligned, aligned + timedelta(hours=hours)
+
+
+def _naive_utc(t):
+    return t.astimezone(timezone.utc).replace(tzinfo=None) if t.tzinfo else t
+
+
+def _is_global(event):
+    return event.get('EventSource') in GLOBAL_EVENT_SOURCES and bool(event.get('EventId'))
+
+
+def _critical_entry(event, region):
+    """(event_time, event_id, record) for a critical security event, else None."""
+    event_name = event.get('EventName', 'Unknown')
+    if not any(keyword in event_name.lower() for keyword in CRITICAL_KEYWORDS):
+        return None
+    event_time = event.get('EventTime').isoformat() if event.get('EventTime') else ''
+    return (event_time, event.get('EventId', ''), {
+        "event_name": event_name,
+        "event_time": event_time,
+        "username": event.get('Username', 'Unknown'),
+        "source_ip": event.get('SourceIPAddress', 'N/A'),
+        "resource_name": event.get('Resources', [{}])[0].get('ResourceName', 'N/A') if event.get('Resources') else 'N/A',
+        "region": region
+    })
+
+
+def _keep_latest(heap, entry, limit):
+    """Push onto a min-heap of critical entries that holds the `limit` latest ones."""
+    if len(heap) < limit:
+        heapq.heappush(heap, entry)
+    elif entry[:2] > heap[0][:2]:
+        heapq.heapreplace(heap, entry)
+
+
+class SliceContribution:
+    """
+    What one slice of one region adds to a ChangeTrailSummary, small enough to cache:
+    event counts by name, the slice's latest critical events, and its global-service
+    events as (EventId, name, critical entry), since those still need the cross-region
+    dedup when replayed. Plain JSON via to_dict() / from_dict().
+    """
+
+    def __init__(self, max_critical=MAX_CRITICAL_EVENTS):
+        self.max_critical = max_critical
+        self.total = 0
+        self.critical_total = 0
+        self.event_summary = defaultdict(int)
+        self.critical = []
+        self.global_events = []
+
+    def add(self, region, events):
+        for event in events:
+            entry = _critical_entry(event, region)
+            event_name = event.get('EventName', 'Unknown')
+            if _is_global(event):
+                self.global_events.append((event['EventId'], event_name, entry))
+                continue
+            self.total += 1
+            self.event_summary[event_name] += 1
+            if entry:
+                self.critical_total += 1
+                _keep_latest(self.critical, entry, self.max_critical)
+
+    def to_dict(self):
+        return {
+            "total": self.total,
+            "event_summary": dict(self.event_summary),
+            "critical_total": self.critical_total,
+            "critical": [list(e) for e in self.critical],
+            "global": [[event_id, name, list(entry) if entry else None] for event_id, name, entry in self.global_events],
+        }
+
+    @classmethod
+    def from_dict(cls, data, max_critical=MAX_CRITICAL_EVENTS):
+        contribution = cls(max_critical)
+        contribution.total = data["total"]
+        contribution.critical_total = data["critical_total"]
+        contribution.event_summary.update(data["event_summary"])
+        contribution.critical = [tuple(e) for e in data["critical"]]
+        contribution.global_events = [(event_id, name, tuple(entry) if entry else None)
+                                      for event_id, name, entry in data["global"]]
+        return contribution
+
+
+class ChangeTrailSummary:
+    """
+    Streaming aggregate of LookupEvents pages from many threads and regions.
+
+    A global-service event shows up with the same EventId and EventTime in several
+    regions, so it always falls into the same time slice: EventIds are remembered per
+    slice only, and dropped once every region finished that slice (finish_window).
+    """
+
+    def __init__(self, max_critical=MAX_CRITICAL_EVENTS, regions=1):
+        self.lock = threading.Lock()
+        self.total_events = 0
+        self.duplicates_removed = 0
+        self.critical_total = 0
+        self.event_summary = defaultdict(int)
+        self.by_region = defaultdict(int)
+        self.max_critical = max_critical
+        # min-heap of (event_time, event_id, record): keeps the latest critical events
+        self._critical = []
+        self.regions = regions
+        # window -> global EventIds seen in it / regions done with it
+        self._global_ids = {}
+        self._windows_done = defaultdict(int)
+
+    def _count(self, region, event_name, entry):
+        self.total_events += 1
+        self.by_region[region] += 1
+        self.event_summary[event_name] += 1
+        # Flag critical security events
+        if entry:
+            self.critical_total += 1
+            _keep_latest(self._critical, entry, self.max_critical)
+
+    def _first_seen(self, global_ids, event_id):
+        if event_id in global_ids:
+            self.duplicates_removed += 1
+            return False
+        global_ids.add(event_id)
+        return True
+
+    def add_events(self, region, events, window=None):
+        with self.lock:
+            global_ids = self._global_ids.setdefault(window, set())
+            for event in events:
+                if _is_global(event) and not self._first_seen(global_ids, event['EventId']):
+                    continue
+                self._count(region, event.get('EventName', 'Unknown'), _critical_entry(event, region))
+
+    def add_contribution(self, region, contribution, window=None):
+        """Replay a cached SliceContribution as if its events had been added again."""
+        with self.lock:
+            global_ids = self._global_ids.setdefault(window, set())
+            self.total_events += contribution.total
+            self.by_region[region] += contribution.total
+            for event_name, count in contribution.event_summary.items():
+                self.event_summary[event_name] += count
+            self.critical_total += contribution.critical_total
+            for entry in contribution.critical:
+                _keep_latest(self._critical, entry, self.max_critical)
+            for event_id, event_name, entry in contribution.global_events:
+                if self._first_seen(global_ids, event_id):
+                    self._count(region, event_name, entry)
+
+    def finish_window(self, window):
+        """One region is done with `window`; after the last one its EventIds are dropped."""
+        with self.lock:
+            self._windows_done[window] += 1
+            if self._windows_done[window] >= self.regions:
+                self._global_ids.pop(window, None)
+                del self._windows_done[window]
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "total_events": self.total_events,
+                "events_by_region": dict(self.by_region),
+                "duplicates_removed": self.duplicates_removed,
+                "event_summary": dict(sorted(self.event_summary.items(), key=lambda kv: (-kv[1], kv[0]))),
+                "critical_events_total": self.critical_total,
+                "critical_events": [e[2] for e in sorted(self._critical, key=lambda e: e[:2], reverse=True)],
+            }
+
+
+class CloudTrailCollector:
+    """
+    Full-window LookupEvents collector for several regions into one ChangeTrailSummary.
+    collect_region() is safe to run for different regions at the same time; cancel()
+    stops every region after the request in flight.
+    """
+
+    def __init__(self, regions, start, end, profile=None, slice_hours=DEFAULT_SLICE_HOURS,
+                 threads_per_region=DEFAULT_THREADS_PER_REGION, tps=LOOKUP_EVENTS_TPS, client_options=None, cache=None):
+        self.regions = list(regions)
+        self.start = start
+        self.end = end
+        self.profile = profile
+        self.slice_hours = slice_hours
+        self.threads_per_region = threads_per_region
+        self.tps = tps
+        # botocore Config options for the shared client (see malgus_aws.get_client)
+        self.client_options = client_options or {"retries": {"max_attempts": 8, "mode": "adaptive"}}
+        self.cache = cache
+        self.summary = ChangeTrailSummary(regions=len(self.regions))
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.slices = {region: {"total": 0, "complete": 0, "cached": 0, "failed": 0, "api_calls": 0, "errors": []}
+                       for region in self.regions}
+
+    def cancel(self):
+        self.stop.set()
+
+    def fetch_slice(self, client, bucket, region, start, end, contribution=None):
+        """
+        Page through the slice [start, end) to the last NextToken; returns True if it was
+        read completely. LookupEvents' EndTime is inclusive, so events stamped exactly
+        `end` are left to the next slice (whose StartTime it is). The events are also
+        added to `contribution` (a SliceContribution) if given.
+        """
+        kwargs = {"StartTime": start, "EndTime": end, "MaxResults": 50}
+        cutoff = _naive_utc(end)
+        while True:
+            if self.stop.is_set() or not bucket.acquire(self.stop):
+                return False
+            page = client.lookup_events(**kwargs)
+            with self.lock:
+                self.slices[region]["api_calls"] += 1
+            events = [e for e in page.get('Events', [])
+                      if not e.get('EventTime') or _naive_utc(e['EventTime']) < cutoff]
+            self.summary.add_events(region, events, (start, end))
+            if contribution is not None:
+                contribution.add(region, events)
+            token = page.get('NextToken')
+            if not token:
+                return True
+            kwargs["NextToken"] = token
+
+    def read_slice(self, client, bucket, region, start, end):
+        """
+        One slice from the cache when it is a full aligned slice stored earlier, else from
+        the API. The clipped oldest slice of the window is always fetched: a cached
+        contribution cannot be cut down to part of its slice.
+        """
+        full = (start, end) == _slice_bounds(start, self.slice_hours)
+        if self.cache is not None and full:
+            cached = self.cache.get_slice(region, start, end)
+            if cached is not None:
+                contribution = SliceContribution.from_dict(cached, self.summary.max_critical)
+                self.summary.add_contribution(region, contribution, (start, end))
+                with self.lock:
+                    self.slices[region]["cached"] += 1
+                return True
+        final = self.cache is not None and full and end <= datetime.utcnow() - SLICE_SETTLE
+        contribution = SliceContribution(self.summary.max_critical) if final else None
+        if not self.fetch_slice(client, bucket, region, start, end, contribution):
+            return False
+        if final:
+            self.cache.put_slice(region, start, end, contribution.to_dict())
+        return True
+
+    def collect_region(self, region):
+        """Fetch every slice of the window in `region`, newest first; returns that region's coverage."""
+        client = get_client('cloudtrail', region, self.profile, **self.client_options)
+        bucket = TokenBucket(self.tps)
+        slices = time_slices(self.start, self.end, self.slice_hours)
+        with self.lock:
+            self.slices[region]["total"] = len(slices)
+
+        def one(window):
+            # A throttled or denied slice is reported as missing coverage, the others go on
+            try:
+                done = self.read_slice(client, bucket, region, *window)
+            except Exception as e:
+                done = False
+                with self.lock:
+                    self.slices[region]["failed"] += 1
+                    if len(self.slices[region]["errors"]) < 5:
+                        self.slices[region]["errors"].append(f"{window[0].isoformat()}Z: {type(e).__name__}: {e}")
+            finally:
+                self.summary.finish_window(window)
+            if done:
+                with self.lock:
+                    self.slices[region]["complete"] += 1
+
+        with ThreadPoolExecutor(max_workers=max(1, self.threads_per_region)) as pool:
+            list(pool.map(one, slices))
+        return self.coverage()[region]
+
+    def coverage(self):
+        with self.lock:
+            return {region: dict(c, errors=list(c["errors"])) for region, c in self.slices.items()}
+
+    def to_proof(self):
+        """change_trail proof body: summary plus window and per-region slice coverage."""
+        proof = self.summary.to_dict()
+        coverage = self.coverage()
+        proof["time_range"] = {
+            "start": self.start.isoformat() + "Z",
+            "end": self.end.isoformat() + "Z"
+        }
+        proof["regions"] = self.regions
+        proof["slice_hours"] = self.slice_hours
+        proof["slice_coverage"] = coverage
+        proof["complete"] = all(c["total"] and c["complete"] == c["total"] for c in coverage.values())
+        return proof
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize the full CloudTrail event history window")
+    parser.add_argument("--regions", nargs="+", default=["ap-northeast-1", "sa-east-1"])
+    parser.add_argument("--days", type=float, default=7, help="Window length in days (default: 7)")
+    parser.add_argument("--slice-hours", type=int, default=DEFAULT_SLICE_HOURS,
+                        help=f"Hour-aligned slice length (default: {DEFAULT_SLICE_HOURS})")
+    parser.add_argument("--threads", type=int, default=DEFAULT_THREADS_PER_REGION,
+                        help=f"Concurrent slices per region (default: {DEFAULT_THREADS_PER_REGION})")
+    args = parser.parse_args()
+
+    end_time = datetime.utcnow()
+    collector = CloudTrailCollector(args.regions, end_time - timedelta(days=args.days), end_time,
+                                    slice_hours=args.slice_hours, threads_per_region=args.threads)
+    with ThreadPoolExecutor(max_workers=len(args.regions)) as pool:
+        list(pool.map(collector.collect_region, args.regions))
+    print(json.dumps(collector.to_proof(), indent=2))
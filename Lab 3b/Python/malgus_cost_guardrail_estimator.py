@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-import boto3
 from datetime import datetime, timezone, timedelta
 
+from malgus_aws import get_client
+
 # Reason why Darth Malgus would be pleased with this script.
 # Malgus enjoys crushing enemies—but he hates wasting credits on sloppy operations.
 
@@ -12,7 +13,7 @@ from datetime import datetime, timezone, timedelta
 # "I wrote a lightweight guardrail that flags risky operational actions (like over-broad invalidations)
 #  and correlates them with traffic/log surges."
 
-cf = boto3.client("cloudfront")
+cf = get_client("cloudfront")
 
 def main():
     # Students provide distribution id
@@ -4,18 +4,52 @@ Lab 3B — Enhanced Data Residency Proof
 ========================================
 Purpose: Prove that PHI data resides ONLY in Tokyo (ap-northeast-1)
 Compliance: APPI (Japan's Act on the Protection of Personal Information)
+
+Every listing is paginated to the end, and every (region, resource type) pair is
+scanned in parallel across all regions enabled for the account:
+RDS instances and snapshots, Aurora clusters and cluster snapshots, automated
+backups, DynamoDB tables (with their global table replicas) and EBS snapshots.
+Results are folded into compliance_check as they arrive, so the assertion covers
+the whole estate; a listing that failed makes the proof INCOMPLETE, never PASS.
+
+Audit buckets are inspected in parallel (location, default encryption, versioning,
+object lock, lifecycle). Bucket regions never change, so they are kept in
+malgus_bucket_regions.json and only looked up for new buckets.
+
+Usage:
+    python3 malgus_data_residency_enhanced.py
+    python3 malgus_data_residency_enhanced.py --regions ap-northeast-1 sa-east-1 us-east-1
 """
 
-import boto3
+import argparse
 import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
-def list_rds(region):
+from malgus_aws import enabled_regions, get_client
+from malgus_evidence_cache import DEFAULT_BUCKET_REGION_PATH, BucketRegionCache
+
+HOME_REGION = "ap-northeast-1"
+DEFAULT_SCAN_WORKERS = 32
+DEFAULT_TABLE_WORKERS = 8
+DEFAULT_BUCKET_WORKERS = 32
+AUDIT_BUCKET_KEYWORDS = ['cloudtrail', 'flowlog', 'cloudfront', 'waf', 'audit']
+LAB_REGIONS = ["ap-northeast-1", "sa-east-1"]
+
+def _pages(client, operation, key, **kwargs):
+    """Every item of a paginated listing"""
+    for page in client.get_paginator(operation).paginate(**kwargs):
+        yield from page.get(key, [])
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, "isoformat") else (value or "unknown")
+
+def list_rds(region, profile=None):
     """List all RDS instances in a region"""
-    rds = boto3.client("rds", region_name=region)
-    resp = rds.describe_db_instances()
+    rds = get_client("rds", region, profile)
     out = []
-    for d in resp.get("DBInstances", []):
+    for d in _pages(rds, "describe_db_instances", "DBInstances"):
         out.append({
             "region": region,
             "id": d["DBInstanceIdentifier"],
@@ -27,57 +61,308 @@ def list_rds(region):
         })
     return out
 
-def list_rds_snapshots(region):
+def list_rds_snapshots(region, profile=None):
     """List RDS snapshots to verify backup location"""
-    rds = boto3.client("rds", region_name=region)
-    try:
-        resp = rds.describe_db_snapshots(MaxRecords=20)
-        return [{
-            "snapshot_id": s["DBSnapshotIdentifier"],
-            "region": region,
-            "encrypted": s.get("Encrypted", False),
-            "created": s.get("SnapshotCreateTime", "").isoformat() if s.get("SnapshotCreateTime") else "unknown"
-        } for s in resp.get("DBSnapshots", [])]
-    except:
+    rds = get_client("rds", region, profile)
+    return [{
+        "snapshot_id": s["DBSnapshotIdentifier"],
+        "id": s["DBSnapshotIdentifier"],
+        "region": region,
+        "db_instance": s.get("DBInstanceIdentifier"),
+        "type": s.get("SnapshotType"),
+        "encrypted": s.get("Encrypted", False),
+        "created": _iso(s.get("SnapshotCreateTime"))
+    } for s in _pages(rds, "describe_db_snapshots", "DBSnapshots")]
+
+def list_aurora_clusters(region, profile=None):
+    """Aurora (and other RDS-API) DB clusters in a region"""
+    rds = get_client("rds", region, profile)
+    return [{
+        "id": c["DBClusterIdentifier"],
+        "region": region,
+        "engine": c.get("Engine", "unknown"),
+        "multi_az": c.get("MultiAZ", False),
+        "encrypted": c.get("StorageEncrypted", False),
+        "global_cluster": c.get("GlobalClusterIdentifier"),
+        "replication_source": c.get("ReplicationSourceIdentifier")
+    } for c in _pages(rds, "describe_db_clusters", "DBClusters")]
+
+def list_aurora_cluster_snapshots(region, profile=None):
+    """DB cluster snapshots (manual, automated, shared) in a region"""
+    rds = get_client("rds", region, profile)
+    return [{
+        "id": s["DBClusterSnapshotIdentifier"],
+        "region": region,
+        "cluster": s.get("DBClusterIdentifier"),
+        "type": s.get("SnapshotType"),
+        "encrypted": s.get("StorageEncrypted", False),
+        "created": _iso(s.get("SnapshotCreateTime"))
+    } for s in _pages(rds, "describe_db_cluster_snapshots", "DBClusterSnapshots")]
+
+def list_automated_backups(region, profile=None):
+    """Retained and replicated automated backups of instances and clusters stored in a region"""
+    rds = get_client("rds", region, profile)
+    instances = [{
+        "id": b.get("DBInstanceAutomatedBackupsArn") or b.get("DBInstanceIdentifier"),
+        "region": region,
+        "source": b.get("DBInstanceIdentifier"),
+        "source_region": b.get("Region"),
+        "kind": "instance",
+        "status": b.get("Status"),
+        "encrypted": b.get("Encrypted", False)
+    } for b in _pages(rds, "describe_db_instance_automated_backups", "DBInstanceAutomatedBackups")]
+    clusters = [{
+        "id": b.get("DBClusterAutomatedBackupsArn") or b.get("DBClusterIdentifier"),
+        "region": region,
+        "source": b.get("DBClusterIdentifier"),
+        "source_region": b.get("Region"),
+        "kind": "cluster",
+        "status": b.get("Status"),
+        "encrypted": b.get("StorageEncrypted", False)
+    } for b in _pages(rds, "describe_db_cluster_automated_backups", "DBClusterAutomatedBackups")]
+    return instances + clusters
+
+def _legacy_global_tables(dynamodb):
+    """Replica regions of version 2017.11.29 global tables (list_global_tables has no paginator)"""
+    replicas, kwargs = {}, {}
+    while True:
+        resp = dynamodb.list_global_tables(**kwargs)
+        for t in resp.get("GlobalTables", []):
+            replicas[t["GlobalTableName"]] = [r["RegionName"] for r in t.get("ReplicationGroup", [])]
+        if not resp.get("LastEvaluatedGlobalTableName"):
+            return replicas
+        kwargs = {"ExclusiveStartGlobalTableName": resp["LastEvaluatedGlobalTableName"]}
+
+def list_dynamodb_tables(region, profile=None):
+    """DynamoDB tables in a region with the regions their global table replicas live in"""
+    dynamodb = get_client("dynamodb", region, profile)
+    names = list(_pages(dynamodb, "list_tables", "TableNames"))
+    if not names:
         return []
+    legacy = _legacy_global_tables(dynamodb)
+
+    def describe(name):
+        table = dynamodb.describe_table(TableName=name)["Table"]
+        replicas = [r["RegionName"] for r in table.get("Replicas", [])] or legacy.get(name, [])
+        return {
+            "id": name,
+            "region": region,
+            "global_table_version": table.get("GlobalTableVersion") or ("2017.11.29" if name in legacy else None),
+            "replica_regions": sorted(set(replicas) - {region}),
+            "encrypted": table.get("SSEDescription", {}).get("Status") == "ENABLED",
+            "items": table.get("ItemCount", 0)
+        }
+
+    with ThreadPoolExecutor(max_workers=min(DEFAULT_TABLE_WORKERS, len(names))) as pool:
+        return list(pool.map(describe, names))
+
+def list_ebs_snapshots(region, profile=None):
+    """EBS snapshots owned by the account in a region"""
+    ec2 = get_client("ec2", region, profile)
+    return [{
+        "id": s["SnapshotId"],
+        "region": region,
+        "volume": s.get("VolumeId"),
+        "encrypted": s.get("Encrypted", False),
+        "size_gib": s.get("VolumeSize"),
+        "created": _iso(s.get("StartTime"))
+    } for s in _pages(ec2, "describe_snapshots", "Snapshots", OwnerIds=["self"],
+                      PaginationConfig={"PageSize": 1000})]
+
+# Resource type -> fn(region, profile); every item carries "id" and "region"
+RESIDENCY_COLLECTORS = OrderedDict([
+    ("rds_instances", list_rds),
+    ("rds_snapshots", list_rds_snapshots),
+    ("aurora_clusters", list_aurora_clusters),
+    ("aurora_cluster_snapshots", list_aurora_cluster_snapshots),
+    ("automated_backups", list_automated_backups),
+    ("dynamodb_tables", list_dynamodb_tables),
+    ("ebs_snapshots", list_ebs_snapshots),
+])
+
+def scan_residency(regions, profile=None, collectors=RESIDENCY_COLLECTORS, workers=DEFAULT_SCAN_WORKERS):
+    """Yield (region, resource type, outcome) for every pair as soon as its listing finishes"""
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(fn, region, profile): (region, kind)
+                   for region in regions for kind, fn in collectors.items()}
+        for future in as_completed(futures):
+            region, kind = futures[future]
+            try:
+                yield region, kind, {"status": "ok", "result": future.result()}
+            except Exception as e:
+                yield region, kind, {"status": "error", "error": f"{type(e).__name__}: {e}"}
+
+class ResidencyScan:
+    """Residency assertions kept up to date while scan results arrive"""
+
+    def __init__(self, home_region=HOME_REGION):
+        self.home_region = home_region
+        self.resources = {}
+        self.outside = {kind: [] for kind in RESIDENCY_COLLECTORS}
+        self.errors = []
+
+    def add(self, region, kind, outcome):
+        if outcome["status"] != "ok":
+            self.errors.append({"region": region, "resource_type": kind, "error": outcome["error"]})
+            return
+        self.resources.setdefault(region, {})[kind] = outcome["result"]
+        for item in outcome["result"]:
+            stray = [r for r in [region] + item.get("replica_regions", []) if r != self.home_region]
+            self.outside.setdefault(kind, []).extend(f"{r}:{item['id']}" for r in stray)
+
+    def count(self, kind, home=True):
+        return sum(len(kinds.get(kind, [])) for region, kinds in self.resources.items()
+                   if (region == self.home_region) == home)
+
+    def compliance_check(self):
+        outside = {kind: sorted(set(ids)) for kind, ids in self.outside.items() if ids}
+        home_has_db = self.count("rds_instances") + self.count("aurora_clusters") > 0
+        if outside:
+            assertion = "FAIL ❌"
+        elif self.errors:
+            assertion = "INCOMPLETE ⚠️"
+        else:
+            assertion = "PASS ✅" if home_has_db else "FAIL ❌"
+        return {
+            "home_region": self.home_region,
+            "regions_scanned": len(self.resources),
+            "resources_scanned": {kind: self.count(kind) + self.count(kind, False) for kind in RESIDENCY_COLLECTORS},
+            "home_region_has_database": home_has_db,
+            "outside_home_region": outside,
+            "scan_errors": self.errors,
+            "complete": not self.errors,
+            "assertion": assertion
+        }
 
-def check_s3_audit_buckets():
-    """Check S3 bucket locations for audit/logging buckets"""
-    s3 = boto3.client('s3')
+def _list_buckets(s3):
+    """Every bucket; list_buckets only pages (ContinuationToken) on large accounts"""
+    kwargs = {}
+    while True:
+        resp = s3.list_buckets(**kwargs)
+        yield from resp.get('Buckets', [])
+        if not resp.get('ContinuationToken'):
+            return
+        kwargs = {'ContinuationToken': resp['ContinuationToken']}
+
+def _error_code(e):
+    return getattr(e, "response", {}).get("Error", {}).get("Code") or type(e).__name__
+
+def inspect_bucket(bucket, cache, home_region=HOME_REGION, profile=None):
+    """Location (cached), default encryption, versioning, object lock and lifecycle of one bucket"""
+    name, created = bucket['Name'], bucket.get('CreationDate')
+    region = bucket.get('BucketRegion') or cache.get(name, created)
+    if region is None:
+        location = get_client('s3', profile=profile).get_bucket_location(Bucket=name)
+        region = {None: 'us-east-1', 'EU': 'eu-west-1'}.get(location.get('LocationConstraint'),
+                                                           location.get('LocationConstraint'))
+    cache.put(name, created, region)
+
+    s3 = get_client('s3', region, profile)
+    settings, errors = {}, {}
+    for key, call, missing in (
+        ("encryption", s3.get_bucket_encryption, 'ServerSideEncryptionConfigurationNotFoundError'),
+        ("versioning", s3.get_bucket_versioning, None),
+        ("object_lock", s3.get_object_lock_configuration, 'ObjectLockConfigurationNotFoundError'),
+        ("lifecycle", s3.get_bucket_lifecycle_configuration, 'NoSuchLifecycleConfiguration'),
+    ):
+        try:
+            settings[key] = call(Bucket=name)
+        except Exception as e:
+            if _error_code(e) != missing:
+                errors[key] = _error_code(e)
+            settings[key] = {}
+
+    rules = settings["encryption"].get('ServerSideEncryptionConfiguration', {}).get('Rules', [])
+    algorithms = [r.get('ApplyServerSideEncryptionByDefault', {}).get('SSEAlgorithm') for r in rules]
+    lock = settings["object_lock"].get('ObjectLockConfiguration', {})
+    result = {
+        "bucket_name": name,
+        "region": region,
+        "compliant": region == home_region,
+        "encryption": next((a for a in algorithms if a), None),
+        "versioning": settings["versioning"].get('Status', 'Disabled'),
+        "object_lock": lock.get('ObjectLockEnabled') == 'Enabled',
+        "object_lock_retention": lock.get('Rule', {}).get('DefaultRetention'),
+        "lifecycle_rules": len(settings["lifecycle"].get('Rules', []))
+    }
+    if errors:
+        result["errors"] = errors
+    return result
+
+def check_s3_audit_buckets(profile=None, home_region=HOME_REGION, cache_path=DEFAULT_BUCKET_REGION_PATH,
+                           workers=DEFAULT_BUCKET_WORKERS):
+    """
+    Check S3 bucket locations and settings for audit/logging buckets, in parallel.
+    A failed bucket listing is raised; a bucket that could not be inspected in full
+    carries its "errors".
+    """
+    s3 = get_client('s3', profile=profile)
+    cache = BucketRegionCache(cache_path)
+    buckets = list(_list_buckets(s3))
+    candidates = [b for b in buckets if any(keyword in b['Name'].lower() for keyword in AUDIT_BUCKET_KEYWORDS)]
+
+    def inspect(bucket):
+        try:
+            return inspect_bucket(bucket, cache, home_region, profile)
+        except Exception as e:
+            return {"bucket_name": bucket['Name'], "region": "unknown", "compliant": False,
+                    "errors": {"location": _error_code(e)}}
+
+    audit_buckets = []
+    if candidates:
+        with ThreadPoolExecutor(max_workers=min(workers, len(candidates))) as pool:
+            audit_buckets = list(pool.map(inspect, candidates))
+    cache.save([b['Name'] for b in buckets])
+    return audit_buckets
+
+def build_data_residency_proof(regions=None, profile=None, home_region=HOME_REGION,
+                               workers=DEFAULT_SCAN_WORKERS, on_result=None,
+                               bucket_cache=DEFAULT_BUCKET_REGION_PATH):
+    """
+    Data residency evidence document (also used by malgus_orchestrator.py).
+    regions=None scans every enabled region; on_result(region, kind, outcome, scan)
+    is called as each listing finishes. bucket_cache=None keeps bucket regions in
+    memory only.
+    """
+    scan = ResidencyScan(home_region)
+    if regions is None:
+        try:
+            regions = enabled_regions(profile)
+        except Exception as e:
+            # Only the lab regions can be scanned: the proof is INCOMPLETE, never PASS
+            regions = LAB_REGIONS
+            scan.errors.append({"region": None, "resource_type": "enabled_regions",
+                                "error": f"{type(e).__name__}: {e}"})
+    regions = sorted(set(regions) | set(LAB_REGIONS))
+    for region, kind, outcome in scan_residency(regions, profile, workers=workers):
+        scan.add(region, kind, outcome)
+        if on_result:
+            on_result(region, kind, outcome, scan)
+    # Audit buckets that could not be listed or inspected leave the proof INCOMPLETE, never PASS
     try:
-        buckets = s3.list_buckets()
-        audit_buckets = []
-        
-        for bucket in buckets['Buckets']:
-            bucket_name = bucket['Name']
-            if any(keyword in bucket_name.lower() for keyword in 
-                   ['cloudtrail', 'flowlog', 'cloudfront', 'waf', 'audit']):
-                try:
-                    location = s3.get_bucket_location(Bucket=bucket_name)
-                    region = location['LocationConstraint'] or 'us-east-1'
-                    audit_buckets.append({
-                        "bucket_name": bucket_name,
-                        "region": region,
-                        "compliant": region == 'ap-northeast-1'
-                    })
-                except:
-                    pass
-        
-        return audit_buckets
-    except:
-        return []
+        audit_buckets = check_s3_audit_buckets(profile, home_region, bucket_cache)
+    except Exception as e:
+        audit_buckets = None
+        scan.errors.append({"region": None, "resource_type": "audit_buckets",
+                            "error": f"{type(e).__name__}: {e}"})
+    for bucket in audit_buckets or []:
+        if bucket.get("errors"):
+            scan.errors.append({"region": bucket["region"], "resource_type": "audit_bucket",
+                                "error": f"{bucket['bucket_name']}: " +
+                                         ", ".join(f"{k} {v}" for k, v in sorted(bucket["errors"].items()))})
+    return assemble_data_residency_proof(scan, audit_buckets)
 
-def main():
-    print("=" * 80)
-    print("Lab 3B — Data Residency Proof Generator")
-    print("APPI Compliance Evidence")
-    print("=" * 80)
-    
-    tokyo = list_rds("ap-northeast-1")
-    sp    = list_rds("sa-east-1")
-    tokyo_snapshots = list_rds_snapshots("ap-northeast-1")
-    sp_snapshots = list_rds_snapshots("sa-east-1")
-    audit_buckets = check_s3_audit_buckets()
+def assemble_data_residency_proof(scan, audit_buckets):
+    """
+    Evidence document from a finished ResidencyScan (live or declared, see
+    malgus_terraform_proof.py); audit_buckets=None means they could not be listed.
+    """
+    def lab(region, kind):
+        return scan.resources.get(region, {}).get(kind, [])
+
+    tokyo, sp = lab("ap-northeast-1", "rds_instances"), lab("sa-east-1", "rds_instances")
+    tokyo_snapshots, sp_snapshots = lab("ap-northeast-1", "rds_snapshots"), lab("sa-east-1", "rds_snapshots")
+    check = scan.compliance_check()
 
     evidence = {
         "timestamp": datetime.utcnow().isoformat() + "Z",
@@ -85,20 +370,50 @@ def main():
         "proof_type": "data_residency",
         "rds_instances": {"tokyo": tokyo, "saopaulo": sp},
         "rds_snapshots": {"tokyo": tokyo_snapshots, "saopaulo": sp_snapshots},
-        "audit_s3_buckets": audit_buckets,
-        "compliance_check": {
+        "resources_by_region": scan.resources,
+        "audit_s3_buckets": audit_buckets or [],
+        "compliance_check": dict({
             "tokyo_has_rds": len(tokyo) > 0,
             "saopaulo_has_no_rds": len(sp) == 0,
             "snapshots_in_tokyo_only": len(tokyo_snapshots) > 0 and len(sp_snapshots) == 0,
-            "assertion": "PASS ✅" if (len(tokyo) > 0 and len(sp) == 0) else "FAIL ❌"
-        }
+            "audit_buckets_in_home_region": audit_buckets is not None and all(b["compliant"] for b in audit_buckets),
+            "audit_buckets_encrypted": audit_buckets is not None and all(b.get("encryption") for b in audit_buckets),
+        }, **check)
     }
+    return evidence
+
+def main():
+    parser = argparse.ArgumentParser(description="Prove that data stays in the home region")
+    parser.add_argument("--regions", nargs="+", help="Regions to scan (default: every enabled region)")
+    parser.add_argument("--home-region", default=HOME_REGION, help=f"Only region allowed to hold data (default: {HOME_REGION})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_SCAN_WORKERS,
+                        help=f"Listings running at once (default: {DEFAULT_SCAN_WORKERS})")
+    parser.add_argument("--bucket-cache", default=DEFAULT_BUCKET_REGION_PATH,
+                        help=f"Bucket region cache kept between runs (default: {DEFAULT_BUCKET_REGION_PATH})")
+    parser.add_argument("--no-bucket-cache", action="store_true", help="Look up every bucket region again")
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("Lab 3B — Data Residency Proof Generator")
+    print("APPI Compliance Evidence")
+    print("=" * 80)
+
+    def progress(region, kind, outcome, scan):
+        if outcome["status"] == "ok":
+            print(f"  {'✅' if region == scan.home_region or not outcome['result'] else '❌'} "
+                  f"{region} {kind}: {len(outcome['result'])}")
+        else:
+            print(f"  ⚠️ {region} {kind}: {outcome['error']}")
+
+    evidence = build_data_residency_proof(args.regions, home_region=args.home_region,
+                                          workers=args.workers, on_result=progress,
+                                          bucket_cache=None if args.no_bucket_cache else args.bucket_cache)
     
     with open("data_residency_proof.json", 'w') as f:
-        json.dump(evidence, f, indent=2)
+        json.dump(evidence, f, indent=2, default=str)
     
     print(f"\n✅ Evidence saved. Status: {evidence['compliance_check']['assertion']}")
-    print(json.dumps(evidence, indent=2))
+    print(json.dumps(evidence["compliance_check"], indent=2))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+malgus_evidence_bundle.py
+
+Streaming ZIP writer for the audit evidence bundle (malgus_audit_evidence_package.py).
+
+Members are written straight into the archive as they are produced: JSON proofs are
+encoded incrementally, files are read in chunks, nothing is staged on disk first and
+no member is held in memory in full. Each member is cut into chunks that worker
+threads deflate independently (sync-flushed raw deflate streams concatenate into one
+valid stream, the pigz trick); CRC-32 and SHA-256 are computed in the same pass.
+Sizes follow in data descriptors and every entry is zip64-capable, so the output
+never needs to seek and members may exceed 4 GiB.
+
+The last member, MANIFEST.sha256.json, lists every member's SHA-256 and a Merkle
+audit path to the bundle root (also stored in the ZIP comment). One member can be
+verified by hashing only that member, optionally against a root recorded elsewhere
+(e.g. the runs table of malgus_evidence_store.py):
+
+    python3 malgus_evidence_bundle.py audit_evidence_bundle_....zip --member data_residency_proof.json
+    python3 malgus_evidence_bundle.py audit_evidence_bundle_....zip --root <merkle root hex>
+
+# Reason why Darth Malgus would be pleased with this script:
+# Every dispatch is sealed as it is written. Tampering with one breaks the seal of the whole archive.
+#
+# Reason why this script is relevant to your career:
+# Streaming archives and hash manifests are how evidence and build artifacts are shipped at scale.
+#
+# How you would talk about this script at an interview:
+# “I replaced write-then-zip with a streaming zip64 writer that compresses chunks in parallel and
+#  emits a SHA-256 Merkle manifest, so auditors can verify any single file against one root hash.”
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Union
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+DEFAULT_LEVEL = 6
+DEFAULT_WORKERS = min(8, os.cpu_count() or 1)
+MANIFEST_NAME = "MANIFEST.sha256.json"
+ROOT_COMMENT_PREFIX = "merkle-root sha256:"
+
+_LOCAL_HEADER = 0x04034B50
+_DATA_DESCRIPTOR = 0x08074B50
+_CENTRAL_HEADER = 0x02014B50
+_ZIP64_END = 0x06064B50
+_ZIP64_LOCATOR = 0x07064B50
+_END = 0x06054B50
+_ZIP64_LIMIT = 0xFFFFFFFF
+_ZIP64_VERSION = 45
+_MADE_BY_UNIX = 3 << 8
+_FILE_ATTR = 0o100644 << 16
+# bit 3: sizes/CRC in the data descriptor; bit 11: UTF-8 names
+_FLAGS = 0x0008 | 0x0800
+_DEFLATED = 8
+
+# Empty final deflate block; closes a stream made of sync-flushed chunks.
+_END_OF_STREAM = zlib.compressobj(DEFAULT_LEVEL, zlib.DEFLATED, -15).flush()
+
+
+def _deflate_chunk(data: bytes, level: int) -> bytes:
+    """Raw deflate of one chunk ending on a byte boundary with no final block."""
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _rechunk(pieces: Iterable[Union[bytes, str]], size: int) -> Iterator[bytes]:
+    """Regroup str/bytes pieces of any size into `size`-byte blocks (last one shorter)."""
+    buf: List[bytes] = []
+    n = 0
+    for piece in pieces:
+        if isinstance(piece, str):
+            piece = piece.encode("utf-8")
+        buf.append(piece)
+        n += len(piece)
+        if n >= size:
+            data = b"".join(buf)
+            cut = len(data) - len(data) % size
+            for i in range(0, cut, size):
+                yield data[i:i + size]
+            buf = [data[cut:]]
+            n = len(data) - cut
+    if n:
+        yield b"".join(buf)
+
+
+def _dos_datetime(ts: float) -> tuple:
+    t = time.localtime(ts)
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((max(t.tm_year, 1980) - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+# ----------------------------------------------------------------------
+# Merkle manifest
+# ----------------------------------------------------------------------
+
+def leaf_hash(name: str, sha256_hex: str) -> bytes:
+    """Leaf = SHA-256(0x00 || name || 0x00 || SHA-256(content)); binds the name to the content."""
+    return hashlib.sha256(b"\x00" + name.encode("utf-8") + b"\x00" + bytes.fromhex(sha256_hex)).digest()
+
+
+def _node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def merkle_levels(leaves: List[bytes]) -> List[List[bytes]]:
+    """All tree levels, leaves first. An odd last node is carried up unchanged."""
+    levels = [list(leaves) or [hashlib.sha256(b"").digest()]]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        parents = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            parents.append(level[-1])
+        levels.append(parents)
+    return levels
+
+
+def merkle_proof(levels: List[List[bytes]], index: int) -> List[Dict[str, str]]:
+    """Audit path for leaf `index`: sibling hashes from the bottom up."""
+    proof = []
+    for level in levels[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append({"side": "left" if sibling < index else "right", "hash": level[sibling].hex()})
+        index //= 2
+    return proof
+
+
+def verify_proof(name: str, sha256_hex: str, proof: List[Dict[str, str]], root_hex: str) -> bool:
+    h = leaf_hash(name, sha256_hex)
+    for step in proof:
+        sibling = bytes.fromhex(step["hash"])
+        h = _node_hash(sibling, h) if step["side"] == "left" else _node_hash(h, sibling)
+    return h.hex() == root_hex
+
+
+# ----------------------------------------------------------------------
+# Writer
+# ----------------------------------------------------------------------
+
+class EvidenceBundleWriter:
+    """
+    Sequential, non-seeking ZIP writer. add*() write one member each; close() appends
+    the manifest and the central directory. A path target is written to "<path>.part"
+    and renamed on a clean close, so a failed run never leaves a truncated bundle.
+    """
+
+    def __init__(
+        self,
+        target: Union[str, IO[bytes]],
+        workers: int = DEFAULT_WORKERS,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        level: int = DEFAULT_LEVEL,
+    ):
+        if isinstance(target, str):
+            self.path: Optional[str] = target
+            self._out = open(target + ".part", "wb")
+        else:
+            self.path = None
+            self._out = target
+        self.chunk_size = chunk_size
+        self.level = level
+        self.workers = max(1, workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers)
+        self._offset = 0
+        self._members: List[Dict[str, Any]] = []
+        self.manifest: Optional[Dict[str, Any]] = None
+
+    def __enter__(self) -> "EvidenceBundleWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write(self, data: bytes) -> int:
+        self._out.write(data)
+        self._offset += len(data)
+        return len(data)
+
+    def add(self, name: str, pieces: Iterable[Union[bytes, str]]) -> Dict[str, Any]:
+        """Stream one member from an iterable of bytes/str pieces; returns its entry."""
+        if self.manifest is not None:
+            raise ValueError("bundle is closed")
+        if any(m["name"] == name for m in self._members):
+            raise ValueError(f"duplicate member: {name}")
+        raw_name = name.encode("utf-8")
+        dos_time, dos_date = _dos_datetime(time.time())
+        offset = self._offset
+        # Sizes are unknown up front: zero CRC, 0xFFFFFFFF sizes plus a zip64 extra, real values in the descriptor.
+        self._write(struct.pack("<IHHHHHIIIHH", _LOCAL_HEADER, _ZIP64_VERSION, _FLAGS, _DEFLATED, dos_time,
+                                dos_date, 0, _ZIP64_LIMIT, _ZIP64_LIMIT, len(raw_name), 20)
+                    + raw_name + struct.pack("<HHQQ", 1, 16, 0, 0))
+
+        crc = 0
+        size = compressed = 0
+        sha = hashlib.sha256()
+        # Bounded window of in-flight chunks keeps memory at ~2 * workers * chunk_size.
+        pending: deque = deque()
+        for block in _rechunk(pieces, self.chunk_size):
+            crc = zlib.crc32(block, crc)
+            sha.update(block)
+            size += len(block)
+            pending.append(self._pool.submit(_deflate_chunk, block, self.level))
+            if len(pending) >= 2 * self.workers:
+                compressed += self._write(pending.popleft().result())
+        while pending:
+            compressed += self._write(pending.popleft().result())
+        compressed += self._write(_END_OF_STREAM)
+        self._write(struct.pack("<IIQQ", _DATA_DESCRIPTOR, crc, compressed, size))
+
+        entry = {
+            "name": name, "offset": offset, "crc": crc, "size": size, "compressed_size": compressed,
+            "sha256": sha.hexdigest(), "dos_time": dos_time, "dos_date": dos_date,
+        }
+        self._members.append(entry)
+        return entry
+
+    def add_bytes(self, name: str, data: Union[bytes, str]) -> Dict[str, Any]:
+        return self.add(name, [data])
+
+    def add_json(self, name: str, obj: Any, indent: Optional[int] = 2) -> Dict[str, Any]:
+        """Encode `obj` incrementally into the member (the JSON text is never built in full)."""
+        return self.add(name, json.JSONEncoder(indent=indent, default=str).iterencode(obj))
+
+    def add_file(self, name: str, path: str) -> Dict[str, Any]:
+        def read() -> Iterator[bytes]:
+            with open(path, "rb") as f:
+                while True:
+                    block = f.read(self.chunk_size)
+                    if not block:
+                        return
+                    yield block
+        return self.add(name, read())
+
+    def _build_manifest(self) -> Dict[str, Any]:
+        levels = merkle_levels([leaf_hash(m["name"], m["sha256"]) for m in self._members])
+        return {
+            "algorithm": "sha256",
+            "leaf": "sha256(0x00 || name || 0x00 || sha256(content))",
+            "node": "sha256(0x01 || left || right)",
+            "merkle_root": levels[-1][0].hex(),
+            "members": [
+                {"name": m["name"], "size": m["size"], "sha256": m["sha256"], "proof": merkle_proof(levels, i)}
+                for i, m in enumerate(self._members)
+            ],
+        }
+
+    def _write_central_directory(self, comment: bytes) -> None:
+        cd_start = self._offset
+        for m in self._members:
+            raw_name = m["name"].encode("utf-8")
+            fields = []
+            size, compressed, offset = m["size"], m["compressed_size"], m["offset"]
+            if size >= _ZIP64_LIMIT:
+                fields.append(size)
+                size = _ZIP64_LIMIT
+            if compressed >= _ZIP64_LIMIT:
+                fields.append(compressed)
+                compressed = _ZIP64_LIMIT
+            if offset >= _ZIP64_LIMIT:
+                fields.append(offset)
+                offset = _ZIP64_LIMIT
+            extra = struct.pack(f"<HH{len(fields)}Q", 1, 8 * len(fields), *fields) if fields else b""
+            self._write(struct.pack("<IHHHHHHIIIHHHHHII", _CENTRAL_HEADER, _MADE_BY_UNIX | _ZIP64_VERSION,
+                                    _ZIP64_VERSION, _FLAGS, _DEFLATED, m["dos_time"], m["dos_date"], m["crc"],
+                                    compressed, size, len(raw_name), len(extra), 0, 0, 0, _FILE_ATTR, offset)
+                        + raw_name + extra)
+        cd_size = self._offset - cd_start
+        count = len(self._members)
+        if count >= 0xFFFF or cd_size >= _ZIP64_LIMIT or cd_start >= _ZIP64_LIMIT:
+            zip64_end = self._offset
+            self._write(struct.pack("<IQHHIIQQQQ", _ZIP64_END, 44, _MADE_BY_UNIX | _ZIP64_VERSION, _ZIP64_VERSION,
+                                    0, 0, count, count, cd_size, cd_start))
+            self._write(struct.pack("<IIQI", _ZIP64_LOCATOR, 0, zip64_end, 1))
+        self._write(struct.pack("<IHHHHIIH", _END, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+                                min(cd_size, _ZIP64_LIMIT), min(cd_start, _ZIP64_LIMIT), len(comment)) + comment)
+
+    def close(self) -> Dict[str, Any]:
+        """Append the manifest and central directory; returns the manifest."""
+        if self.manifest is not None:
+            return self.manifest
+        try:
+            manifest = self._build_manifest()
+            self.add_json(MANIFEST_NAME, manifest)
+            self.manifest = manifest
+            self._write_central_directory(f"{ROOT_COMMENT_PREFIX}{manifest['merkle_root']}".encode("ascii"))
+            self._out.flush()
+        except BaseException:
+            self.abort()
+            raise
+        self._pool.shutdown()
+        if self.path:
+            self._out.close()
+            os.replace(self.path + ".part", self.path)
+        return self.manifest
+
+    def abort(self) -> None:
+        """Stop writing and remove the partial file (path targets only)."""
+        self._pool.shutdown(cancel_futures=True)
+        if self.path and not self._out.closed:
+            self._out.close()
+            try:
+                os.remove(self.path + ".part")
+            except OSError:
+                pass
+
+
+# ----------------------------------------------------------------------
+# Verification
+# ----------------------------------------------------------------------
+
+def verify_bundle(path: str, members: Optional[List[str]] = None, expected_root: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Check `members` (default: all) of a bundle against its manifest: each member's
+    SHA-256 is recomputed from the archive and its audit path must reach the root.
+    That root is `expected_root` if given, else the one in the ZIP comment; the
+    manifest's own merkle_root must match it too, otherwise the bundle is invalid.
+    """
+    with zipfile.ZipFile(path) as zf:
+        manifest = json.loads(zf.read(MANIFEST_NAME))
+        comment = zf.comment.decode("ascii", "replace")
+        roots = {
+            "manifest": manifest["merkle_root"],
+            "zip_comment": comment[len(ROOT_COMMENT_PREFIX):] if comment.startswith(ROOT_COMMENT_PREFIX) else None,
+        }
+        if expected_root:
+            roots["expected"] = expected_root.lower()
+        root = roots.get("expected") or roots["zip_comment"] or roots["manifest"]
+        root_errors = [f"{source} root {value or '(missing)'} does not match {root}"
+                       for source, value in roots.items() if value != root]
+        entries = {m["name"]: m for m in manifest["members"]}
+        results = {}
+        for name in members or list(entries):
+            entry = entries.get(name)
+            if entry is None:
+                results[name] = "not in manifest"
+                continue
+            sha = hashlib.sha256()
+            with zf.open(name) as f:
+                for block in iter(lambda: f.read(DEFAULT_CHUNK_SIZE), b""):
+                    sha.update(block)
+            if sha.hexdigest() != entry["sha256"]:
+                results[name] = "content hash mismatch"
+            elif not verify_proof(name, entry["sha256"], entry["proof"], root):
+                results[name] = "proof does not reach root"
+            else:
+                results[name] = "ok"
+    return {"merkle_root": root, "roots": roots, "root_errors": root_errors, "members": results,
+            "valid": not root_errors and all(r == "ok" for r in results.values())}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verify an audit evidence bundle against its SHA-256 Merkle manifest")
+    parser.add_argument("bundle", help="Path to audit_evidence_bundle_*.zip")
+    parser.add_argument("--member", action="append", help="Verify only this member (repeatable); hashes only that member")
+    parser.add_argument("--root", help="Expected Merkle root (hex), recorded outside the bundle")
+    args = parser.parse_args()
+
+    report = verify_bundle(args.bundle, args.member, args.root)
+    print(f"Merkle root: {report['merkle_root']}")
+    for error in report["root_errors"]:
+        print(f"  ❌ {error}")
+    for name, status in report["members"].items():
+        print(f"  {'✅' if status == 'ok' else '❌'} {name}: {status}")
+    sys.exit(0 if report["valid"] else 1)
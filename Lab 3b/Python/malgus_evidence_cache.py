@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+malgus_evidence_cache.py
+
+Local evidence cache for incremental audit runs (malgus_audit_evidence_package.py).
+
+Every resource is recorded under (kind, id) with a fingerprint taken from the cheap
+list call (CloudFront LastModifiedTime, WAF LockToken, flow log status, ...). When a
+later run sees the same fingerprint, the evidence from the detail calls
+(get_distribution_config, get_web_acl, ...) is reused instead of fetched again.
+CloudTrail slices that are complete and older than SLICE_SETTLE cannot change any
+more, so what they add to the change-trail summary (counts and latest critical
+events, not the raw events) is cached per region and hour-aligned slice.
+
+Each run also yields a change report per kind: added, removed and changed resources
+since the previous run. A kind whose listing did not finish (timeout, error) keeps its
+previous entries and is reported as not collected. close() freezes the cache before the
+report and save, so collectors abandoned after a timeout cannot change it any more.
+
+The cache file records the account ID it was collected from (STS get_caller_identity);
+a cache from another account, or with no known account, is not reused.
+
+# Reason why Darth Malgus would be pleased with this script:
+# Spies who report "nothing changed" every hour are wasted. Only send them where the map moved.
+#
+# Reason why this script is relevant to your career:
+# Fingerprint-based incremental collection is how inventory and compliance tooling scales to big estates.
+#
+# How you would talk about this script at an interview:
+# “I made the hourly audit incremental: resources are fingerprinted from list calls, unchanged ones
+#  reuse cached evidence, and every bundle carries a diff of what changed since the last run.”
+"""
+
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+DEFAULT_CACHE_PATH = "malgus_evidence_cache.json.gz"
+DEFAULT_BUCKET_REGION_PATH = "malgus_bucket_regions.json"
+CACHE_VERSION = 2
+# CloudTrail event history can lag behind; slices that ended longer ago than this are final.
+SLICE_SETTLE = timedelta(hours=1)
+# Event history only goes back 90 days; older slices are dropped from the cache.
+EVENT_HISTORY = timedelta(days=90)
+
+
+def _fingerprint(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, default=str)
+
+
+class EvidenceCache:
+    """
+    Thread-safe; collectors running in parallel share one instance. path=None keeps
+    the cache in memory only (no reuse across runs, no change report baseline).
+    `account` is the caller's account ID; only a cache file saved for the same account
+    is loaded, so account=None always starts over.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, account: Optional[str] = None):
+        self.path = path
+        self.account = account
+        self.lock = threading.Lock()
+        self.previous_run_at: Optional[str] = None
+        self._previous: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._current: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._finished: Dict[str, Dict[str, Any]] = {}
+        self._slices: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.stats = {"hits": 0, "misses": 0, "slices_reused": 0, "slices_stored": 0}
+        self._closed = False
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self) -> None:
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # unreadable cache: start over
+        if data.get("version") != CACHE_VERSION or self.account is None or data.get("account") != self.account:
+            return  # other format or other account: its evidence does not apply
+        self.previous_run_at = data.get("run_at")
+        self._previous = data.get("resources", {})
+        self._slices = data.get("trail_slices", {})
+
+    # ------------------------------------------------------------------
+    # Resources
+    # ------------------------------------------------------------------
+
+    def get_or_collect(self, kind: str, resource_id: str, fingerprint: Any, collect: Callable[[], Any]) -> Any:
+        """
+        Evidence for a resource: the cached value if its fingerprint is unchanged,
+        otherwise collect() (outside the lock). Either way it is recorded for this run.
+        """
+        fp = _fingerprint(fingerprint)
+        with self.lock:
+            entry = self._previous.get(kind, {}).get(resource_id)
+            hit = entry is not None and entry["fingerprint"] == fp
+            self.stats["hits" if hit else "misses"] += 1
+        evidence = entry["evidence"] if hit else collect()
+        self.record(kind, resource_id, fingerprint, evidence)
+        return evidence
+
+    def record(self, kind: str, resource_id: str, fingerprint: Any, evidence: Any = None) -> None:
+        """Note a resource seen in this run (for the change report) without a cache lookup."""
+        with self.lock:
+            if self._closed:
+                return
+            self._current.setdefault(kind, {})[resource_id] = {"fingerprint": _fingerprint(fingerprint), "evidence": evidence}
+
+    def finish(self, kind: str) -> None:
+        """`kind` was listed completely: anything not recorded this run is gone."""
+        with self.lock:
+            if self._closed:
+                return
+            previous = self._previous.get(kind, {})
+            current = self._current.setdefault(kind, {})
+            self._finished[kind] = {
+                "added": sorted(set(current) - set(previous)),
+                "removed": sorted(set(previous) - set(current)),
+                "changed": sorted(r for r in current if r in previous
+                                  and current[r]["fingerprint"] != previous[r]["fingerprint"]),
+                "unchanged": sum(1 for r in current if r in previous
+                                 and current[r]["fingerprint"] == previous[r]["fingerprint"]),
+            }
+
+    # ------------------------------------------------------------------
+    # CloudTrail slices
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _slice_key(start: datetime, end: datetime) -> str:
+        return f"{start.isoformat()}/{end.isoformat()}"
+
+    def get_slice(self, region: str, start: datetime, end: datetime) -> Optional[Dict[str, Any]]:
+        """Cached contribution of a final slice (SliceContribution.to_dict()); None if not cached."""
+        key = self._slice_key(start, end)
+        with self.lock:
+            contribution = self._slices.get(region, {}).get(key)
+            if contribution is None:
+                return None
+            self.stats["slices_reused"] += 1
+            return contribution
+
+    def put_slice(self, region: str, start: datetime, end: datetime, contribution: Dict[str, Any]) -> None:
+        key = self._slice_key(start, end)
+        with self.lock:
+            if self._closed:
+                return
+            self._slices.setdefault(region, {})[key] = contribution
+            self.stats["slices_stored"] += 1
+
+    # ------------------------------------------------------------------
+    # Report / persistence
+    # ------------------------------------------------------------------
+
+    def close(self) -> None:
+        """Ignore record/finish/put_slice from now on (late calls from abandoned collectors)."""
+        with self.lock:
+            self._closed = True
+
+    def report(self) -> Dict[str, Any]:
+        """Changes since the previous run per kind, plus cache statistics."""
+        with self.lock:
+            kinds = {}
+            for kind in sorted(set(self._previous) | set(self._current)):
+                if kind in self._finished:
+                    kinds[kind] = dict(self._finished[kind])
+                else:
+                    kinds[kind] = {"status": "not collected this run (previous evidence kept)"}
+            changed = sum(len(k.get("added", [])) + len(k.get("removed", [])) + len(k.get("changed", []))
+                          for k in kinds.values())
+            return {
+                "account": self.account,
+                "previous_run_at": self.previous_run_at,
+                "baseline": self.previous_run_at is not None,
+                "resources_changed": changed,
+                "by_kind": kinds,
+                "cache": dict(self.stats),
+            }
+
+    def save(self, run_at: Optional[str] = None) -> None:
+        """Write this run's state; slices past the event history retention are dropped."""
+        if not self.path:
+            return
+        oldest = (datetime.utcnow() - EVENT_HISTORY).isoformat()
+        with self.lock:
+            resources = {kind: dict(entries) for kind, entries in self._previous.items()}
+            for kind in self._finished:
+                resources[kind] = dict(self._current.get(kind, {}))
+            data = {
+                "version": CACHE_VERSION,
+                "account": self.account,
+                "run_at": run_at or datetime.utcnow().isoformat() + "Z",
+                "resources": resources,
+                "trail_slices": {
+                    region: {k: v for k, v in slices.items() if k.split("/")[1] > oldest}
+                    for region, slices in self._slices.items()
+                },
+            }
+        tmp = self.path + ".tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, default=str)
+        os.replace(tmp, self.path)
+
+
+class BucketRegionCache:
+    """
+    S3 bucket name -> region, kept across runs. A bucket's region never changes;
+    a bucket deleted and re-created elsewhere gets a new CreationDate, which is part
+    of the key, so a stale region is never returned. Thread-safe.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_BUCKET_REGION_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self._regions: Dict[str, Dict[str, str]] = {}
+        self._dirty = False
+        self.stats = {"hits": 0, "misses": 0}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._regions = json.load(f).get("buckets", {})
+            except (OSError, ValueError):
+                self._regions = {}
+
+    def get(self, bucket: str, created: Any) -> Optional[str]:
+        with self.lock:
+            entry = self._regions.get(bucket)
+            hit = entry is not None and entry["created"] == str(created)
+            self.stats["hits" if hit else "misses"] += 1
+            return entry["region"] if hit else None
+
+    def put(self, bucket: str, created: Any, region: str) -> None:
+        with self.lock:
+            if self._regions.get(bucket) != {"created": str(created), "region": region}:
+                self._regions[bucket] = {"created": str(created), "region": region}
+                self._dirty = True
+
+    def save(self, existing: Optional[List[str]] = None) -> None:
+        """Write the cache; with `existing` (all bucket names listed), forget deleted buckets."""
+        if not self.path:
+            return
+        with self.lock:
+            if existing is not None:
+                keep = set(existing)
+                for bucket in [b for b in self._regions if b not in keep]:
+                    del self._regions[bucket]
+                    self._dirty = True
+            if not self._dirty:
+                return
+            data = {"version": CACHE_VERSION, "buckets": self._regions}
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, sort_keys=True)
+            os.replace(tmp, self.path)
+            self._dirty = False
@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+malgus_evidence_store.py
+
+Embedded SQLite history of every proof run. Each run (a proof JSON file, an audit
+evidence bundle ZIP or a fan-out document) is appended as normalized rows:
+
+  runs     one row per ingested document (time, source, content hash, Merkle root)
+  records  one row per resource in a proof (type, id, region, account, JSON data)
+  checks   one row per scalar compliance value (assertions, counts, flags)
+
+Indexes on proof type, resource, region and time keep trend and point-in-time
+queries in the milliseconds after a year of hourly runs. The same document is never
+stored twice (content hash).
+
+    python3 malgus_evidence_store.py ingest audit_evidence_bundle_*.zip network_corridor_proof.json
+    python3 malgus_evidence_store.py first vpc_peering_violations --above 0
+    python3 malgus_evidence_store.py trend vpc_peering_violations --since 2026-01-01
+    python3 malgus_evidence_store.py resource vpc_peering_connection pcx-0123
+    python3 malgus_evidence_store.py at 2026-03-01T12:00 --proof network_corridor
+
+# Reason why Darth Malgus would be pleased with this script:
+# The Empire remembers. Every betrayal has a first date, and the archive knows it.
+#
+# Reason why this script is relevant to your career:
+# Turning point-in-time audit artifacts into queryable history is what compliance teams actually need.
+#
+# How you would talk about this script at an interview:
+# “I normalized every compliance run into an indexed SQLite history, so questions like ‘when did peering
+#  violations first appear’ are a millisecond query instead of digging through old ZIPs.”
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import zipfile
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_STORE_PATH = "malgus_evidence.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      INTEGER PRIMARY KEY,
+    recorded_at TEXT NOT NULL,
+    source      TEXT NOT NULL,
+    sha256      TEXT NOT NULL UNIQUE,
+    merkle_root TEXT,
+    ingested_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS records (
+    run_id        INTEGER NOT NULL REFERENCES runs(run_id),
+    recorded_at   TEXT NOT NULL,
+    proof_type    TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    resource_id   TEXT NOT NULL,
+    region        TEXT,
+    account       TEXT,
+    data          TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checks (
+    run_id      INTEGER NOT NULL REFERENCES runs(run_id),
+    recorded_at TEXT NOT NULL,
+    proof_type  TEXT NOT NULL,
+    account     TEXT,
+    name        TEXT NOT NULL,
+    num         REAL,
+    text        TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_time ON runs(recorded_at);
+CREATE INDEX IF NOT EXISTS records_proof_time ON records(proof_type, recorded_at);
+CREATE INDEX IF NOT EXISTS records_resource ON records(resource_type, resource_id, recorded_at);
+CREATE INDEX IF NOT EXISTS records_region_time ON records(region, recorded_at);
+CREATE INDEX IF NOT EXISTS checks_name_time ON checks(name, proof_type, recorded_at);
+CREATE INDEX IF NOT EXISTS checks_proof_time ON checks(proof_type, recorded_at);
+"""
+
+# (proof_type, resource_type, resource_id, region, account, data)
+Record = Tuple[str, str, str, Optional[str], Optional[str], Dict[str, Any]]
+# (proof_type, account, name, value)
+Check = Tuple[str, Optional[str], str, Any]
+
+REGION_KEYS = {"tokyo": "ap-northeast-1", "saopaulo": "sa-east-1"}
+# Residency scanner listing -> record resource_type
+RESOURCE_TYPES = {"rds_instances": "rds_instance", "rds_snapshots": "rds_snapshot",
+                  "aurora_clusters": "aurora_cluster", "aurora_cluster_snapshots": "aurora_cluster_snapshot",
+                  "automated_backups": "automated_backup", "dynamodb_tables": "dynamodb_table",
+                  "ebs_snapshots": "ebs_snapshot"}
+
+
+# ----------------------------------------------------------------------
+# Normalization: proof document -> records + checks
+# ----------------------------------------------------------------------
+
+def _regional(proof_type, resource_type, by_region, id_key, account=None) -> Iterator[Record]:
+    """Items of a {"tokyo": [...], "saopaulo": [...]} block (or a flat list) as records."""
+    if isinstance(by_region, list):
+        by_region = {None: by_region}
+    for key, items in (by_region or {}).items():
+        for item in items or []:
+            if not isinstance(item, dict):
+                continue
+            region = item.get("region") or REGION_KEYS.get(key, key)
+            yield (proof_type, resource_type, str(item.get(id_key, "unknown")), region, account, item)
+
+
+def _scalars(proof_type, block, prefix="", account=None) -> Iterator[Check]:
+    for name, value in (block or {}).items():
+        if isinstance(value, (bool, int, float, str)) or value is None:
+            yield (proof_type, account, prefix + name, value)
+        elif isinstance(value, list):
+            yield (proof_type, account, prefix + name + "_count", len(value))
+
+
+def normalize(doc: Dict[str, Any], name: str = "") -> Tuple[List[Record], List[Check]]:
+    """Records and checks of one proof document (type detected from its content)."""
+    records: List[Record] = []
+    checks: List[Check] = []
+    proof_type = doc.get("proof_type")
+
+    if proof_type == "data_residency":
+        if doc.get("resources_by_region"):
+            # Every scanned region and resource type
+            for region, kinds in doc["resources_by_region"].items():
+                for kind, items in kinds.items():
+                    records += _regional(proof_type, RESOURCE_TYPES.get(kind, kind), {region: items}, "id")
+        else:
+            records += _regional(proof_type, "rds_instance", doc.get("rds_instances"), "id")
+            records += _regional(proof_type, "rds_snapshot", doc.get("rds_snapshots"), "snapshot_id")
+        records += _regional(proof_type, "s3_bucket", doc.get("audit_s3_buckets"), "bucket_name")
+        check = doc.get("compliance_check") or {}
+        checks += _scalars(proof_type, check)
+        checks += _scalars(proof_type, check.get("resources_scanned"), prefix="scanned_")
+        checks += _scalars(proof_type, check.get("outside_home_region"), prefix="outside_")
+    elif proof_type == "network_corridor":
+        records += _regional(proof_type, "transit_gateway", doc.get("transit_gateways"), "tgw_id")
+        records += _regional(proof_type, "tgw_peering_attachment", doc.get("peering_attachments"), "attachment_id")
+        records += _regional(proof_type, "tgw_route_table", doc.get("route_tables"), "route_table_id")
+        records += _regional(proof_type, "vpc_peering_connection", doc.get("vpc_peering_connections"),
+                             "VpcPeeringConnectionId")
+        checks += _scalars(proof_type, doc.get("compliance_check"))
+        checks += _scalars(proof_type, doc.get("evidence_summary"))
+        for direction, report in (doc.get("reachability") or {}).items():
+            if isinstance(report, dict):
+                checks += _scalars(proof_type, report, prefix=f"{direction}_")
+    elif proof_type == "multi_account_fanout":
+        ids = {kind: (resource_type, "id") for kind, resource_type in RESOURCE_TYPES.items()}
+        ids.update({"transit_gateways": ("transit_gateway", "tgw_id"),
+                    "tgw_peering_attachments": ("tgw_peering_attachment", "attachment_id"),
+                    "vpc_peering_connections": ("vpc_peering_connection", "VpcPeeringConnectionId"),
+                    "flow_logs": ("flow_log", "flow_log_id")})
+        for account, data in doc.get("accounts", {}).items():
+            for region, collectors in data.get("regions", {}).items():
+                for collector, items in collectors.items():
+                    if collector in ids and isinstance(items, list):
+                        resource_type, id_key = ids[collector]
+                        records += _regional(proof_type, resource_type, {region: items}, id_key, account)
+            checks += _scalars(proof_type, data.get("compliance_check"), account=account)
+        checks += _scalars(proof_type, doc.get("summary"))
+    elif "proofs" in doc:
+        # audit_evidence_package.json: several proofs in one document
+        proofs = doc["proofs"]
+        edge = proofs.get("edge_security", {})
+        records += _regional("edge_security", "cloudfront_distribution", edge.get("cloudfront_distributions"),
+                             "distribution_id")
+        records += _regional("edge_security", "waf_web_acl", edge.get("waf_web_acls"), "arn")
+        flows = proofs.get("flow_logs", {})
+        records += _regional("flow_logs", "flow_log", {k: flows.get(k) for k in ("tokyo", "saopaulo")}, "flow_log_id")
+        trail = proofs.get("change_trail", {})
+        records += _regional("change_trail", "cloudtrail_event", trail.get("critical_events"), "event_time")
+        for proof, block in proofs.items():
+            checks += _scalars(proof, {k: v for k, v in block.items() if not isinstance(v, list)})
+        checks += _scalars("audit_package", doc.get("compliance_summary"))
+        for region, count in trail.get("events_by_region", {}).items():
+            checks.append(("change_trail", None, f"events_in_{region}", count))
+    elif name.endswith("tgw_snapshot.json") or {"tokyo", "saopaulo"} <= set(doc):
+        for key, snap in doc.items():
+            if isinstance(snap, dict):
+                records += _regional("tgw_snapshot", "transit_gateway", {key: snap.get("transit_gateways")},
+                                     "TransitGatewayId")
+                records += _regional("tgw_snapshot", "tgw_attachment", {key: snap.get("attachments")},
+                                     "TransitGatewayAttachmentId")
+    return records, checks
+
+
+def load_documents(path: str) -> Tuple[List[Tuple[str, Dict[str, Any]]], Optional[str]]:
+    """(name, document) pairs of a proof JSON file or an evidence bundle ZIP, plus the bundle's Merkle root."""
+    merkle_root = None
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            documents = [(n, json.loads(zf.read(n))) for n in zf.namelist()
+                         if n.endswith(".json") and not n.startswith("MANIFEST")]
+            if "MANIFEST.sha256.json" in zf.namelist():
+                merkle_root = json.loads(zf.read("MANIFEST.sha256.json")).get("merkle_root")
+    else:
+        with open(path) as f:
+            documents = [(os.path.basename(path), json.load(f))]
+    return documents, merkle_root
+
+
+def utc_text(raw: str) -> str:
+    """ISO time (Z, offset or naive UTC; date only = midnight) as the stored naive UTC text."""
+    t = datetime.fromisoformat(raw.strip().replace("Z", "+00:00"))
+    if t.tzinfo:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return t.isoformat(timespec="seconds")
+
+
+def _timestamp(doc: Dict[str, Any], fallback: float) -> str:
+    """Run time as naive UTC ISO text (sortable)."""
+    raw = doc.get("timestamp") or doc.get("generated_at")
+    if raw:
+        try:
+            return utc_text(raw)
+        except ValueError:
+            pass
+    return datetime.utcfromtimestamp(fallback).isoformat(timespec="seconds")
+
+
+# ----------------------------------------------------------------------
+# Store
+# ----------------------------------------------------------------------
+
+class EvidenceStore:
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "EvidenceStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def ingest_documents(self, source: str, documents: List[Tuple[str, Dict[str, Any]]], sha256: str,
+                         recorded_at: str, merkle_root: Optional[str] = None) -> Optional[int]:
+        """Append one run; returns its run_id, or None if this content was stored before."""
+        with self.db:
+            cur = self.db.execute(
+                "INSERT OR IGNORE INTO runs (recorded_at, source, sha256, merkle_root, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                (recorded_at, source, sha256, merkle_root, datetime.utcnow().isoformat(timespec="seconds")))
+            if cur.rowcount == 0:
+                return None
+            run_id = cur.lastrowid
+            for name, doc in documents:
+                records, checks = normalize(doc, name)
+                self.db.executemany(
+                    "INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, recorded_at, p, rt, rid, region, account, json.dumps(data, default=str))
+                     for p, rt, rid, region, account, data in records])
+                self.db.executemany(
+                    "INSERT INTO checks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, recorded_at, p, account, n,
+                      float(v) if isinstance(v, (bool, int, float)) else None,
+                      v if isinstance(v, str) else None)
+                     for p, account, n, v in checks])
+        return run_id
+
+    def ingest_file(self, path: str) -> Optional[int]:
+        """A proof JSON file or an evidence bundle ZIP (all JSON members, one run)."""
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        sha256 = sha.hexdigest()
+        documents, merkle_root = load_documents(path)
+        main = next((d for n, d in documents if n == "audit_evidence_package.json"), documents[0][1] if documents else {})
+        recorded_at = _timestamp(main, os.path.getmtime(path))
+        return self.ingest_documents(os.path.basename(path), documents, sha256, recorded_at, merkle_root)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def runs(self, limit: int = 20) -> List[tuple]:
+        return self.db.execute(
+            "SELECT run_id, recorded_at, source, merkle_root FROM runs ORDER BY recorded_at DESC LIMIT ?",
+            (limit,)).fetchall()
+
+    def trend(self, name: str, proof_type: Optional[str] = None, since: Optional[str] = None,
+              until: Optional[str] = None, account: Optional[str] = None) -> List[tuple]:
+        """(recorded_at, proof_type, account, value) of one check over time; since/until are ISO times."""
+        since = utc_text(since) if since is not None else None
+        until = utc_text(until) if until is not None else None
+        sql = "SELECT recorded_at, proof_type, account, COALESCE(num, text) FROM checks WHERE name = ?"
+        args: List[Any] = [name]
+        for clause, value in (("proof_type = ?", proof_type), ("recorded_at >= ?", since),
+                              ("recorded_at <= ?", until), ("account = ?", account)):
+            if value is not None:
+                sql += " AND " + clause
+                args.append(value)
+        return self.db.execute(sql + " ORDER BY recorded_at", args).fetchall()
+
+    def first(self, name: str, above: float = 0, proof_type: Optional[str] = None,
+              account: Optional[str] = None) -> Dict[str, Any]:
+        """
+        When the check first exceeded `above`, and when the current streak above it
+        started (the first run after the last run at or below it). Streaks are per
+        account: without `account`, every account's own result is under "accounts"
+        and current_streak_since is the earliest streak still running in any of them.
+        """
+        if account is None:
+            accounts = [row[0] for row in self.db.execute(
+                "SELECT DISTINCT account FROM checks WHERE name = ?" + (" AND proof_type = ?" if proof_type else ""),
+                [name] + ([proof_type] if proof_type else []))]
+            if len(accounts) > 1:
+                per_account = {a or "self": self._first(name, above, proof_type, a) for a in accounts}
+                first = [r["first_seen"] for r in per_account.values() if r["first_seen"]]
+                streaks = [r["current_streak_since"] for r in per_account.values() if r["current_streak_since"]]
+                return {"check": name, "above": above, "first_seen": min(first, default=None),
+                        "current_streak_since": min(streaks, default=None), "accounts": per_account}
+            account = accounts[0] if accounts else None
+        return self._first(name, above, proof_type, account)
+
+    def _first(self, name: str, above: float, proof_type: Optional[str], account: Optional[str]) -> Dict[str, Any]:
+        where = "name = ? AND account IS ?" + (" AND proof_type = ?" if proof_type else "")
+        args: List[Any] = [name, account] + ([proof_type] if proof_type else [])
+        first = self.db.execute(f"SELECT MIN(recorded_at) FROM checks WHERE {where} AND num > ?",
+                                args + [above]).fetchone()[0]
+        last_ok = self.db.execute(f"SELECT MAX(recorded_at) FROM checks WHERE {where} AND num <= ?",
+                                  args + [above]).fetchone()[0]
+        streak = self.db.execute(
+            f"SELECT MIN(recorded_at) FROM checks WHERE {where} AND num > ? AND recorded_at > ?",
+            args + [above, last_ok or ""]).fetchone()[0]
+        return {"check": name, "above": above, "account": account, "first_seen": first,
+                "last_at_or_below": last_ok, "current_streak_since": streak}
+
+    def resource(self, resource_type: str, resource_id: str) -> Dict[str, Any]:
+        """First/last sighting of a resource and where it was seen."""
+        rows = self.db.execute(
+            "SELECT MIN(recorded_at), MAX(recorded_at), COUNT(DISTINCT run_id), GROUP_CONCAT(DISTINCT region) "
+            "FROM records WHERE resource_type = ? AND resource_id = ?", (resource_type, resource_id)).fetchone()
+        latest = self.db.execute(
+            "SELECT data FROM records WHERE resource_type = ? AND resource_id = ? ORDER BY recorded_at DESC LIMIT 1",
+            (resource_type, resource_id)).fetchone()
+        return {"resource_type": resource_type, "resource_id": resource_id, "first_seen": rows[0],
+                "last_seen": rows[1], "runs": rows[2], "regions": (rows[3] or "").split(",") if rows[3] else [],
+                "latest": json.loads(latest[0]) if latest else None}
+
+    def at(self, when: str, proof_type: str) -> Dict[str, Any]:
+        """Records and checks of `proof_type` from the latest run at or before `when` (ISO time)."""
+        when = utc_text(when)
+        # Every proof writes checks, even when it found no resources
+        row = self.db.execute(
+            "SELECT MAX(recorded_at) FROM checks WHERE proof_type = ? AND recorded_at <= ?",
+            (proof_type, when)).fetchone()
+        if not row[0]:
+            return {"proof_type": proof_type, "as_of": None, "records": [], "checks": []}
+        records = self.db.execute(
+            "SELECT resource_type, resource_id, region, account FROM records "
+            "WHERE proof_type = ? AND recorded_at = ? ORDER BY resource_type, resource_id",
+            (proof_type, row[0])).fetchall()
+        checks = self.db.execute(
+            "SELECT name, account, COALESCE(num, text) FROM checks WHERE proof_type = ? AND recorded_at = ? ORDER BY name",
+            (proof_type, row[0])).fetchall()
+        return {"proof_type": proof_type, "as_of": row[0], "records": records, "checks": checks}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evidence history across proof runs")
+    parser.add_argument("--db", default=DEFAULT_STORE_PATH, help=f"SQLite file (default: {DEFAULT_STORE_PATH})")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("ingest", help="Append proof JSON files / evidence bundle ZIPs")
+    p.add_argument("paths", nargs="+")
+    p = sub.add_parser("runs", help="Latest runs")
+    p.add_argument("--limit", type=int, default=20)
+    p = sub.add_parser("trend", help="One check over time (e.g. vpc_peering_violations)")
+    p.add_argument("name")
+    p.add_argument("--proof")
+    p.add_argument("--account")
+    p.add_argument("--since", help="ISO time; Z or an offset, otherwise UTC")
+    p.add_argument("--until", help="ISO time; Z or an offset, otherwise UTC")
+    p = sub.add_parser("first", help="When a check first went above a value")
+    p.add_argument("name")
+    p.add_argument("--above", type=float, default=0)
+    p.add_argument("--proof")
+    p.add_argument("--account", help="Account whose streak is wanted (default: every account)")
+    p = sub.add_parser("resource", help="History of one resource")
+    p.add_argument("resource_type")
+    p.add_argument("resource_id")
+    p = sub.add_parser("at", help="Records of a proof as of a point in time")
+    p.add_argument("when", help="ISO time; Z or an offset, otherwise UTC (e.g. 2026-03-01T12:00)")
+    p.add_argument("--proof", required=True)
+    args = parser.parse_args()
+    for field in ("when", "since", "until"):
+        if getattr(args, field, None) is not None:
+            try:
+                utc_text(getattr(args, field))
+            except ValueError:
+                parser.error(f"{field}: not an ISO time: {getattr(args, field)}")
+
+    with EvidenceStore(args.db) as store:
+        if args.command == "ingest":
+            for path in args.paths:
+                run_id = store.ingest_file(path)
+                print(f"{'✅ run ' + str(run_id) if run_id else '↩️ already stored'}: {path}")
+        elif args.command == "runs":
+            for row in store.runs(args.limit):
+                print("  ".join(str(v) for v in row if v is not None))
+        elif args.command == "trend":
+            for recorded_at, proof_type, account, value in store.trend(args.name, args.proof, args.since,
+                                                                       args.until, args.account):
+                print(f"{recorded_at}  {proof_type}{'/' + account if account else ''}  {value}")
+        elif args.command == "first":
+            print(json.dumps(store.first(args.name, args.above, args.proof, args.account), indent=2))
+        elif args.command == "resource":
+            print(json.dumps(store.resource(args.resource_type, args.resource_id), indent=2, ensure_ascii=False))
+        elif args.command == "at":
+            result = store.at(args.when, args.proof)
+            print(f"As of {result['as_of']}: {len(result['records'])} record(s)")
+            for row in result["records"]:
+                print("  " + "  ".join(str(v) for v in row if v is not None))
+            for name, account, value in result["checks"]:
+                print(f"  {name}{' (' + account + ')' if account else ''} = {value}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Lab 3B — Multi-Account, Multi-Region Compliance Fan-Out
+=======================================================
+Purpose: Run the regional compliance collectors (data residency, TGW corridor, VPC
+peering, flow logs) across every target account and region at once.
+
+- Targets: the current credentials and/or IAM roles to assume (role ARNs, account
+  IDs + --role-name, or every ACTIVE account of the organization with --org).
+- Regions: an explicit list, or "all" = every region enabled in each account.
+- One task per (account, region, collector). A dispatcher keeps at most
+  --max-concurrency tasks in flight overall and --per-account per account (so one
+  account's API throttling limits never starve the others), taking accounts round-robin.
+- Results stream into fanout_evidence.jsonl as each task finishes; the aggregated
+  document with per-account assertions is written at the end.
+
+A full scan takes about as long as its slowest region, not the sum of all regions.
+
+Usage:
+    python3 malgus_fanout.py --regions all
+    python3 malgus_fanout.py --org --role-name OrganizationAccountAccessRole --regions all
+"""
+
+import argparse
+import json
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+from malgus_aws import enabled_regions, get_client, is_role_arn
+from malgus_data_residency_enhanced import RESIDENCY_COLLECTORS
+from malgus_evidence_store import DEFAULT_STORE_PATH, EvidenceStore
+from malgus_network_corridor_proof import (
+    list_tgw_peering_attachments, list_transit_gateways, list_vpc_peering_connections,
+)
+
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_PER_ACCOUNT = 8
+DEFAULT_HOME_REGION = "ap-northeast-1"
+SELF = "self"
+
+
+def describe_flow_logs(region, profile=None):
+    """VPC Flow Logs configured in one region"""
+    ec2 = get_client('ec2', region, profile)
+    return [{
+        "flow_log_id": fl['FlowLogId'],
+        "resource_id": fl['ResourceId'],
+        "status": fl.get('FlowLogStatus', 'UNKNOWN')
+    } for page in ec2.get_paginator('describe_flow_logs').paginate() for fl in page.get('FlowLogs', [])]
+
+
+# Collector name -> fn(region, profile); each one is a task per account and region.
+# Collectors raise on API errors, so a region that could not be read lands in the
+# account's errors (INCOMPLETE) instead of counting as an empty, compliant result.
+REGIONAL_COLLECTORS = OrderedDict(list(RESIDENCY_COLLECTORS.items()) + [
+    ("transit_gateways", list_transit_gateways),
+    ("tgw_peering_attachments", list_tgw_peering_attachments),
+    ("vpc_peering_connections", list_vpc_peering_connections),
+    ("flow_logs", describe_flow_logs),
+])
+
+
+def organization_accounts():
+    """IDs of every ACTIVE account in the organization"""
+    org = get_client('organizations', 'us-east-1')
+    return [a['Id'] for page in org.get_paginator('list_accounts').paginate()
+            for a in page.get('Accounts', []) if a.get('Status') == 'ACTIVE']
+
+
+def account_label(profile):
+    """Account ID for a role ARN, SELF for the current credentials"""
+    if is_role_arn(profile):
+        return profile.split(":")[4]
+    return profile or SELF
+
+
+class Task:
+    """One unit of fan-out work; `then(result)` may return follow-up tasks."""
+
+    def __init__(self, account, region, name, fn, then=None):
+        self.account = account
+        self.region = region
+        self.name = name
+        self.fn = fn
+        self.then = then
+
+
+class FanOut:
+    """
+    Runs tasks with a global and a per-account concurrency limit and yields
+    (task, outcome) as each one finishes. Accounts are served round-robin so a large
+    account does not delay the first results of the others.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, per_account=DEFAULT_PER_ACCOUNT):
+        self.max_concurrency = max(1, max_concurrency)
+        self.per_account = max(1, per_account)
+
+    @staticmethod
+    def _run(task):
+        started = time.monotonic()
+        try:
+            outcome = {"status": "ok", "result": task.fn()}
+        except Exception as e:
+            outcome = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        outcome["elapsed_s"] = round(time.monotonic() - started, 2)
+        return outcome
+
+    def run(self, tasks):
+        pending = OrderedDict()
+        for task in tasks:
+            pending.setdefault(task.account, deque()).append(task)
+        in_flight = defaultdict(int)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            while pending or running:
+                # Round-robin: one task per account per pass until a limit is hit
+                progress = True
+                while progress and len(running) < self.max_concurrency:
+                    progress = False
+                    for account in list(pending):
+                        if len(running) >= self.max_concurrency:
+                            break
+                        if in_flight[account] >= self.per_account:
+                            continue
+                        task = pending[account].popleft()
+                        if not pending[account]:
+                            del pending[account]
+                        in_flight[account] += 1
+                        running[pool.submit(self._run, task)] = task
+                        progress = True
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    in_flight[task.account] -= 1
+                    outcome = future.result()
+                    if outcome["status"] == "ok" and task.then:
+                        for follow_up in task.then(outcome["result"]):
+                            pending.setdefault(follow_up.account, deque()).append(follow_up)
+                    yield task, outcome
+
+
+def compliance_tasks(profiles, regions, collectors=REGIONAL_COLLECTORS):
+    """
+    Tasks for every account: collectors per region directly, or with regions="all"
+    a region lookup per account whose result expands into the collector tasks.
+    """
+    def region_tasks(profile, region_list):
+        account = account_label(profile)
+        return [Task(account, region, name, lambda fn=fn, region=region: fn(region, profile))
+                for region in region_list for name, fn in collectors.items()]
+
+    tasks = []
+    for profile in profiles:
+        if regions == "all":
+            tasks.append(Task(account_label(profile), None, "enabled_regions",
+                              lambda profile=profile: enabled_regions(profile),
+                              then=lambda found, profile=profile: region_tasks(profile, found)))
+        else:
+            tasks.extend(region_tasks(profile, regions))
+    return tasks
+
+
+class FanOutEvidence:
+    """Evidence document filled as results arrive; each result is also streamed as one JSON line."""
+
+    def __init__(self, home_region=DEFAULT_HOME_REGION, stream=None):
+        self.home_region = home_region
+        self.stream = stream
+        self.started = time.monotonic()
+        self.doc = {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "compliance_framework": "APPI",
+            "proof_type": "multi_account_fanout",
+            "home_region": home_region,
+            "accounts": {}
+        }
+
+    def add(self, task, outcome):
+        account = self.doc["accounts"].setdefault(task.account, {"regions": {}, "errors": []})
+        if task.region is None:
+            if outcome["status"] == "ok":
+                account["enabled_regions"] = outcome["result"]
+            else:
+                account["errors"].append({"collector": task.name, "error": outcome["error"]})
+        else:
+            region = account["regions"].setdefault(task.region, {})
+            if outcome["status"] == "ok":
+                region[task.name] = outcome["result"]
+            else:
+                region[task.name] = {"error": outcome["error"]}
+                account["errors"].append({"region": task.region, "collector": task.name, "error": outcome["error"]})
+        if self.stream:
+            line = {"account": task.account, "region": task.region, "collector": task.name,
+                    "status": outcome["status"], "elapsed_s": outcome["elapsed_s"],
+                    "data": outcome.get("result", outcome.get("error"))}
+            self.stream.write(json.dumps(line, default=str) + "\n")
+            self.stream.flush()
+
+    def summarize(self):
+        """Per-account residency/corridor assertions and the overall status"""
+        for account in self.doc["accounts"].values():
+            outside = defaultdict(list)
+            peering = 0
+            tgw_regions = []
+            for region, data in account["regions"].items():
+                for name in RESIDENCY_COLLECTORS:
+                    items = data.get(name)
+                    if isinstance(items, list) and region != self.home_region and items:
+                        outside[name].extend(f"{region}:{i.get('id') or i.get('snapshot_id')}" for i in items)
+                if isinstance(data.get("vpc_peering_connections"), list):
+                    peering += len(data["vpc_peering_connections"])
+                if data.get("transit_gateways"):
+                    tgw_regions.append(region)
+            account["compliance_check"] = {
+                "rds_outside_home_region": outside.get("rds_instances", []),
+                "snapshots_outside_home_region": outside.get("rds_snapshots", []),
+                "resources_outside_home_region": {name: ids for name, ids in outside.items() if ids},
+                "vpc_peering_violations": peering,
+                "regions_with_tgw": sorted(tgw_regions),
+                "complete": not account["errors"],
+                "assertion": "FAIL ❌" if outside or peering else
+                             ("PASS ✅" if not account["errors"] else "INCOMPLETE ⚠️")
+            }
+        assertions = [a["compliance_check"]["assertion"] for a in self.doc["accounts"].values()]
+        self.doc["summary"] = {
+            "accounts": len(assertions),
+            "regions_scanned": sum(len(a["regions"]) for a in self.doc["accounts"].values()),
+            "failed_accounts": sorted(k for k, a in self.doc["accounts"].items()
+                                      if a["compliance_check"]["assertion"].startswith("FAIL")),
+            "elapsed_s": round(time.monotonic() - self.started, 2),
+            "assertion": "FAIL ❌" if any(a.startswith("FAIL") for a in assertions) else
+                         ("PASS ✅" if all(a.startswith("PASS") for a in assertions) else "INCOMPLETE ⚠️")
+        }
+        return self.doc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the regional compliance collectors across accounts and regions")
+    parser.add_argument("--regions", nargs="+", default=["ap-northeast-1", "sa-east-1"],
+                        help='Regions to scan, or "all" for every enabled region (default: ap-northeast-1 sa-east-1)')
+    parser.add_argument("--roles", nargs="+", default=[], help="IAM role ARNs to assume")
+    parser.add_argument("--accounts", nargs="+", default=[], help="Account IDs; the role is --role-name")
+    parser.add_argument("--org", action="store_true", help="Every ACTIVE account in the organization")
+    parser.add_argument("--role-name", default="OrganizationAccountAccessRole",
+                        help="Role assumed in --accounts / --org accounts (default: OrganizationAccountAccessRole)")
+    parser.add_argument("--no-self", action="store_true", help="Do not scan with the current credentials")
+    parser.add_argument("--home-region", default=DEFAULT_HOME_REGION,
+                        help=f"Only region allowed to hold data (default: {DEFAULT_HOME_REGION})")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help=f"Tasks in flight overall (default: {DEFAULT_MAX_CONCURRENCY})")
+    parser.add_argument("--per-account", type=int, default=DEFAULT_PER_ACCOUNT,
+                        help=f"Tasks in flight per account (default: {DEFAULT_PER_ACCOUNT})")
+    parser.add_argument("--output", default="fanout_evidence.json")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH,
+                        help=f"SQLite evidence history this run is appended to (default: {DEFAULT_STORE_PATH})")
+    parser.add_argument("--no-store", action="store_true", help="Do not append this run to the evidence history")
+    args = parser.parse_args()
+
+    accounts = list(args.accounts) + (organization_accounts() if args.org else [])
+    profiles = [] if args.no_self else [None]
+    profiles += list(args.roles) + [f"arn:aws:iam::{a}:role/{args.role_name}" for a in dict.fromkeys(accounts)]
+    regions = "all" if args.regions == ["all"] else args.regions
+
+    print("=" * 80)
+    print("Lab 3B — Multi-Account, Multi-Region Compliance Fan-Out")
+    print(f"Accounts: {len(profiles)}  Regions: {'all enabled' if regions == 'all' else ', '.join(regions)}")
+    print("=" * 80)
+
+    stream_file = args.output.rsplit(".", 1)[0] + ".jsonl"
+    with open(stream_file, "w") as stream:
+        evidence = FanOutEvidence(args.home_region, stream)
+        for task, outcome in FanOut(args.max_concurrency, args.per_account).run(compliance_tasks(profiles, regions)):
+            evidence.add(task, outcome)
+            mark = "✅" if outcome["status"] == "ok" else "❌"
+            print(f"{mark} {task.account} {task.region or '-'} {task.name} ({outcome['elapsed_s']}s)")
+    doc = evidence.summarize()
+
+    with open(args.output, "w") as f:
+        json.dump(doc, f, indent=2, default=str)
+    if not args.no_store:
+        with EvidenceStore(args.store) as store:
+            store.ingest_file(args.output)
+
+    print(f"\n📊 {doc['summary']['accounts']} account(s), {doc['summary']['regions_scanned']} region(s) "
+          f"in {doc['summary']['elapsed_s']}s")
+    for account, data in doc["accounts"].items():
+        print(f"  {account}: {data['compliance_check']['assertion']}")
+    print(f"\n  Compliance Status: {doc['summary']['assertion']}")
+    print(f"\n✅ Evidence saved to: {args.output} (streamed: {stream_file})")
+    print("=" * 80)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
-import boto3, time, argparse
+import time, argparse, heapq, json, math, re
+from collections import deque
 from datetime import datetime, timezone, timedelta
 
+from botocore.exceptions import ClientError
+
+from malgus_aws import get_client
+from malgus_cloudtrail_collector import TokenBucket
+
 # Reason why Darth Malgus would be pleased with this script.
 # Malgus wants answers extracted from chaos—logs become obedient.
 
@@ -12,37 +18,516 @@ from datetime import datetime, timezone, timedelta
 # "I built an automated Logs Insights runner to standardize incident queries and return
 #  consistent evidence blocks for reports and paging."
 
-logs = boto3.client("logs")
+logs = get_client("logs")
+
+# Concurrent Logs Insights queries per account and region (service quota). When other
+# users hold some of them, StartQuery fails with LimitExceededException and the runner
+# lowers its own limit to what is in flight, then raises it by one per finished query.
+DEFAULT_MAX_CONCURRENT = 30
+# StartQuery and GetQueryResults are limited to 5 requests/second each
+START_QUERY_TPS = 5.0
+GET_RESULTS_TPS = 5.0
+# Seconds one query may take (including waiting for a free slot) before it is stopped
+DEFAULT_QUERY_TIMEOUT = 900
+# Poll interval bounds; see next_poll_interval()
+POLL_MIN = 0.5
+POLL_MAX = 10.0
+FINISHED = {"Complete", "Failed", "Cancelled", "Timeout", "Unknown"}
+# Logs Insights returns at most this many rows per query
+MAX_ROWS = 10000
+# Windows longer than this are split into shards of this length that run in parallel
+DEFAULT_SHARD_MINUTES = 60
+# A shard that hit MAX_ROWS is split in half again, down to this length
+MIN_SHARD_SECONDS = 60
+# stats aggregations whose per-shard values combine exactly: function -> combine op
+MERGEABLE_AGGREGATIONS = {"count": "sum", "sum": "sum", "min": "min", "max": "max"}
+
+
+class QueryJob:
+    """
+    One Logs Insights query over one or more log groups and a fixed time range
+    (startTime and endTime are both inclusive). `then(outcome)` may return follow-up
+    jobs once the query completed.
+    """
+
+    def __init__(self, name, log_groups, query, start, end, limit=None, then=None):
+        self.name = name
+        self.log_groups = [log_groups] if isinstance(log_groups, str) else list(log_groups)
+        self.query = query
+        self.start = start
+        self.end = end
+        self.limit = limit
+        self.then = then
+
+    @classmethod
+    def last(cls, name, log_groups, query, minutes=15, limit=None, now=None):
+        """Job over the last `minutes` up to `now` (default: the current time)"""
+        now = now or datetime.now(timezone.utc)
+        return cls(name, log_groups, query, int((now - timedelta(minutes=minutes)).timestamp()),
+                   int(now.timestamp()), limit)
+
+    def start_query_args(self):
+        args = {"logGroupNames": self.log_groups, "startTime": self.start, "endTime": self.end,
+                "queryString": self.query}
+        if self.limit:
+            args["limit"] = self.limit
+        return args
+
+
+def next_poll_interval(interval, scanned, previous, status):
+    """
+    Poll interval after one GetQueryResults, driven by statistics.recordsScanned:
+    - still queued (Scheduled, nothing scanned): back off x2, the query has not begun
+    - scanning (recordsScanned grew): back off x1.5, a long scan will not finish soon
+    - scanned > 0 but no longer growing: the scan is done and only the aggregation is
+      left, so poll again at POLL_MIN
+    """
+    if status == "Scheduled" or scanned == 0:
+        interval *= 2
+    elif scanned > previous:
+        interval *= 1.5
+    else:
+        interval = POLL_MIN
+    return max(POLL_MIN, min(POLL_MAX, interval))
+
+
+def _error_code(e):
+    return e.response.get("Error", {}).get("Code") if isinstance(e, ClientError) else None
+
+
+class QueryRunner:
+    """
+    Runs many QueryJobs at once and yields (job, outcome) as each one finishes.
+
+    outcome: {"status": "ok"|"error", "query_status", "query_id", "results",
+    "statistics", "polls", "elapsed_s", "error"}. Every running query has its own
+    poll time (next_poll_interval); one loop polls whichever is due next.
+    """
+
+    def __init__(self, client=None, max_concurrent=DEFAULT_MAX_CONCURRENT, timeout=DEFAULT_QUERY_TIMEOUT):
+        self.client = client or logs
+        self.max_concurrent = max(1, max_concurrent)
+        self.timeout = timeout
+        self.start_bucket = TokenBucket(START_QUERY_TPS)
+        self.results_bucket = TokenBucket(GET_RESULTS_TPS)
+        self.stats = {"started": 0, "polls": 0, "limit_exceeded": 0, "peak_in_flight": 0}
+
+    @staticmethod
+    def _outcome(status, started, query_id=None, query_status=None, response=None, polls=0, error=None):
+        response = response or {}
+        outcome = {"status": status, "query_status": query_status, "query_id": query_id,
+                   "results": response.get("results", []), "statistics": response.get("statistics", {}),
+                   "polls": polls, "elapsed_s": round(time.monotonic() - started, 2)}
+        if error:
+            outcome["error"] = error
+        return outcome
+
+    def _stop(self, query_id):
+        try:
+            self.client.stop_query(queryId=query_id)
+        except Exception:
+            pass
+
+    def run(self, jobs):
+        pending = deque((job, time.monotonic()) for job in jobs)
+        running = {}
+        due = []
+        limit = self.max_concurrent
+        seq = 0
+        while pending or running:
+            # Start as many queries as the current limit allows
+            while pending and len(running) < limit:
+                job, queued = pending[0]
+                if time.monotonic() - queued > self.timeout:
+                    pending.popleft()
+                    yield job, self._outcome("error", queued, query_status="Timeout",
+                                             error="Logs Insights query timed out waiting for a free query slot")
+                    continue
+                self.start_bucket.acquire()
+                try:
+                    query_id = self.client.start_query(**job.start_query_args())["queryId"]
+                except Exception as e:
+                    if _error_code(e) == "LimitExceededException":
+                        self.stats["limit_exceeded"] += 1
+                        limit = max(1, len(running))
+                        if not running:
+                            time.sleep(POLL_MAX)
+                        break
+                    pending.popleft()
+                    yield job, self._outcome("error", queued, error=f"{type(e).__name__}: {e}")
+                    continue
+                pending.popleft()
+                self.stats["started"] += 1
+                running[query_id] = {"job": job, "queued": queued, "interval": POLL_MIN, "scanned": 0, "polls": 0}
+                self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], len(running))
+                seq += 1
+                heapq.heappush(due, (time.monotonic() + POLL_MIN, seq, query_id))
+            if not running:
+                continue
+
+            when, _, query_id = heapq.heappop(due)
+            time.sleep(max(0.0, when - time.monotonic()))
+            state = running[query_id]
+            job = state["job"]
+            self.results_bucket.acquire()
+            state["polls"] += 1
+            self.stats["polls"] += 1
+            try:
+                r = self.client.get_query_results(queryId=query_id)
+            except Exception as e:
+                del running[query_id]
+                self._stop(query_id)
+                yield job, self._outcome("error", state["queued"], query_id, polls=state["polls"],
+                                         error=f"{type(e).__name__}: {e}")
+                continue
+            status = r.get("status")
+            if status in FINISHED:
+                del running[query_id]
+                limit = min(self.max_concurrent, limit + 1)
+                if status == "Complete":
+                    outcome = self._outcome("ok", state["queued"], query_id, status, r, state["polls"])
+                    if job.then:
+                        for follow_up in job.then(outcome):
+                            pending.append((follow_up, time.monotonic()))
+                    yield job, outcome
+                else:
+                    yield job, self._outcome("error", state["queued"], query_id, status, r, state["polls"],
+                                             error=f"Query ended: {status}")
+                continue
+            if time.monotonic() - state["queued"] > self.timeout:
+                del running[query_id]
+                self._stop(query_id)
+                yield job, self._outcome("error", state["queued"], query_id, "Timeout", r, state["polls"],
+                                         error="Logs Insights query timed out")
+                continue
+            scanned = r.get("statistics", {}).get("recordsScanned", 0)
+            state["interval"] = next_poll_interval(state["interval"], scanned, state["scanned"], status)
+            state["scanned"] = scanned
+            seq += 1
+            heapq.heappush(due, (time.monotonic() + state["interval"], seq, query_id))
+
+
+# ----------------------------------------------------------------------
+# Time-sharded queries
+# ----------------------------------------------------------------------
+
+def _top_level(text):
+    """Indexes of characters outside quotes, /regex/ literals and parentheses"""
+    depth, quote = 0, None
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote and text[i - 1] != "\\":
+                quote = None
+        elif ch in "'\"`":
+            quote = ch
+        elif ch == "/" and re.search(r"(?:[(,=~!]|\blike|\bin)\s*$", text[:i], re.I):
+            quote = "/"
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif depth == 0:
+            yield i
+
+def _split_top(text, sep):
+    parts, last = [], 0
+    for i in _top_level(text):
+        if text[i] == sep:
+            parts.append(text[last:i])
+            last = i + 1
+    return [p.strip() for p in parts + [text[last:]]]
 
-def run_query(group, query, minutes=15, limit=25):
-    end = int(datetime.now(timezone.utc).timestamp())
-    start = int((datetime.now(timezone.utc) - timedelta(minutes=minutes)).timestamp())
+def _command(text):
+    return text.split(None, 1)[0].lower() if text.strip() else ""
 
-    qid = logs.start_query(
-        logGroupName=group, startTime=start, endTime=end,
-        queryString=query, limit=limit
-    )["queryId"]
+def _sort_keys(text):
+    """'sort a desc, b' -> [("a", True), ("b", False)]"""
+    keys = []
+    for item in _split_top(text.split(None, 1)[1] if len(text.split(None, 1)) > 1 else "", ","):
+        words = item.split()
+        if words:
+            keys.append((words[0], len(words) > 1 and words[-1].lower() == "desc"))
+    return keys
 
-    for _ in range(30):
-        r = logs.get_query_results(queryId=qid)
-        if r["status"] == "Complete":
-            return r["results"]
-        if r["status"] in ("Failed", "Cancelled", "Timeout"):
-            raise RuntimeError(f"Query ended: {r['status']}")
-        time.sleep(1)
-    raise TimeoutError("Logs Insights query timed out")
+def plan_query(query):
+    """
+    How a query is sharded:
+    - "rows": no stats; shard results are concatenated in @timestamp order (or re-sorted
+      by the query's sort fields) and cut to its limit
+    - "stats": one stats command of count/sum/min/max only (grouped by fields and/or
+      bin()); shards run without the trailing sort/limit, which are applied after
+      combining the groups on the client
+    - "single": anything else (avg, pct, count_distinct, commands after stats, dedup,
+      ...) runs over the whole window as one query
+    """
+    commands = _split_top(query, "|")
+    names = [_command(c) for c in commands]
+    stats = [i for i, n in enumerate(names) if n == "stats"]
+    trailing = {"sort": [], "limit": None}
+    if not stats:
+        if "dedup" in names:
+            return {"kind": "single", "query": query, "reason": "dedup does not combine across shards"}
+        for c, n in zip(commands, names):
+            if n == "sort":
+                trailing["sort"] = _sort_keys(c)
+            elif n == "limit" and c.split()[-1].isdigit():
+                trailing["limit"] = int(c.split()[-1])
+        return dict(trailing, kind="rows", query=query)
+    if len(stats) > 1:
+        return {"kind": "single", "query": query, "reason": "more than one stats command"}
+    for c, n in zip(commands[stats[0] + 1:], names[stats[0] + 1:]):
+        if n == "sort":
+            trailing["sort"] = _sort_keys(c)
+        elif n == "limit" and c.split()[-1].isdigit():
+            trailing["limit"] = int(c.split()[-1])
+        else:
+            return {"kind": "single", "query": query, "reason": f"{n} after stats"}
+    body = commands[stats[0]].split(None, 1)[1] if len(commands[stats[0]].split(None, 1)) > 1 else ""
+    by = next((i for i in _top_level(body) if re.match(r"by\b", body[i:], re.I) and body[i - 1:i].isspace()), None)
+    aggregations = {}
+    for item in _split_top(body if by is None else body[:by], ","):
+        m = re.match(r"^(\w+)\s*\(.*\)(?:\s+as\s+(\S+))?$", item, re.I | re.S)
+        if not m or m.group(1).lower() not in MERGEABLE_AGGREGATIONS:
+            return {"kind": "single", "query": query, "reason": f"{item} does not combine across shards"}
+        name = m.group(2) or item
+        aggregations[name] = MERGEABLE_AGGREGATIONS[m.group(1).lower()]
+    return dict(trailing, kind="stats", aggregations=aggregations,
+                query=" | ".join(commands[:stats[0] + 1]))
+
+def shard_window(start, end, seconds):
+    """[start, end] (inclusive, epoch seconds) as consecutive inclusive sub-ranges"""
+    if seconds <= 0 or end - start < seconds:
+        return [(start, end)]
+    count = math.ceil((end - start + 1) / seconds)
+    step = (end - start + 1) / count
+    bounds = [start + round(i * step) for i in range(count)] + [end + 1]
+    return [(bounds[i], bounds[i + 1] - 1) for i in range(count)]
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _format_number(x):
+    return str(int(x)) if x.is_integer() else repr(x)
+
+def _combine(op, a, b):
+    if a is None or b is None:
+        return b if a is None else a
+    x, y = _number(a), _number(b)
+    if x is None or y is None:
+        # min/max of timestamps and strings compare as text
+        return {"min": min, "max": max}.get(op, lambda p, q: p)(a, b)
+    return _format_number({"sum": x + y, "min": min(x, y), "max": max(x, y)}[op])
+
+def merge_stats(parts, aggregations):
+    """Combine per-shard stats rows: same group key (all non-aggregate fields, bin() included)"""
+    groups = {}
+    for rows in parts:
+        for row in rows:
+            fields = [(x["field"], x.get("value")) for x in row]
+            key = tuple((f, v) for f, v in fields if f not in aggregations)
+            if key not in groups:
+                groups[key] = dict(fields)
+                continue
+            merged = groups[key]
+            for f, v in fields:
+                if f in aggregations:
+                    merged[f] = _combine(aggregations[f], merged.get(f), v)
+    return [[{"field": f, "value": v} for f, v in merged.items()] for merged in groups.values()]
+
+def sort_rows(rows, keys):
+    """Client-side `sort`: numbers numerically, everything else as text, missing last"""
+    def value(row, field):
+        v = next((x.get("value") for x in row if x["field"] == field), None)
+        n = _number(v)
+        return (0, n, "") if n is not None else (1, 0, v) if v is not None else (2, 0, "")
+    for field, desc in reversed(keys):
+        present = [r for r in rows if value(r, field)[0] < 2]
+        missing = [r for r in rows if value(r, field)[0] == 2]
+        rows = sorted(present, key=lambda r: value(r, field), reverse=desc) + missing
+    return rows
+
+
+class ShardedQuery:
+    """
+    One query over a long window, run as parallel time shards on a QueryRunner (see
+    plan_query). A shard that returns MAX_ROWS rows was cut off; it is split in half
+    and both halves run again, down to MIN_SHARD_SECONDS.
+    """
+
+    def __init__(self, name, log_groups, query, start, end, shard_seconds=DEFAULT_SHARD_MINUTES * 60, limit=None):
+        self.name = name
+        self.log_groups = log_groups
+        self.start = start
+        self.end = end
+        self.shard_seconds = shard_seconds
+        self.limit = limit or None
+        self.plan = plan_query(query)
+        self.parts = {}
+        self.errors = []
+        self.timed_out = False
+        self.splits = 0
+        self.truncated = 0
+        self.outstanding = 0
+        self.statistics = {}
+        self.started = time.monotonic()
+
+    @classmethod
+    def of(cls, job, shard_seconds=DEFAULT_SHARD_MINUTES * 60):
+        return cls(job.name, job.log_groups, job.query, job.start, job.end, shard_seconds, job.limit)
+
+    def _shard_limit(self):
+        if self.plan["kind"] == "rows":
+            return min(n for n in (self.limit, self.plan["limit"], MAX_ROWS) if n)
+        if self.plan["kind"] == "single":
+            return self.limit or MAX_ROWS
+        return MAX_ROWS
+
+    def _job(self, start, end):
+        fmt = lambda t: datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+        job = QueryJob(f"{self.name} [{fmt(start)} .. {fmt(end)}]", self.log_groups, self.plan["query"],
+                       start, end, self._shard_limit())
+        job.then = lambda outcome: self._split(job, outcome)
+        job.sharded = self
+        self.outstanding += 1
+        return job
+
+    def jobs(self):
+        seconds = 0 if self.plan["kind"] == "single" else self.shard_seconds
+        return [self._job(s, e) for s, e in shard_window(self.start, self.end, seconds)]
+
+    def _split(self, job, outcome):
+        if len(outcome["results"]) < MAX_ROWS or self._shard_limit() < MAX_ROWS:
+            return []
+        if self.plan["kind"] == "single" or job.end - job.start + 1 < 2 * MIN_SHARD_SECONDS:
+            self.truncated += 1
+            return []
+        job.split = True
+        self.splits += 1
+        middle = (job.start + job.end) // 2
+        return [self._job(job.start, middle), self._job(middle + 1, job.end)]
+
+    def finished(self, job, outcome):
+        """Record one shard outcome; True once every shard (and re-split shard) is in"""
+        self.outstanding -= 1
+        if outcome["status"] != "ok":
+            self.errors.append(f"{job.name}: {outcome['error']}")
+            if outcome["query_status"] == "Timeout" and not outcome["error"].startswith("Query ended"):
+                self.timed_out = True
+        elif not getattr(job, "split", False):
+            self.parts[job.start] = outcome["results"]
+            for k, v in outcome["statistics"].items():
+                self.statistics[k] = self.statistics.get(k, 0) + v
+        return self.outstanding == 0
+
+    def results(self):
+        parts = [self.parts[s] for s in sorted(self.parts)]
+        plan = self.plan
+        if plan["kind"] == "stats":
+            rows = merge_stats(parts, plan["aggregations"])
+            rows = sort_rows(rows, plan["sort"]) if plan["sort"] else rows
+        elif plan["kind"] == "rows":
+            if plan["sort"] and plan["sort"][0][0] != "@timestamp":
+                rows = sort_rows([r for p in parts for r in p], plan["sort"])
+            else:
+                # Newest shard first unless the query sorts @timestamp ascending
+                ascending = bool(plan["sort"]) and not plan["sort"][0][1]
+                rows = [r for p in (parts if ascending else parts[::-1]) for r in p]
+        else:
+            rows = [r for p in parts for r in p]
+        limit = min((n for n in (self.limit, plan.get("limit")) if n), default=None)
+        return rows[:limit] if limit else rows
+
+    def outcome(self):
+        outcome = {"status": "error" if self.errors else "ok", "results": self.results(),
+                   "statistics": self.statistics, "shards": len(self.parts), "splits": self.splits,
+                   "truncated_shards": self.truncated, "complete": not self.errors and not self.truncated,
+                   "elapsed_s": round(time.monotonic() - self.started, 2)}
+        if self.plan["kind"] == "single":
+            outcome["not_sharded"] = self.plan["reason"]
+        if self.errors:
+            outcome["error"] = "; ".join(self.errors)
+        return outcome
+
+
+def run_sharded(queries, runner=None):
+    """Run ShardedQuerys together on one runner; yields (query, outcome) as each one completes"""
+    runner = runner or QueryRunner()
+    for job, outcome in runner.run([job for query in queries for job in query.jobs()]):
+        if job.sharded.finished(job, outcome):
+            yield job.sharded, job.sharded.outcome()
+
+def run_query(group, query, minutes=15, limit=25, shard_minutes=DEFAULT_SHARD_MINUTES):
+    sharded = ShardedQuery.of(QueryJob.last(query, group, query, minutes, limit), shard_minutes * 60)
+    for _, outcome in run_sharded([sharded]):
+        if outcome["status"] == "ok":
+            return outcome["results"]
+        raise (TimeoutError if sharded.timed_out else RuntimeError)(outcome["error"])
+
+def load_jobs(path, minutes, limit):
+    """
+    Jobs file: JSON list of {"name", "log_group" | "log_groups", "query",
+    optional "minutes", "limit"}; every window ends at the same moment.
+    """
+    now = datetime.now(timezone.utc)
+    with open(path) as f:
+        specs = json.load(f)
+    return [QueryJob.last(s.get("name", f"query-{i + 1}"), s.get("log_groups") or s["log_group"], s["query"],
+                          s.get("minutes", minutes), s.get("limit", limit), now)
+            for i, s in enumerate(specs)]
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--log-group", required=True)
+    ap.add_argument("--log-group", action="append", help="Log group to query (repeatable)")
     ap.add_argument("--minutes", type=int, default=15)
-    ap.add_argument("--query", required=True)
+    ap.add_argument("--query", action="append", help="Query to run against the log group(s) (repeatable)")
+    ap.add_argument("--limit", type=int, default=25, help="Max rows per query, 0 = all (default: 25)")
+    ap.add_argument("--shard-minutes", type=int, default=DEFAULT_SHARD_MINUTES,
+                    help=f"Split longer windows into parallel shards of this length, 0 = never (default: {DEFAULT_SHARD_MINUTES})")
+    ap.add_argument("--jobs", help="JSON file with many queries to run at once (see load_jobs)")
+    ap.add_argument("--max-concurrent", type=int, default=DEFAULT_MAX_CONCURRENT,
+                    help=f"Queries in flight at once (default: {DEFAULT_MAX_CONCURRENT}, the account quota)")
+    ap.add_argument("--timeout", type=float, default=DEFAULT_QUERY_TIMEOUT,
+                    help=f"Seconds per query before it is stopped (default: {DEFAULT_QUERY_TIMEOUT})")
     args = ap.parse_args()
 
-    results = run_query(args.log_group, args.query, args.minutes)
-    for row in results:
-        kv = {x["field"]: x["value"] for x in row}
-        print(kv)
+    jobs = load_jobs(args.jobs, args.minutes, args.limit) if args.jobs else []
+    if args.query:
+        if not args.log_group:
+            ap.error("--query needs --log-group")
+        now = datetime.now(timezone.utc)
+        jobs += [QueryJob.last(q if len(args.query) > 1 else args.log_group[0], args.log_group, q,
+                               args.minutes, args.limit, now) for q in args.query]
+    if not jobs:
+        ap.error("give --log-group and --query, or --jobs")
+
+    if len(jobs) == 1 and not args.jobs:
+        for row in run_query(args.log_group, args.query[0], args.minutes, args.limit, args.shard_minutes):
+            kv = {x["field"]: x["value"] for x in row}
+            print(kv)
+        return
+
+    runner = QueryRunner(max_concurrent=args.max_concurrent, timeout=args.timeout)
+    failed = 0
+    queries = [ShardedQuery.of(job, args.shard_minutes * 60) for job in jobs]
+    for query, outcome in run_sharded(queries, runner):
+        stats = outcome["statistics"]
+        if outcome["status"] == "ok":
+            print(f"✅ {query.name} ({outcome['elapsed_s']}s, {len(outcome['results'])} rows, "
+                  f"{int(stats.get('recordsScanned', 0))} records scanned, {outcome['shards']} shards)")
+            if not outcome["complete"]:
+                print(f"  ⚠️ {outcome['truncated_shards']} shard(s) still hit the {MAX_ROWS}-row cap")
+        else:
+            failed += 1
+            print(f"❌ {query.name}: {outcome['error']}")
+        for row in outcome["results"]:
+            kv = {x["field"]: x["value"] for x in row}
+            print(f"  {kv}")
+    print(f"\n{len(jobs) - failed}/{len(jobs)} queries complete, peak {runner.stats['peak_in_flight']} in flight, "
+          f"{runner.stats['polls']} polls, {runner.stats['limit_exceeded']} concurrency limit hits")
+    return 1 if failed else 0
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    raise SystemExit(main())
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Lab 3B — Compliance Proof Orchestrator
+======================================
+Purpose: Run every compliance proof once, in one process, into one evidence bundle.
+
+- Proofs form a dependency graph; every proof whose dependencies are done runs in
+  parallel with the others, and the bundle is written when all of them finished.
+- All AWS clients share one per-run memo (malgus_aws.memoize_calls): identical
+  read-only requests made by different proofs (describe_transit_gateways,
+  describe_db_instances, ...) are sent once, also when they are in flight at the
+  same time.
+- The data residency, network corridor and TGW snapshot proofs go into the same
+  bundle as the audit package proofs instead of separate files.
+
+Usage:
+    python3 malgus_orchestrator.py
+    python3 malgus_orchestrator.py --proofs data_residency network_corridor
+"""
+
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from malgus_audit_evidence_package import (
+    DEFAULT_COLLECTOR_TIMEOUT, DEFAULT_DEADLINE, DEFAULT_TRAIL_DAYS, DEFAULT_TRAIL_REGIONS, DEFAULT_WORKERS,
+    AuditEvidencePackage,
+)
+from malgus_aws import memoize_calls
+from malgus_cloudtrail_collector import DEFAULT_SLICE_HOURS
+from malgus_data_residency_enhanced import build_data_residency_proof
+from malgus_evidence_cache import DEFAULT_CACHE_PATH
+from malgus_evidence_store import DEFAULT_STORE_PATH, EvidenceStore
+from malgus_network_corridor_proof import build_network_corridor_proof
+from malgus_tgw_corridor_proof import build_tgw_snapshot
+
+# Proofs bundled as their own members: proof name -> file name in the bundle
+ATTACHED_PROOFS = {
+    "data_residency": "data_residency_proof.json",
+    "network_corridor": "network_corridor_proof.json",
+    "tgw_snapshot": "tgw_snapshot.json",
+}
+# Proofs assembled inside audit_evidence_package.json by AuditEvidencePackage
+PACKAGE_PROOFS = ["change_trail", "edge_security", "flow_logs"]
+
+
+def run_graph(graph, workers):
+    """
+    Run graph = {name: (dependencies, fn)}; fn(outcomes) gets the outcomes of the
+    nodes finished so far. A node starts once all its dependencies finished (ok or
+    error), so one failing proof never blocks the bundle. Returns
+    {name: {"status", "elapsed_s", "result" | "error"}}.
+    """
+    outcomes = {}
+    lock = threading.Lock()
+    remaining = dict(graph)
+    running = {}
+
+    def run(name, fn):
+        started = time.monotonic()
+        try:
+            with lock:
+                done = dict(outcomes)
+            outcome = {"status": "ok", "result": fn(done)}
+        except Exception as e:
+            outcome = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        outcome["elapsed_s"] = round(time.monotonic() - started, 2)
+        return outcome
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        while remaining or running:
+            ready = [name for name, (deps, _) in remaining.items() if all(d in outcomes for d in deps)]
+            if not ready and not running:
+                raise ValueError(f"dependency cycle or unknown dependency: {', '.join(sorted(remaining))}")
+            for name in ready:
+                running[pool.submit(run, name, remaining.pop(name)[1])] = name
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                outcome = future.result()
+                with lock:
+                    outcomes[name] = outcome
+                if outcome["status"] == "ok":
+                    print(f"✅ {name} ({outcome['elapsed_s']}s)")
+                else:
+                    print(f"❌ {name}: {outcome['error']}")
+    return outcomes
+
+
+class ProofOrchestrator:
+    def __init__(self, package, proofs=None, workers=None):
+        self.package = package
+        self.proofs = proofs or list(ATTACHED_PROOFS) + PACKAGE_PROOFS
+        self.workers = workers or len(self.proofs)
+
+    def package_proof(self, name):
+        """One AuditEvidencePackage proof: its collectors under the package deadline, then assembly."""
+        def build(done):
+            results = self.package.run_collectors(self.package.collectors([name]))
+            getattr(self.package, f"assemble_{name}")(results)
+            return self.package.evidence_bundle["proofs"][name]
+        return build
+
+    def graph(self):
+        """{proof: (dependencies, build)}; the bundle depends on every selected proof."""
+        builders = {
+            "data_residency": lambda done: build_data_residency_proof(),
+            "network_corridor": lambda done: build_network_corridor_proof(),
+            "tgw_snapshot": lambda done: build_tgw_snapshot(),
+        }
+        for name in PACKAGE_PROOFS:
+            builders[name] = self.package_proof(name)
+        graph = {name: ((), builders[name]) for name in self.proofs}
+        graph["bundle"] = (tuple(self.proofs), self.write_bundle)
+        return graph
+
+    def write_bundle(self, done):
+        for name, filename in ATTACHED_PROOFS.items():
+            outcome = done.get(name)
+            if outcome is None:
+                continue
+            if outcome["status"] == "ok":
+                self.package.attach_proof(filename, outcome["result"])
+            else:
+                self.package.attach_proof(filename, {
+                    "error": outcome["error"],
+                    "compliance_check": {"assertion": "FAIL ❌ (proof could not be collected)"}
+                })
+        self.package.evidence_bundle["orchestration"] = {
+            "proofs": {name: {k: v for k, v in o.items() if k != "result"} for name, o in done.items()},
+            "api_memo": dict(self.memo.stats),
+        }
+        self.package.finalize()
+        return self.package.write_bundle()
+
+    def run(self):
+        print("=" * 80)
+        print("Lab 3B — Compliance Proof Orchestrator")
+        print(f"Proofs: {', '.join(self.proofs)} ({self.workers} in parallel)")
+        print("=" * 80)
+        started = time.monotonic()
+        with memoize_calls() as self.memo:
+            outcomes = run_graph(self.graph(), self.workers)
+        bundle = outcomes["bundle"]
+        if bundle["status"] != "ok":
+            raise RuntimeError(f"bundle not written: {bundle['error']}")
+        zip_filename, manifest = bundle["result"]
+        print(f"\n📦 ZIP package: {zip_filename}")
+        print(f"🔐 Merkle root (sha256): {manifest['merkle_root']}")
+        print(f"🔁 API calls sent: {self.memo.stats['sent']}, deduplicated: {self.memo.stats['deduplicated']}")
+        print(f"⏱️ Total: {time.monotonic() - started:.1f}s")
+        print("\n" + "=" * 80)
+        print("Evidence Summary:")
+        print(json.dumps(self.package.evidence_bundle["compliance_summary"], indent=2, ensure_ascii=False))
+        print("=" * 80)
+        return zip_filename
+
+
+if __name__ == "__main__":
+    all_proofs = list(ATTACHED_PROOFS) + PACKAGE_PROOFS
+    parser = argparse.ArgumentParser(description="Run every Lab 3B compliance proof into one evidence bundle")
+    parser.add_argument("--proofs", nargs="+", choices=all_proofs, default=all_proofs,
+                        help="Proofs to run (default: all)")
+    parser.add_argument("--parallel", type=int, default=None,
+                        help="Proofs running at once (default: all selected)")
+    parser.add_argument("--deadline", type=float, default=DEFAULT_DEADLINE,
+                        help=f"Seconds per audit package proof; unfinished collectors become partial results (default: {DEFAULT_DEADLINE})")
+    parser.add_argument("--collector-timeout", type=float, default=DEFAULT_COLLECTOR_TIMEOUT,
+                        help=f"Seconds one collector may take (default: {DEFAULT_COLLECTOR_TIMEOUT})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Collectors running at once per proof (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--trail-regions", nargs="+", default=DEFAULT_TRAIL_REGIONS,
+                        help=f"Regions whose CloudTrail event history is collected (default: {' '.join(DEFAULT_TRAIL_REGIONS)})")
+    parser.add_argument("--trail-days", type=float, default=DEFAULT_TRAIL_DAYS,
+                        help=f"CloudTrail window in days (default: {DEFAULT_TRAIL_DAYS})")
+    parser.add_argument("--slice-hours", type=int, default=DEFAULT_SLICE_HOURS,
+                        help=f"Hour-aligned CloudTrail slice length fetched in parallel (default: {DEFAULT_SLICE_HOURS})")
+    parser.add_argument("--cache", default=DEFAULT_CACHE_PATH,
+                        help=f"Evidence cache reused between runs (default: {DEFAULT_CACHE_PATH})")
+    parser.add_argument("--no-cache", action="store_true", help="Fetch everything again and keep no cache")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH,
+                        help=f"SQLite evidence history this run is appended to (default: {DEFAULT_STORE_PATH})")
+    parser.add_argument("--no-store", action="store_true", help="Do not append this run to the evidence history")
+    args = parser.parse_args()
+
+    package = AuditEvidencePackage(args.deadline, args.collector_timeout, args.workers,
+                                   args.trail_regions, args.trail_days, args.slice_hours,
+                                   None if args.no_cache else args.cache)
+    zip_filename = ProofOrchestrator(package, args.proofs, args.parallel).run()
+    if not args.no_store:
+        with EvidenceStore(args.store) as store:
+            store.ingest_file(zip_filename)
+        print(f"🗄️ Appended to evidence history: {args.store}")
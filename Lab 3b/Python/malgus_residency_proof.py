@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
-import boto3, json
+import json
+
+from malgus_aws import get_client
 
 # Reason why Darth Malgus would be pleased with this script.
 # Malgus wants proof, not opinions: "Show me the database lives ONLY in Tokyo."
@@ -9,10 +11,10 @@ import boto3, json
 # "I automated data residency verification by checking RDS inventory across regions and exporting an audit artifact."
 
 def list_rds(region):
-    rds = boto3.client("rds", region_name=region)
-    resp = rds.describe_db_instances()
+    rds = get_client("rds", region)
     out = []
-    for d in resp.get("DBInstances", []):
+    pages = rds.get_paginator("describe_db_instances").paginate()
+    for d in (d for page in pages for d in page.get("DBInstances", [])):
         out.append({
             "region": region,
             "id": d["DBInstanceIdentifier"],
@@ -0,0 +1,494 @@
+#!/usr/bin/env python3
+"""
+Lab 3B — Cross-Region Routing Model (Reachability Proof Engine)
+===============================================================
+Purpose: Answer "does source CIDR X reach destination Y, and through which
+attachments?" from the actual VPC and Transit Gateway route tables of every region.
+
+- Every VPC route table, TGW route table and the subnet map is loaded into its own
+  binary radix trie; longest-prefix match is one walk down at most 32 (IPv4) or 128
+  (IPv6) bits, independent of the number of routes.
+- A lookup follows the packet: subnet → VPC route table → TGW attachment → TGW route
+  table (association) → peering attachment → peer TGW route table → destination VPC.
+  Blackholes, missing associations, VPC peering and exits (IGW, NAT, VPN, ...) are
+  reported as such.
+- A destination CIDR matches the longest route that covers the whole CIDR.
+- All route tables of all TGWs are fetched concurrently with their associations and
+  propagations. Route searches cut at the 1000-route cap are re-run per address
+  range, halving the range until nothing is truncated.
+
+The topology is plain JSON (collect_topology() per region), so proofs can be
+re-evaluated offline from saved evidence.
+
+Usage:
+    python3 malgus_routing.py --src-region sa-east-1 --src 10.20.1.0/24 --dst 10.10.1.0/24
+    python3 malgus_routing.py --save-topology topology.json
+    python3 malgus_routing.py --topology topology.json --src-region sa-east-1 --src 10.20.1.5 --dst 10.10.0.0/16
+"""
+
+import argparse
+import ipaddress
+import json
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from malgus_aws import get_client
+
+MAX_HOPS = 16
+# search_transit_gateway_routes returns at most this many routes per call
+ROUTE_SEARCH_MAX = 1000
+DEFAULT_ROUTE_WORKERS = 16
+
+
+@lru_cache(maxsize=65536)
+def _prefix(cidr):
+    """(version, network bits, prefix length, address width) of an address or CIDR"""
+    net = ipaddress.ip_network(cidr, strict=False)
+    return net.version, int(net.network_address), net.prefixlen, net.max_prefixlen
+
+
+class PrefixTrie:
+    """
+    Binary radix trie of IP prefixes. lookup() returns (prefix, value) of the longest
+    stored prefix that covers the whole query address/CIDR, or None.
+    """
+
+    def __init__(self):
+        # node = [child for bit 0, child for bit 1, (prefix, value) or None]
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, cidr, value):
+        version, bits, length, width = _prefix(cidr)
+        node = self._roots[version]
+        for i in range(length):
+            bit = (bits >> (width - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            self._size += 1
+        node[2] = (str(ipaddress.ip_network(cidr, strict=False)), value)
+
+    def lookup(self, cidr):
+        version, bits, length, width = _prefix(cidr)
+        node = self._roots[version]
+        best = node[2]
+        for i in range(length):
+            node = node[(bits >> (width - 1 - i)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                best = node[2]
+        return best
+
+
+# ----------------------------------------------------------------------
+# Topology collection (one region)
+# ----------------------------------------------------------------------
+
+def vpc_route_target(route):
+    """(target type, target id) of a VPC route"""
+    if route.get('TransitGatewayId'):
+        return "transit_gateway", route['TransitGatewayId']
+    if route.get('VpcPeeringConnectionId'):
+        return "vpc_peering", route['VpcPeeringConnectionId']
+    gateway = route.get('GatewayId', '')
+    if gateway == 'local':
+        return "local", "local"
+    for key, kind in (('NatGatewayId', 'nat_gateway'), ('NetworkInterfaceId', 'network_interface'),
+                      ('EgressOnlyInternetGatewayId', 'egress_only_gateway'), ('InstanceId', 'instance'),
+                      ('LocalGatewayId', 'local_gateway'), ('CarrierGatewayId', 'carrier_gateway'),
+                      ('CoreNetworkArn', 'core_network')):
+        if route.get(key):
+            return kind, route[key]
+    if gateway.startswith('igw-'):
+        return "internet_gateway", gateway
+    if gateway.startswith('vgw-'):
+        return "vpn_gateway", gateway
+    return "unknown", gateway or "unknown"
+
+
+def _paginate(client, operation, key, **kwargs):
+    return [item for page in client.get_paginator(operation).paginate(**kwargs) for item in page.get(key, [])]
+
+
+def _route(r):
+    attachment = (r.get('TransitGatewayAttachments') or [{}])[0]
+    return {
+        "destination": r.get('DestinationCidrBlock'),
+        "prefix_list_id": r.get('PrefixListId'),
+        "attachment_id": attachment.get('TransitGatewayAttachmentId'),
+        "resource_type": attachment.get('ResourceType'),
+        "resource_id": attachment.get('ResourceId'),
+        "type": r.get('Type'),
+        "state": r.get('State')
+    }
+
+
+def search_tgw_routes(ec2, rt_id, stats=None):
+    """
+    Every active/blackhole route of one TGW route table.
+
+    search_transit_gateway_routes has no NextToken: a result with
+    AdditionalRoutesAvailable is cut at ROUTE_SEARCH_MAX. The search is then repeated
+    per address range (route-search.subnet-of-match), splitting a range in halves
+    until each half fits; routes exactly on a split range are fetched with
+    route-search.exact-match.
+    """
+    stats = stats if stats is not None else {}
+
+    def search(*filters):
+        stats["searches"] = stats.get("searches", 0) + 1
+        response = ec2.search_transit_gateway_routes(
+            TransitGatewayRouteTableId=rt_id,
+            Filters=[{'Name': 'state', 'Values': ['active', 'blackhole']}] + list(filters),
+            MaxResults=ROUTE_SEARCH_MAX
+        )
+        return response.get('Routes', []), response.get('AdditionalRoutesAvailable', False)
+
+    def in_range(cidr):
+        routes, more = search({'Name': 'route-search.subnet-of-match', 'Values': [cidr]})
+        if not more:
+            return routes
+        net = ipaddress.ip_network(cidr)
+        if net.prefixlen == net.max_prefixlen:
+            stats["truncated"] = stats.get("truncated", 0) + 1
+            return routes
+        stats["splits"] = stats.get("splits", 0) + 1
+        routes, _ = search({'Name': 'route-search.exact-match', 'Values': [cidr]})
+        for half in net.subnets(1):
+            routes = routes + in_range(str(half))
+        return routes
+
+    routes, more = search()
+    if more:
+        routes = [r for r in routes if not r.get('DestinationCidrBlock')]  # prefix-list routes
+        for root in ('0.0.0.0/0', '::/0'):
+            routes += search({'Name': 'route-search.exact-match', 'Values': [root]})[0] + in_range(root)
+
+    unique = {}
+    for r in routes:
+        unique[r.get('DestinationCidrBlock') or r.get('PrefixListId')] = r
+    return [_route(r) for r in unique.values()]
+
+
+def collect_tgw_route_table(ec2, rt):
+    """Routes, associations and propagations of one TGW route table"""
+    rt_id = rt['TransitGatewayRouteTableId']
+    stats = {}
+    routes = search_tgw_routes(ec2, rt_id, stats)
+    associations = _paginate(ec2, 'get_transit_gateway_route_table_associations', 'Associations',
+                             TransitGatewayRouteTableId=rt_id)
+    propagations = _paginate(ec2, 'get_transit_gateway_route_table_propagations',
+                             'TransitGatewayRouteTablePropagations', TransitGatewayRouteTableId=rt_id)
+    return {
+        "route_table_id": rt_id,
+        "tgw_id": rt['TransitGatewayId'],
+        "state": rt.get('State'),
+        "default_association": rt.get('DefaultAssociationRouteTable', False),
+        "default_propagation": rt.get('DefaultPropagationRouteTable', False),
+        "associations": [a['TransitGatewayAttachmentId'] for a in associations
+                         if a.get('State', 'associated') == 'associated'],
+        "propagations": [{
+            "attachment_id": p['TransitGatewayAttachmentId'],
+            "resource_type": p.get('ResourceType'),
+            "resource_id": p.get('ResourceId'),
+            "state": p.get('State')
+        } for p in propagations],
+        "routes": routes,
+        "route_searches": stats.get("searches", 0),
+        "range_splits": stats.get("splits", 0),
+        "complete": not stats.get("truncated")
+    }
+
+
+def collect_tgw_route_tables(ec2, tgw_ids=None, workers=DEFAULT_ROUTE_WORKERS):
+    """Every route table of every TGW (or of tgw_ids), fetched concurrently"""
+    tables = [rt for rt in _paginate(ec2, 'describe_transit_gateway_route_tables', 'TransitGatewayRouteTables')
+              if (tgw_ids is None or rt['TransitGatewayId'] in tgw_ids) and rt.get('State') != 'deleted']
+    if not tables:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(tables))) as pool:
+        return list(pool.map(lambda rt: collect_tgw_route_table(ec2, rt), tables))
+
+
+def collect_topology(region, profile=None):
+    """VPCs, subnets, VPC route tables, TGW attachments/route tables and peerings of one region"""
+    ec2 = get_client('ec2', region, profile)
+    vpcs = _paginate(ec2, 'describe_vpcs', 'Vpcs')
+    subnets = _paginate(ec2, 'describe_subnets', 'Subnets')
+    route_tables = _paginate(ec2, 'describe_route_tables', 'RouteTables')
+    attachments = _paginate(ec2, 'describe_transit_gateway_attachments', 'TransitGatewayAttachments')
+    tgws = _paginate(ec2, 'describe_transit_gateways', 'TransitGateways')
+    tgw_peerings = _paginate(ec2, 'describe_transit_gateway_peering_attachments', 'TransitGatewayPeeringAttachments')
+    vpc_peerings = _paginate(ec2, 'describe_vpc_peering_connections', 'VpcPeeringConnections',
+                             Filters=[{'Name': 'status-code', 'Values': ['active', 'pending-acceptance']}])
+
+    peer_of = {}
+    for p in tgw_peerings:
+        requester, accepter = p.get('RequesterTgwInfo', {}), p.get('AccepterTgwInfo', {})
+        for local, remote in ((requester, accepter), (accepter, requester)):
+            if local.get('Region') == region:
+                peer_of[p['TransitGatewayAttachmentId']] = {"tgw_id": remote.get('TransitGatewayId'),
+                                                             "region": remote.get('Region')}
+
+    return {
+        "region": region,
+        "vpcs": [{
+            "vpc_id": v['VpcId'],
+            "cidrs": sorted({v['CidrBlock']} | {a['CidrBlock'] for a in v.get('CidrBlockAssociationSet', [])
+                                                if a.get('CidrBlockState', {}).get('State', 'associated') == 'associated'})
+        } for v in vpcs],
+        "subnets": [{"subnet_id": s['SubnetId'], "vpc_id": s['VpcId'], "cidr": s['CidrBlock']} for s in subnets],
+        "route_tables": [{
+            "route_table_id": rt['RouteTableId'],
+            "vpc_id": rt['VpcId'],
+            "main": any(a.get('Main') for a in rt.get('Associations', [])),
+            "subnet_ids": [a['SubnetId'] for a in rt.get('Associations', []) if a.get('SubnetId')],
+            # Prefix-list destinations are not expanded
+            "routes": [dict(zip(("target_type", "target"), vpc_route_target(r)),
+                            destination=r.get('DestinationCidrBlock') or r.get('DestinationIpv6CidrBlock'),
+                            state=r.get('State', 'active'))
+                       for r in rt.get('Routes', []) if r.get('DestinationCidrBlock') or r.get('DestinationIpv6CidrBlock')]
+        } for rt in route_tables],
+        "transit_gateways": [t['TransitGatewayId'] for t in tgws],
+        "tgw_attachments": [{
+            "attachment_id": a['TransitGatewayAttachmentId'],
+            "tgw_id": a['TransitGatewayId'],
+            "resource_type": a.get('ResourceType'),
+            "resource_id": a.get('ResourceId'),
+            "state": a.get('State'),
+            "association_route_table_id": (a.get('Association') or {}).get('TransitGatewayRouteTableId'),
+            "peer": peer_of.get(a['TransitGatewayAttachmentId'])
+        } for a in attachments],
+        "tgw_route_tables": collect_tgw_route_tables(ec2, {t['TransitGatewayId'] for t in tgws}),
+        "vpc_peering_connections": [{
+            "id": p['VpcPeeringConnectionId'],
+            "status": p.get('Status', {}).get('Code'),
+            "requester": {"vpc_id": p['RequesterVpcInfo'].get('VpcId'), "region": p['RequesterVpcInfo'].get('Region')},
+            "accepter": {"vpc_id": p['AccepterVpcInfo'].get('VpcId'), "region": p['AccepterVpcInfo'].get('Region')}
+        } for p in vpc_peerings]
+    }
+
+
+# ----------------------------------------------------------------------
+# Model
+# ----------------------------------------------------------------------
+
+class RoutingModel:
+    """LPM routing across regions; topology = {region: collect_topology(region)}"""
+
+    def __init__(self, topology):
+        self.subnet_tries = {}
+        self.vpc_tries = {}
+        self.vpc_cidrs = {}
+        self.subnet_route_table = {}
+        self.main_route_table = {}
+        self.vpc_rt_tries = {}
+        self.tgw_rt_tries = {}
+        self.attachments = {}
+        self.vpc_attachment = {}
+        self.vpc_peering = {}
+        self.route_count = 0
+
+        for region, topo in topology.items():
+            subnets, vpcs = PrefixTrie(), PrefixTrie()
+            for vpc in topo.get("vpcs", []):
+                self.vpc_cidrs[vpc["vpc_id"]] = (region, vpc["cidrs"])
+                for cidr in vpc["cidrs"]:
+                    vpcs.insert(cidr, vpc["vpc_id"])
+            for subnet in topo.get("subnets", []):
+                subnets.insert(subnet["cidr"], subnet)
+            self.subnet_tries[region], self.vpc_tries[region] = subnets, vpcs
+
+            for rt in topo.get("route_tables", []):
+                trie = PrefixTrie()
+                # Blackhole routes stay in: they still win the longest-prefix match
+                for route in rt["routes"]:
+                    trie.insert(route["destination"], route)
+                    self.route_count += 1
+                self.vpc_rt_tries[rt["route_table_id"]] = trie
+                if rt.get("main"):
+                    self.main_route_table[rt["vpc_id"]] = rt["route_table_id"]
+                for subnet_id in rt.get("subnet_ids", []):
+                    self.subnet_route_table[subnet_id] = rt["route_table_id"]
+
+            for att in topo.get("tgw_attachments", []):
+                att = dict(att, region=region)
+                self.attachments[(att["tgw_id"], att["attachment_id"])] = att
+                if att.get("resource_type") == "vpc" and att.get("state", "available") == "available":
+                    self.vpc_attachment[(att["resource_id"], att["tgw_id"])] = att
+            for rt in topo.get("tgw_route_tables", []):
+                trie = PrefixTrie()
+                for route in rt["routes"]:
+                    # Prefix-list routes are not expanded
+                    if route.get("destination"):
+                        trie.insert(route["destination"], route)
+                        self.route_count += 1
+                self.tgw_rt_tries[rt["route_table_id"]] = trie
+                # Associations listed on the route table fill in attachments without one
+                for att_id in rt.get("associations", []):
+                    att = self.attachments.get((rt["tgw_id"], att_id))
+                    if att is not None and not att.get("association_route_table_id"):
+                        att["association_route_table_id"] = rt["route_table_id"]
+
+            # Pending peerings are listed as evidence but carry no traffic
+            for pcx in topo.get("vpc_peering_connections", []):
+                if pcx.get("status", "active") == "active":
+                    self.vpc_peering[pcx["id"]] = pcx
+
+    def _peer_attachment(self, att):
+        """The same peering attachment as seen from the peer TGW"""
+        peer = att.get("peer") or {}
+        peer_tgw = peer.get("tgw_id") or att.get("resource_id")
+        return self.attachments.get((peer_tgw, att["attachment_id"]))
+
+    def reach(self, src_region, src, dst):
+        """
+        Follow `dst` from the subnet of `src` in `src_region`. Returns reachable,
+        hops, attachments crossed, whether a TGW / VPC peering was used, the
+        destination VPC and the reason it stopped.
+        """
+        result = {"src_region": src_region, "src": src, "dst": dst, "reachable": False, "hops": [],
+                  "attachments": [], "via_tgw": False, "via_vpc_peering": False}
+
+        def stop(reason, reachable=False, vpc_id=None):
+            result.update(reachable=reachable, reason=reason, dst_vpc=vpc_id)
+            return result
+
+        found = self.subnet_tries.get(src_region, PrefixTrie()).lookup(src)
+        if found is None:
+            return stop(f"source {src} is not inside a subnet in {src_region}")
+        subnet = found[1]
+        vpc_id, region = subnet["vpc_id"], src_region
+        rt_id = self.subnet_route_table.get(subnet["subnet_id"]) or self.main_route_table.get(vpc_id)
+        if rt_id is None:
+            return stop(f"no route table for {subnet['subnet_id']}")
+
+        match = self.vpc_rt_tries[rt_id].lookup(dst)
+        if match is None:
+            return stop(f"no route to {dst} in {rt_id}")
+        prefix, route = match
+        result["hops"].append({"hop": "vpc_route_table", "region": region, "id": rt_id,
+                               "route": prefix, "target": route["target"]})
+        if route.get("state") == "blackhole":
+            return stop(f"blackhole route {prefix} in {rt_id}")
+        kind = route["target_type"]
+
+        if kind == "local":
+            return stop("delivered inside the source VPC", True, vpc_id)
+        if kind == "vpc_peering":
+            result["via_vpc_peering"] = True
+            pcx = self.vpc_peering.get(route["target"])
+            if pcx is None:
+                return stop(f"VPC peering {route['target']} is not active")
+            peer = pcx["accepter"] if pcx["requester"]["vpc_id"] == vpc_id else pcx["requester"]
+            peer_region = peer.get("region") or region
+            owner = self.vpc_tries.get(peer_region, PrefixTrie()).lookup(dst)
+            if owner and owner[1] == peer["vpc_id"]:
+                return stop(f"delivered over VPC peering {pcx['id']}", True, peer["vpc_id"])
+            return stop(f"VPC peering {pcx['id']} does not lead to {dst} (peering is not transitive)")
+        if kind != "transit_gateway":
+            return stop(f"leaves the private network via {kind} {route['target']}")
+
+        tgw_id = route["target"]
+        att = self.vpc_attachment.get((vpc_id, tgw_id))
+        if att is None:
+            return stop(f"{vpc_id} has no available attachment to {tgw_id}")
+        result["via_tgw"] = True
+        for _ in range(MAX_HOPS):
+            result["attachments"].append(att["attachment_id"])
+            tgw_rt = att.get("association_route_table_id")
+            if not tgw_rt or tgw_rt not in self.tgw_rt_tries:
+                return stop(f"attachment {att['attachment_id']} has no associated route table")
+            match = self.tgw_rt_tries[tgw_rt].lookup(dst)
+            if match is None:
+                return stop(f"no route to {dst} in {tgw_rt}")
+            prefix, troute = match
+            result["hops"].append({"hop": "tgw_route_table", "region": region, "id": tgw_rt, "route": prefix,
+                                   "target": troute.get("attachment_id"), "type": troute.get("type")})
+            if troute.get("state") == "blackhole" or not troute.get("attachment_id"):
+                return stop(f"blackhole route {prefix} in {tgw_rt}")
+            out = self.attachments.get((tgw_id, troute["attachment_id"]))
+            if out is None:
+                return stop(f"route {prefix} in {tgw_rt} points at unknown attachment {troute['attachment_id']}")
+            if out["resource_type"] == "vpc":
+                result["attachments"].append(out["attachment_id"])
+                owner = self.vpc_tries.get(region, PrefixTrie()).lookup(dst)
+                if owner and owner[1] == out["resource_id"]:
+                    return stop(f"delivered to {out['resource_id']} in {region}", True, out["resource_id"])
+                return stop(f"{tgw_rt} sends {dst} to {out['resource_id']}, which does not contain it")
+            if out["resource_type"] == "peering":
+                peer_att = self._peer_attachment(out)
+                if peer_att is None:
+                    return stop(f"peer side of {out['attachment_id']} is not in the topology")
+                result["hops"].append({"hop": "tgw_peering", "id": out["attachment_id"],
+                                       "from_region": region, "to_region": peer_att["region"]})
+                att, tgw_id, region = peer_att, peer_att["tgw_id"], peer_att["region"]
+                continue
+            return stop(f"leaves via {out['resource_type']} attachment {out['attachment_id']}")
+        return stop("routing loop (hop limit reached)")
+
+    def reach_all(self, pairs):
+        """reach() for every (src_region, src, dst) in pairs"""
+        return [self.reach(*pair) for pair in pairs]
+
+
+def subnet_pairs(topology, src_region, dst_region):
+    """Every (src_region, source subnet CIDR, destination subnet CIDR) between two regions"""
+    return [(src_region, s["cidr"], d["cidr"])
+            for s in topology.get(src_region, {}).get("subnets", [])
+            for d in topology.get(dst_region, {}).get("subnets", [])]
+
+
+def corridor_report(model, topology, src_region, dst_region, max_listed=200):
+    """Exhaustive subnet-pair reachability between two regions, summarized for a proof"""
+    results = model.reach_all(subnet_pairs(topology, src_region, dst_region))
+    via_tgw = [r for r in results if r["reachable"] and r["via_tgw"] and not r["via_vpc_peering"]]
+    failures = [r for r in results if not (r["reachable"] and r["via_tgw"] and not r["via_vpc_peering"])]
+    return {
+        "source_region": src_region,
+        "destination_region": dst_region,
+        "pairs_checked": len(results),
+        "reachable_via_tgw": len(via_tgw),
+        "reachable_via_vpc_peering": sum(1 for r in results if r["reachable"] and r["via_vpc_peering"]),
+        "unreachable": sum(1 for r in results if not r["reachable"]),
+        "attachments_used": sorted({a for r in via_tgw for a in r["attachments"]}),
+        "all_pairs_via_tgw": bool(results) and not failures,
+        "failures": failures[:max_listed],
+        "paths": results[:max_listed] if len(results) <= max_listed else [],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Longest-prefix-match reachability across VPC and TGW route tables")
+    parser.add_argument("--regions", nargs="+", default=["ap-northeast-1", "sa-east-1"])
+    parser.add_argument("--topology", help="Load the topology from this JSON file instead of AWS")
+    parser.add_argument("--save-topology", help="Write the collected topology to this JSON file")
+    parser.add_argument("--src-region", default="sa-east-1")
+    parser.add_argument("--src", help="Source address or CIDR")
+    parser.add_argument("--dst", help="Destination address or CIDR")
+    args = parser.parse_args()
+
+    if args.topology:
+        with open(args.topology) as f:
+            topology = json.load(f)
+    else:
+        topology = {region: collect_topology(region) for region in args.regions}
+    if args.save_topology:
+        with open(args.save_topology, "w") as f:
+            json.dump(topology, f, indent=2, default=str)
+        print(f"✅ Topology saved to: {args.save_topology}")
+
+    model = RoutingModel(topology)
+    if args.src and args.dst:
+        print(json.dumps(model.reach(args.src_region, args.src, args.dst), indent=2))
+    elif not args.save_topology:
+        others = [r for r in topology if r != args.src_region]
+        for dst_region in others:
+            report = corridor_report(model, topology, args.src_region, dst_region)
+            print(json.dumps({k: v for k, v in report.items() if k != "paths"}, indent=2))
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
-import boto3, json, os
+import json, os
+
+from malgus_aws import get_client
 
 # Reason why Darth Malgus would be pleased with this script.
 # Drift is rebellion—Malgus crushes it before it becomes a civil war.
@@ -11,8 +13,8 @@ import boto3, json, os
 # "I built a drift detector that validates secret/config consistency and prevents silent
 #  mismatches from becoming production incidents."
 
-ssm = boto3.client("ssm")
-secrets = boto3.client("secretsmanager")
+ssm = get_client("ssm")
+secrets = get_client("secretsmanager")
 
 SSM_PATH = os.getenv("SSM_PATH", "/lab/db/")
 SECRET_ID = os.getenv("SECRET_ID", "chewbacca/rds/mysql")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+malgus_sketches.py
+
+Fixed-memory streaming summaries used by the CloudFront log tools. Every sketch can be
+merged (so per-file / per-worker partials combine into one answer) and round-trips
+through a JSON-safe dict (so partials can be cached in a manifest).
+
+# Reason why Darth Malgus would be pleased with this script:
+# A day of logs does not fit in memory. The Empire keeps a fixed-size ledger instead.
+#
+# Reason why this script is relevant to your career:
+# Percentiles over streams are how real observability pipelines report latency without storing every sample.
+#
+# How you would talk about this script at an interview:
+# “I used a mergeable log-bucketed quantile sketch so p95/p99 could be computed per minute
+#  across sharded workers with bounded memory and a known relative error, plus Space-Saving
+#  and HyperLogLog for top talkers and distinct clients.”
+"""
+
+import base64
+import hashlib
+import heapq
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class QuantileSketch:
+    """
+    Relative-error quantile sketch (DDSketch-style). Positive values are counted in
+    logarithmic bins of width `gamma = (1 + accuracy) / (1 - accuracy)`, so any
+    quantile is returned within `accuracy` relative error. Memory is capped at
+    `max_bins`; past the cap the lowest bins are collapsed, which only affects
+    the smallest values (the tail percentiles stay accurate).
+    """
+
+    # Values at or below this are counted as zero (e.g. time-taken of 0.000).
+    MIN_VALUE = 1e-6
+
+    def __init__(self, accuracy: float = 0.01, max_bins: int = 512):
+        self.accuracy = accuracy
+        self.max_bins = max_bins
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, int] = {}
+        self.zeros = 0
+        self.count = 0
+
+    def index(self, value: float) -> Optional[int]:
+        """Bin index for value (None = zero bin). Compute once, add_index() to many sketches."""
+        if value <= self.MIN_VALUE:
+            return None
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def add(self, value: float, n: int = 1) -> None:
+        self.add_index(self.index(value), n)
+
+    def add_index(self, i: Optional[int], n: int = 1) -> None:
+        self.count += n
+        if i is None:
+            self.zeros += n
+            return
+        self.bins[i] = self.bins.get(i, 0) + n
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self) -> None:
+        """Fold the lowest bins into one so at most max_bins remain."""
+        keys = sorted(self.bins)
+        excess = len(keys) - self.max_bins
+        target = keys[excess]
+        folded = sum(self.bins.pop(k) for k in keys[:excess])
+        self.bins[target] += folded
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        if other.accuracy != self.accuracy:
+            raise ValueError("cannot merge QuantileSketch with different accuracy")
+        for i, n in other.bins.items():
+            self.bins[i] = self.bins.get(i, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+        return self
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Value at quantile q (0..1), or None if the sketch is empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for i in sorted(self.bins):
+            seen += self.bins[i]
+            if rank < seen:
+                # Midpoint (in relative terms) of bin (gamma^(i-1), gamma^i]
+                return 2 * self._gamma ** i / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.bins) / (self._gamma + 1)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "accuracy": self.accuracy,
+            "max_bins": self.max_bins,
+            "zeros": self.zeros,
+            "count": self.count,
+            "bins": {str(i): n for i, n in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sketch = cls(data["accuracy"], data["max_bins"])
+        sketch.zeros = data["zeros"]
+        sketch.count = data["count"]
+        sketch.bins = {int(i): n for i, n in data["bins"].items()}
+        return sketch
+
+
+class SpaceSaving:
+    """
+    Top-k heavy hitters (Space-Saving, Metwally et al.) in exactly k counters. An item
+    not yet tracked replaces the current minimum and inherits its count as error, so
+    every reported count is an upper bound and count - error a lower bound. Any item
+    seen more than N/k times is guaranteed to be tracked.
+    """
+
+    def __init__(self, k: int = 100):
+        self.k = k
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # (count, item) per tracked item; entries go stale when an item is incremented
+        # and are refreshed lazily when they reach the top of the heap.
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, item: str, n: int = 1) -> Optional[str]:
+        """Count `item`; returns the item evicted to make room for it, if any."""
+        counts = self.counts
+        if item in counts:
+            counts[item] += n
+            return None
+        if len(counts) < self.k:
+            counts[item] = n
+            self.errors[item] = 0
+            heapq.heappush(self._heap, (n, item))
+            return None
+        heap = self._heap
+        while True:
+            c, victim = heap[0]
+            if counts[victim] == c:
+                break
+            heapq.heapreplace(heap, (counts[victim], victim))
+        del counts[victim]
+        del self.errors[victim]
+        counts[item] = c + n
+        self.errors[item] = c
+        heapq.heapreplace(heap, (c + n, item))
+        return victim
+
+    def min_count(self) -> int:
+        """Count an untracked item could at most have had (0 until all k counters are used)."""
+        return min(self.counts.values()) if len(self.counts) >= self.k else 0
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        """
+        Mergeable-summary union: an item missing from one side is charged that side's
+        minimum (count and error), then the k largest are kept.
+        """
+        m1, m2 = self.min_count(), other.min_count()
+        merged = {}
+        for item in set(self.counts) | set(other.counts):
+            c1, e1 = (self.counts[item], self.errors[item]) if item in self.counts else (m1, m1)
+            c2, e2 = (other.counts[item], other.errors[item]) if item in other.counts else (m2, m2)
+            merged[item] = (c1 + c2, e1 + e2)
+        keep = sorted(merged.items(), key=lambda kv: (-kv[1][0], kv[0]))[: self.k]
+        self.counts = {item: c for item, (c, _) in keep}
+        self.errors = {item: e for item, (_, e) in keep}
+        self._heap = [(c, item) for item, c in self.counts.items()]
+        heapq.heapify(self._heap)
+        return self
+
+    def top(self, n: int = 0) -> List[Tuple[str, int, int]]:
+        """(item, count, error) by descending count; n=0 returns all k."""
+        items = sorted(self.counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [(item, c, self.errors[item]) for item, c in (items[:n] if n > 0 else items)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"k": self.k, "items": [[item, c, self.errors[item]] for item, c in self.counts.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SpaceSaving":
+        sketch = cls(data["k"])
+        for item, c, e in data["items"]:
+            sketch.counts[item] = c
+            sketch.errors[item] = e
+        sketch._heap = [(c, item) for item, c in sketch.counts.items()]
+        heapq.heapify(sketch._heap)
+        return sketch
+
+
+class HyperLogLog:
+    """
+    Distinct-count estimate in 2^precision one-byte registers (precision 11 = 2 KiB,
+    ~2.3% standard error). Values are hashed with a fixed 64-bit hash (not Python's
+    per-process hash()), so sketches built in different workers merge by register max.
+    """
+
+    def __init__(self, precision: int = 11):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    @staticmethod
+    def hash(value: str) -> int:
+        """64-bit hash of value; compute once per distinct value and add_hash() it to many sketches."""
+        return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def add(self, value: str) -> None:
+        self.add_hash(self.hash(value))
+
+    def add_hash(self, h: int) -> None:
+        rest_bits = 64 - self.precision
+        rank = rest_bits - (h & ((1 << rest_bits) - 1)).bit_length() + 1
+        i = h >> rest_bits
+        if rank > self.registers[i]:
+            self.registers[i] = rank
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError("cannot merge HyperLogLog with different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Small-range correction: linear counting over the empty registers.
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Sparse [index, rank] pairs while mostly empty, base64 registers otherwise."""
+        used = [[i, r] for i, r in enumerate(self.registers) if r]
+        if len(used) * 4 < len(self.registers):
+            return {"precision": self.precision, "sparse": used}
+        return {"precision": self.precision, "registers": base64.b64encode(bytes(self.registers)).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "HyperLogLog":
+        sketch = cls(data["precision"])
+        if "registers" in data:
+            sketch.registers = bytearray(base64.b64decode(data["registers"]))
+        else:
+            for i, r in data["sparse"]:
+                sketch.registers[i] = r
+        return sketch
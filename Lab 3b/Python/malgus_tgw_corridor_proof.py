@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
-import boto3, json
+import json
+
+from malgus_aws import get_client
 
 # Reason why Darth Malgus would be pleased with this script.
 # Corridors must be explicit. Malgus hates "it should route" — he wants "it DOES route."
@@ -9,15 +11,16 @@ import boto3, json
 # "I built a TGW evidence collector to prove cross-region paths and attachments during audits and outages."
 
 def tgw_snapshot(region):
-    ec2 = boto3.client("ec2", region_name=region)
+    ec2 = get_client("ec2", region)
     tgws = ec2.describe_transit_gateways().get("TransitGateways", [])
     atts = ec2.describe_transit_gateway_attachments().get("TransitGatewayAttachments", [])
     return {"region": region, "transit_gateways": tgws, "attachments": atts}
 
+def build_tgw_snapshot():
+    return {"tokyo": tgw_snapshot("ap-northeast-1"), "saopaulo": tgw_snapshot("sa-east-1")}
+
 def main():
-    tokyo = tgw_snapshot("ap-northeast-1")
-    sp    = tgw_snapshot("sa-east-1")
-    print(json.dumps({"tokyo": tokyo, "saopaulo": sp}, indent=2, default=str))
+    print(json.dumps(build_tgw_snapshot(), indent=2, default=str))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
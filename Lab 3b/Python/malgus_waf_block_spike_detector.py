@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
-import boto3
 from datetime import datetime, timezone, timedelta
 
+from malgus_aws import get_client
+
 # Reason why Darth Malgus would be pleased with this script.
 # A Sith Lord doesn't wait for the alarm—he detects the uprising before it forms.
 
@@ -12,7 +13,7 @@ from datetime import datetime, timezone, timedelta
 # "I implemented a WAF spike detector that compares short-term vs baseline BLOCK rates to
 #  flag likely abuse or misconfiguration and trigger investigation."
 
-cw = boto3.client("cloudwatch")
+cw = get_client("cloudwatch")
 
 def main():
     # Students fill these in (CloudFront WAF metric names can vary)
@@ -1,8 +1,8 @@
 def cmd_collect_evidence(args):
-    cw = boto3.client("cloudwatch", region_name=args.region) if args.region else boto3.client("cloudwatch")
-    logs = boto3.client("logs", region_name=args.region) if args.region else boto3.client("logs")
-    ssm = boto3.client("ssm", region_name=args.region) if args.region else boto3.client("ssm")
-    secrets = boto3.client("secretsmanager", region_name=args.region) if args.region else boto3.client("secretsmanager")
+    cw = get_client("cloudwatch", args.region)
+    logs = get_client("logs", args.region)
+    ssm = get_client("ssm", args.region)
+    secrets = get_client("secretsmanager", args.region)
 
     incident_id = args.incident_id or f"IR-{utc_now().strftime('%Y%m%d-%H%M%S')}"
     end = utc_now()